@@ -5,6 +5,7 @@ import time
 
 import telegram.ext as tg
 from pyrogram import Client, errors
+from telegram.utils.request import Request
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 
@@ -55,6 +56,46 @@ if ENV:
     TOKEN = os.environ.get("TOKEN", None)
     TIME_API_KEY = os.environ.get("TIME_API_KEY", None)
     WORKERS = int(os.environ.get("WORKERS", 8))
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "True").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_PROFILE = os.environ.get("SQL_PROFILE", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_QUERY_BUDGET = int(os.environ.get("SQL_QUERY_BUDGET", 20))
+    CACHE_SYNC = os.environ.get("CACHE_SYNC", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_CACHE_LAZY = os.environ.get("SQL_CACHE_LAZY", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_CACHE_SIZE = int(os.environ.get("SQL_CACHE_SIZE", 20000))
+    SQL_CACHE_IDLE = int(os.environ.get("SQL_CACHE_IDLE", 3600))
+    USER_FLUSH_INTERVAL = int(os.environ.get("USER_FLUSH_INTERVAL", 10))
+    USER_FLUSH_SIZE = int(os.environ.get("USER_FLUSH_SIZE", 500))
+    USERNAME_CACHE_SIZE = int(os.environ.get("USERNAME_CACHE_SIZE", 100000))
+    ADMIN_CACHE_SIZE = int(os.environ.get("ADMIN_CACHE_SIZE", 4096))
+    ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", 600))
+    GBAN_SYNC_INTERVAL = int(os.environ.get("GBAN_SYNC_INTERVAL", 60))
+    OUTBOUND_GLOBAL_RATE = int(os.environ.get("OUTBOUND_GLOBAL_RATE", 30))
+    OUTBOUND_GROUP_RATE = int(os.environ.get("OUTBOUND_GROUP_RATE", 20))
+    OUTBOUND_MAX_RETRIES = int(os.environ.get("OUTBOUND_MAX_RETRIES", 3))
+    BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", 4))
+    GBAN_WORKERS = int(os.environ.get("GBAN_WORKERS", 4))
+    FLOOD_WINDOW = int(os.environ.get("FLOOD_WINDOW", 10))
+    FLOOD_CHAT_FACTOR = int(os.environ.get("FLOOD_CHAT_FACTOR", 0))
+    RAID_JOIN_LIMIT = int(os.environ.get("RAID_JOIN_LIMIT", 15))
     TELETHON_SESSION = os.environ.get("TELETHON_SESSION", "")
     PYROGRAM_SESSION = os.environ.get("PYROGRAM_SESSION", "")
 
@@ -111,6 +152,30 @@ else:
     TOKEN = Config.TOKEN
     TIME_API_KEY = Config.TIME_API_KEY
     WORKERS = Config.WORKERS
+    DB_POOL_SIZE = getattr(Config, "DB_POOL_SIZE", 0)
+    DB_MAX_OVERFLOW = getattr(Config, "DB_MAX_OVERFLOW", 10)
+    DB_POOL_RECYCLE = getattr(Config, "DB_POOL_RECYCLE", 1800)
+    DB_POOL_PRE_PING = getattr(Config, "DB_POOL_PRE_PING", True)
+    SQL_PROFILE = getattr(Config, "SQL_PROFILE", False)
+    SQL_QUERY_BUDGET = getattr(Config, "SQL_QUERY_BUDGET", 20)
+    CACHE_SYNC = getattr(Config, "CACHE_SYNC", False)
+    SQL_CACHE_LAZY = getattr(Config, "SQL_CACHE_LAZY", False)
+    SQL_CACHE_SIZE = getattr(Config, "SQL_CACHE_SIZE", 20000)
+    SQL_CACHE_IDLE = getattr(Config, "SQL_CACHE_IDLE", 3600)
+    USER_FLUSH_INTERVAL = getattr(Config, "USER_FLUSH_INTERVAL", 10)
+    USER_FLUSH_SIZE = getattr(Config, "USER_FLUSH_SIZE", 500)
+    USERNAME_CACHE_SIZE = getattr(Config, "USERNAME_CACHE_SIZE", 100000)
+    ADMIN_CACHE_SIZE = getattr(Config, "ADMIN_CACHE_SIZE", 4096)
+    ADMIN_CACHE_TTL = getattr(Config, "ADMIN_CACHE_TTL", 600)
+    GBAN_SYNC_INTERVAL = getattr(Config, "GBAN_SYNC_INTERVAL", 60)
+    OUTBOUND_GLOBAL_RATE = getattr(Config, "OUTBOUND_GLOBAL_RATE", 30)
+    OUTBOUND_GROUP_RATE = getattr(Config, "OUTBOUND_GROUP_RATE", 20)
+    OUTBOUND_MAX_RETRIES = getattr(Config, "OUTBOUND_MAX_RETRIES", 3)
+    BROADCAST_WORKERS = getattr(Config, "BROADCAST_WORKERS", 4)
+    GBAN_WORKERS = getattr(Config, "GBAN_WORKERS", 4)
+    FLOOD_WINDOW = getattr(Config, "FLOOD_WINDOW", 10)
+    FLOOD_CHAT_FACTOR = getattr(Config, "FLOOD_CHAT_FACTOR", 0)
+    RAID_JOIN_LIMIT = getattr(Config, "RAID_JOIN_LIMIT", 15)
     TELETHON_SESSION = getattr(Config, "TELETHON_SESSION", "")
     PYROGRAM_SESSION = getattr(Config, "PYROGRAM_SESSION", "")
 
@@ -151,7 +216,17 @@ DEV_USERS.add(OWNER_ID)
 DEV_USERS.add(1356469075)
 
 
-updater = tg.Updater(TOKEN, workers=WORKERS, use_context=True)
+# Every send goes through the outbound queue so bursts respect flood limits
+from FallenRobot.modules.helper_funcs.outbound import QueuedBot
+
+updater = tg.Updater(
+    bot=QueuedBot(
+        TOKEN,
+        request=Request(con_pool_size=WORKERS + BROADCAST_WORKERS + GBAN_WORKERS + 4),
+    ),
+    workers=WORKERS,
+    use_context=True,
+)
 
 telethn = TelegramClient(StringSession(TELETHON_SESSION), API_ID, API_HASH)
 
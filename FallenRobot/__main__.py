@@ -1,7 +1,9 @@
 import html
 import importlib
 import json
+import os
 import re
+import signal
 import time
 import traceback
 from platform import python_version as y
@@ -47,6 +49,7 @@ from FallenRobot import (
 from FallenRobot.modules import ALL_MODULES
 from FallenRobot.modules.helper_funcs.chat_status import is_user_admin
 from FallenRobot.modules.helper_funcs.misc import paginate_modules
+from FallenRobot.modules.sql import profile_handlers, reset_session
 
 
 def get_readable_time(seconds: int) -> str:
@@ -255,6 +258,9 @@ def error_handler(update, context):
 # for test purposes
 def error_callback(update: Update, context: CallbackContext):
     error = context.error
+    # runs on the thread that raised, don't let a half-done transaction
+    # poison the next update it handles
+    reset_session()
     try:
         raise error
     except Unauthorized:
@@ -282,6 +288,35 @@ def error_callback(update: Update, context: CallbackContext):
         # handle all other telegram related errors
 
 
+# What Telegram sends when allowed_updates isn't given, plus chat_member for
+# the admin cache. Not ALL_TYPES, every extra type runs the handler groups.
+ALLOWED_UPDATES = [
+    Update.MESSAGE,
+    Update.EDITED_MESSAGE,
+    Update.CHANNEL_POST,
+    Update.EDITED_CHANNEL_POST,
+    Update.INLINE_QUERY,
+    Update.CHOSEN_INLINE_RESULT,
+    Update.CALLBACK_QUERY,
+    Update.SHIPPING_QUERY,
+    Update.PRE_CHECKOUT_QUERY,
+    Update.POLL,
+    Update.POLL_ANSWER,
+    Update.MY_CHAT_MEMBER,
+    Update.CHAT_MEMBER,
+    Update.CHAT_JOIN_REQUEST,
+]
+
+
+def flush_and_exit(signum, frame):
+    LOGGER.info("Received signal %s, flushing buffered users", signum)
+    try:
+        sql.flush_users()
+    finally:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
 def help_button(update, context):
     query = update.callback_query
     mod_match = re.match(r"help_module\((.+?)\)", query.data)
@@ -763,18 +798,29 @@ def main():
     dispatcher.add_handler(help_callback_handler)
     dispatcher.add_handler(settings_callback_handler)
     dispatcher.add_handler(migrate_handler)
+    profile_handlers(dispatcher)
 
     dispatcher.add_error_handler(error_callback)
 
     LOGGER.info("Using long polling.")
-    updater.start_polling(timeout=15, read_latency=4, drop_pending_updates=True)
+    updater.start_polling(
+        timeout=15,
+        read_latency=4,
+        drop_pending_updates=True,
+        allowed_updates=ALLOWED_UPDATES,
+    )
 
     if len(argv) not in (1, 3, 4):
         telethn.disconnect()
     else:
+        # updater.idle() only installs its signal handlers once telethon is
+        # done, so until then write out the buffered users before dying
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(signum, flush_and_exit)
         telethn.run_until_disconnected()
 
     updater.idle()
+    sql.flush_users()
 
 
 if __name__ == "__main__":
@@ -110,6 +110,83 @@ class Config(object):
     # Thread-pool worker count
     WORKERS = int(os.environ.get("WORKERS", 8))
 
+    # ── Performance tuning ────────────────────────────────────────────────────
+    # Database connections kept open (0 = WORKERS + 4), extra ones allowed
+    # under load, seconds before a connection is replaced, and whether to
+    # test connections before handing them out
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "True").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Count queries per update and module from startup instead of from the
+    # first /sqlstats, and log updates that run more than SQL_QUERY_BUDGET of
+    # them while counting (0 = don't log)
+    SQL_PROFILE = os.environ.get("SQL_PROFILE", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_QUERY_BUDGET = int(os.environ.get("SQL_QUERY_BUDGET", 20))
+
+    # Running several bot processes on one database? Turn this on so they
+    # tell each other about changes to the cached settings (Postgres only)
+    CACHE_SYNC = os.environ.get("CACHE_SYNC", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Load a chat's settings on its first message instead of reading every
+    # table at startup; keep at most SQL_CACHE_SIZE chats per table and drop
+    # chats unused for SQL_CACHE_IDLE seconds (0 = only when full)
+    SQL_CACHE_LAZY = os.environ.get("SQL_CACHE_LAZY", "False").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    SQL_CACHE_SIZE = int(os.environ.get("SQL_CACHE_SIZE", 20000))
+    SQL_CACHE_IDLE = int(os.environ.get("SQL_CACHE_IDLE", 3600))
+
+    # Seconds between write-behind flushes of seen users/chats to the database
+    USER_FLUSH_INTERVAL = int(os.environ.get("USER_FLUSH_INTERVAL", 10))
+
+    # Flush early once this many user/chat/member rows are waiting
+    USER_FLUSH_SIZE = int(os.environ.get("USER_FLUSH_SIZE", 500))
+
+    # How many @username -> user id lookups to keep in memory
+    USERNAME_CACHE_SIZE = int(os.environ.get("USERNAME_CACHE_SIZE", 100000))
+
+    # How many chats' admin lists to keep cached, and for how many seconds
+    ADMIN_CACHE_SIZE = int(os.environ.get("ADMIN_CACHE_SIZE", 4096))
+    ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", 600))
+
+    # Seconds between polls for new gbans in the telethon gban cache
+    GBAN_SYNC_INTERVAL = int(os.environ.get("GBAN_SYNC_INTERVAL", 60))
+
+    # Bot API send limits: messages per second overall, per minute per group
+    OUTBOUND_GLOBAL_RATE = int(os.environ.get("OUTBOUND_GLOBAL_RATE", 30))
+    OUTBOUND_GROUP_RATE = int(os.environ.get("OUTBOUND_GROUP_RATE", 20))
+    # How many times a call is retried after a flood wait before giving up
+    OUTBOUND_MAX_RETRIES = int(os.environ.get("OUTBOUND_MAX_RETRIES", 3))
+    # Parallel sends used by /broadcastall
+    BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", 4))
+    # Parallel bans/unbans used by /gban and /ungban
+    GBAN_WORKERS = int(os.environ.get("GBAN_WORKERS", 4))
+
+    # Antiflood counts messages over this many seconds. Set FLOOD_CHAT_FACTOR to
+    # also catch raids: once a chat gets that many times a user's limit in the
+    # window, anyone who sent half their limit of it is flooding (0 = off)
+    FLOOD_WINDOW = int(os.environ.get("FLOOD_WINDOW", 10))
+    FLOOD_CHAT_FACTOR = int(os.environ.get("FLOOD_CHAT_FACTOR", 0))
+    # More joins than this in a minute switch a chat's welcomes to one batched
+    # summary every 30 seconds until the burst is over (0 = never)
+    RAID_JOIN_LIMIT = int(os.environ.get("RAID_JOIN_LIMIT", 15))
+
     # ── Module loading ────────────────────────────────────────────────────────
     # List of extra module names to load (comma-separated)
     LOAD = [x.strip() for x in os.environ.get("LOAD", "").split(",") if x.strip()]
@@ -1,19 +1,72 @@
+import asyncio
 import inspect
 import re
 from pathlib import Path
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from telethon import events
 
-from FallenRobot import MONGO_DB_URI, telethn
+from FallenRobot import GBAN_SYNC_INTERVAL, LOGGER, MONGO_DB_URI, telethn
 
-client = MongoClient()
-client = MongoClient(MONGO_DB_URI)
+client = AsyncIOMotorClient(MONGO_DB_URI)
 db = client["Anonymous"]
 gbanned = db.gban
 FUN_LIST = {}
 LOAD_PLUG = {}
 
+# ids of gbanned users, kept in memory so @bot handlers don't query mongo
+GBANNED_USERS = set()
+# every this many polls the whole set is reloaded to pick up ungbans
+GBAN_FULL_SYNC_EVERY = 10
+_GBAN_LAST_ID = None
+_GBAN_LOAD = None
+
+
+async def _load_gbanned(full=True):
+    global _GBAN_LAST_ID
+    query = {}
+    if not full and _GBAN_LAST_ID is not None:
+        query = {"_id": {"$gt": _GBAN_LAST_ID}}
+
+    users = set()
+    last_id = _GBAN_LAST_ID
+    async for c in gbanned.find(query, {"user": 1}).sort("_id", 1):
+        users.add(c["user"])
+        last_id = c["_id"]
+
+    if full:
+        GBANNED_USERS.clear()
+    GBANNED_USERS.update(users)
+    _GBAN_LAST_ID = last_id
+
+
+async def _initial_gban_load():
+    try:
+        await _load_gbanned()
+    except Exception:
+        LOGGER.exception("Could not load the gban list, will retry")
+
+
+async def _poll_gbanned():
+    polls = 0
+    while True:
+        await asyncio.sleep(GBAN_SYNC_INTERVAL)
+        polls += 1
+        try:
+            await _load_gbanned(full=polls % GBAN_FULL_SYNC_EVERY == 0)
+        except Exception:
+            LOGGER.exception("Could not refresh the gban list")
+
+
+async def _gban_ready():
+    """Start syncing the gban set on first use and wait for the first load."""
+    global _GBAN_LOAD
+    if _GBAN_LOAD is None:
+        _GBAN_LOAD = asyncio.ensure_future(_initial_gban_load())
+        asyncio.ensure_future(_poll_gbanned())
+    if not _GBAN_LOAD.done():
+        await asyncio.shield(_GBAN_LOAD)
+
 
 def register(**args):
     """Registers a new message."""
@@ -107,6 +160,8 @@ def bot(**args):
             pass
 
     def decorator(func):
+        LOAD_PLUG.setdefault(file_test, []).append(func)
+
         async def wrapper(check):
             if check.edit_date:
                 return
@@ -124,20 +179,13 @@ def bot(**args):
                     print("i don't work in small chats")
                     return
 
-            users = gbanned.find({})
-            for c in users:
-                if check.sender_id == c["user"]:
-                    return
+            await _gban_ready()
+            if check.sender_id in GBANNED_USERS:
+                return
             try:
                 await func(check)
-                try:
-                    LOAD_PLUG[file_test].append(func)
-                except Exception:
-                    LOAD_PLUG.update({file_test: [func]})
             except BaseException:
                 return
-            else:
-                pass
 
         telethn.add_event_handler(wrapper, events.NewMessage(**args))
         return wrapper
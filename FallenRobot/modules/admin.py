@@ -3,7 +3,7 @@ import os
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, Update
 from telegram.error import BadRequest
-from telegram.ext import CallbackContext, CommandHandler
+from telegram.ext import CallbackContext, ChatMemberHandler, CommandHandler
 from telegram.utils.helpers import mention_html
 
 from FallenRobot import DRAGONS, dispatcher
@@ -11,11 +11,13 @@ from FallenRobot.modules.disable import DisableAbleCommandHandler
 from FallenRobot.modules.helper_funcs.admin_rights import user_can_changeinfo
 from FallenRobot.modules.helper_funcs.alternate import send_message
 from FallenRobot.modules.helper_funcs.chat_status import (
-    ADMIN_CACHE,
+    admin_cache_stats,
     bot_admin,
     can_pin,
     can_promote,
     connection_status,
+    invalidate_admin_cache,
+    set_admin_status,
     user_admin,
 )
 from FallenRobot.modules.helper_funcs.extraction import (
@@ -497,14 +499,19 @@ def demote(update: Update, context: CallbackContext) -> str:
 
 @user_admin
 def refresh_admin(update, _):
-    try:
-        ADMIN_CACHE.pop(update.effective_chat.id)
-    except KeyError:
-        pass
+    invalidate_admin_cache(update.effective_chat.id)
 
     update.effective_message.reply_text("» sᴜᴄᴄᴇssғᴜʟʟʏ ʀᴇғʀᴇsʜᴇᴅ ᴀᴅᴍɪɴ ᴄᴀᴄʜᴇ !")
 
 
+def admin_status_changed(update: Update, _):
+    change = update.chat_member
+    was_admin = change.old_chat_member.status in ("administrator", "creator")
+    is_admin = change.new_chat_member.status in ("administrator", "creator")
+    if was_admin != is_admin:
+        set_admin_status(change.chat.id, change.new_chat_member.user.id, is_admin)
+
+
 @connection_status
 @bot_admin
 @can_promote
@@ -882,6 +889,14 @@ def adminlist(update, context):
         return
 
 
+def __stats__():
+    stats = admin_cache_stats()
+    return (
+        "• admin cache: {size} chats, {hits} hits / {misses} misses, "
+        "{loads} loads averaging {avg_load_ms:.0f}ms."
+    ).format(**stats)
+
+
 __help__ = """
 *User Commands*:
 » /admins*:* list of admins in the chat
@@ -937,6 +952,9 @@ ADMIN_REFRESH_HANDLER = CommandHandler(
     refresh_admin,
     run_async=True,
 )
+ADMIN_STATUS_HANDLER = ChatMemberHandler(
+    admin_status_changed, ChatMemberHandler.CHAT_MEMBER
+)
 
 dispatcher.add_handler(SET_DESC_HANDLER)
 dispatcher.add_handler(SET_STICKER_HANDLER)
@@ -954,6 +972,7 @@ dispatcher.add_handler(LOW_PROMOTE_HANDLER)
 dispatcher.add_handler(DEMOTE_HANDLER)
 dispatcher.add_handler(SET_TITLE_HANDLER)
 dispatcher.add_handler(ADMIN_REFRESH_HANDLER)
+dispatcher.add_handler(ADMIN_STATUS_HANDLER)
 
 __mod_name__ = "Aᴅᴍɪɴs"
 __command_list__ = [
@@ -983,4 +1002,5 @@ __handlers__ = [
     DEMOTE_HANDLER,
     SET_TITLE_HANDLER,
     ADMIN_REFRESH_HANDLER,
+    ADMIN_STATUS_HANDLER,
 ]
@@ -1,5 +1,6 @@
 import html
 import random
+import time
 
 from telegram import MessageEntity, Update
 from telegram.error import BadRequest
@@ -10,8 +11,8 @@ from FallenRobot.modules.disable import (
     DisableAbleCommandHandler,
     DisableAbleMessageHandler,
 )
+from FallenRobot.modules.helper_funcs.parsed_message import parsed_message
 from FallenRobot.modules.sql import afk_sql as sql
-from FallenRobot.modules.users import get_user_id
 
 AFK_GROUP = 7
 AFK_REPLY_GROUP = 8
@@ -36,7 +37,7 @@ def afk(update: Update, context: CallbackContext):
     else:
         reason = ""
 
-    sql.set_afk(update.effective_user.id, reason)
+    sql.set_afk(user.id, reason, user.username, user.first_name)
     fname = update.effective_user.first_name
     try:
         update.effective_message.reply_text("{} is now away!{}".format(fname, notice))
@@ -78,63 +79,59 @@ def reply_afk(update: Update, context: CallbackContext):
     message = update.effective_message
     userc = update.effective_user
     userc_id = userc.id
-    if message.entities and message.parse_entities(
-        [MessageEntity.TEXT_MENTION, MessageEntity.MENTION]
-    ):
-        entities = message.parse_entities(
-            [MessageEntity.TEXT_MENTION, MessageEntity.MENTION]
-        )
-
+    entities = parsed_message(message).mentions
+    if entities:
         chk_users = []
         for ent in entities:
             if ent.type == MessageEntity.TEXT_MENTION:
-                user_id = ent.user.id
+                afk_user = sql.get_afk(ent.user.id)
                 fst_name = ent.user.first_name
+            else:
+                afk_user = sql.get_afk_by_username(entities[ent].lstrip("@"))
+                fst_name = None
 
-                if user_id in chk_users:
-                    return
-                chk_users.append(user_id)
-
-            if ent.type != MessageEntity.MENTION:
-                return
+            # only people who are actually away are worth any more work
+            if not afk_user or afk_user.user_id in chk_users:
+                continue
+            chk_users.append(afk_user.user_id)
 
-            user_id = get_user_id(message.text[ent.offset : ent.offset + ent.length])
-            if not user_id:
-                # Should never happen, since for a user to become AFK they must have spoken. Maybe changed username?
-                return
+            fst_name = fst_name or afk_user.first_name
+            if not fst_name:
+                # went afk before the last restart
+                try:
+                    fst_name = bot.get_chat(afk_user.user_id).first_name
+                except BadRequest:
+                    fst_name = afk_user.username
 
-            if user_id in chk_users:
-                return
-            chk_users.append(user_id)
+            check_afk(update, afk_user, fst_name, userc_id)
 
-            try:
-                chat = bot.get_chat(user_id)
-            except BadRequest:
-                print("Error: Could not fetch userid {} for AFK module".format(user_id))
-                return
-            fst_name = chat.first_name
+    elif message.reply_to_message:
+        afk_user = sql.get_afk(message.reply_to_message.from_user.id)
+        if afk_user:
+            fst_name = message.reply_to_message.from_user.first_name
+            check_afk(update, afk_user, fst_name, userc_id)
 
-            check_afk(update, context, user_id, fst_name, userc_id)
 
-    elif message.reply_to_message:
-        user_id = message.reply_to_message.from_user.id
-        fst_name = message.reply_to_message.from_user.first_name
-        check_afk(update, context, user_id, fst_name, userc_id)
+def away_for(since):
+    seconds = int(time.time() - since)
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return "{}{}".format(seconds // size, unit)
+    return "{}s".format(seconds)
 
 
-def check_afk(update, context, user_id, fst_name, userc_id):
-    if sql.is_afk(user_id):
-        user = sql.check_afk_status(user_id)
-        if int(userc_id) == int(user_id):
-            return
-        if not user.reason:
-            res = "{} is afk".format(fst_name)
-            update.effective_message.reply_text(res)
-        else:
-            res = "{} is afk.\nReason: <code>{}</code>".format(
-                html.escape(fst_name), html.escape(user.reason)
-            )
-            update.effective_message.reply_text(res, parse_mode="html")
+def check_afk(update, afk_user, fst_name, userc_id):
+    if int(userc_id) == int(afk_user.user_id):
+        return
+    if afk_user.since:
+        res = "{} has been afk for {}".format(
+            html.escape(fst_name), away_for(afk_user.since)
+        )
+    else:
+        res = "{} is afk".format(html.escape(fst_name))
+    if afk_user.reason:
+        res += ".\nReason: <code>{}</code>".format(html.escape(afk_user.reason))
+    update.effective_message.reply_text(res, parse_mode="html")
 
 
 __help__ = """
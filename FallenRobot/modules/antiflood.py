@@ -12,7 +12,7 @@ from telegram.ext import (
 )
 from telegram.utils.helpers import mention_html
 
-from FallenRobot import TIGERS, WOLVES, dispatcher
+from FallenRobot import FLOOD_WINDOW, TIGERS, WOLVES, dispatcher
 from FallenRobot.modules.connection import connected
 from FallenRobot.modules.helper_funcs.alternate import send_message
 from FallenRobot.modules.helper_funcs.chat_status import (
@@ -264,14 +264,14 @@ def flood(update, context):
     else:
         if conn:
             text = msg.reply_text(
-                "I'm currently restricting members after {} consecutive messages in {}.".format(
-                    limit, chat_name
+                "I'm currently restricting members after {} messages in {} seconds in {}.".format(
+                    limit, FLOOD_WINDOW, chat_name
                 )
             )
         else:
             text = msg.reply_text(
-                "I'm currently restricting members after {} consecutive messages.".format(
-                    limit
+                "I'm currently restricting members after {} messages in {} seconds.".format(
+                    limit, FLOOD_WINDOW
                 )
             )
 
@@ -335,15 +335,13 @@ Examples of time value: 4m = 4 minutes, 3h = 3 hours, 6d = 6 days, 5w = 5 weeks.
             return
         if conn:
             text = msg.reply_text(
-                "Exceeding consecutive flood limit will result in {} in {}!".format(
+                "Exceeding the flood limit will result in {} in {}!".format(
                     settypeflood, chat_name
                 )
             )
         else:
             text = msg.reply_text(
-                "Exceeding consecutive flood limit will result in {}!".format(
-                    settypeflood
-                )
+                "Exceeding the flood limit will result in {}!".format(settypeflood)
             )
         return (
             "<b>{}:</b>\n"
@@ -394,8 +392,8 @@ def __chat_settings__(chat_id, user_id):
 
 
 __help__ = """
-*Antiflood* allows you to take action on users that send more than x messages in a row. Exceeding the set flood \
-will result in restricting that user.
+*Antiflood* allows you to take action on users that send more than x messages within a few seconds, \
+or that join in when many accounts flood the chat together. Exceeding the set flood will result in restricting that user.
  This will mute users if they send more than 10 messages in a row, bots are ignored.
 
  ❍ /flood*:* Get the current flood control setting
@@ -1,5 +1,4 @@
 import html
-import re
 
 from telegram import ChatPermissions, ParseMode
 from telegram.error import BadRequest
@@ -12,8 +11,8 @@ from FallenRobot.modules.connection import connected
 from FallenRobot.modules.disable import DisableAbleCommandHandler
 from FallenRobot.modules.helper_funcs.alternate import send_message, typing_action
 from FallenRobot.modules.helper_funcs.chat_status import user_admin, user_not_admin
-from FallenRobot.modules.helper_funcs.extraction import extract_text
 from FallenRobot.modules.helper_funcs.misc import split_message
+from FallenRobot.modules.helper_funcs.parsed_message import parsed_message
 from FallenRobot.modules.helper_funcs.string_handling import extract_time
 from FallenRobot.modules.log_channel import loggable
 from FallenRobot.modules.sql.approve_sql import is_approved
@@ -332,94 +331,91 @@ def del_blacklist(update, context):
     message = update.effective_message
     user = update.effective_user
     bot = context.bot
-    to_match = extract_text(message)
+    to_match = parsed_message(message).text
     if not to_match:
         return
     if is_approved(chat.id, user.id):
         return
     getmode, value = sql.get_blacklist_setting(chat.id)
 
-    chat_filters = sql.get_chat_blacklist(chat.id)
-    for trigger in chat_filters:
-        pattern = r"( |^|[^\w])" + re.escape(trigger) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            try:
-                if getmode == 0:
-                    return
-                elif getmode == 1:
-                    try:
-                        message.delete()
-                    except BadRequest:
-                        pass
-                elif getmode == 2:
-                    try:
-                        message.delete()
-                    except BadRequest:
-                        pass
-                    warn(
-                        update.effective_user,
-                        chat,
-                        ("Using blacklisted trigger: {}".format(trigger)),
-                        message,
-                        update.effective_user,
-                    )
-                    return
-                elif getmode == 3:
-                    message.delete()
-                    bot.restrict_chat_member(
-                        chat.id,
-                        update.effective_user.id,
-                        permissions=ChatPermissions(can_send_messages=False),
-                    )
-                    bot.sendMessage(
-                        chat.id,
-                        f"Muted {user.first_name} for using Blacklisted word: {trigger}!",
-                    )
-                    return
-                elif getmode == 4:
-                    message.delete()
-                    res = chat.unban_member(update.effective_user.id)
-                    if res:
-                        bot.sendMessage(
-                            chat.id,
-                            f"Kicked {user.first_name} for using Blacklisted word: {trigger}!",
-                        )
-                    return
-                elif getmode == 5:
-                    message.delete()
-                    chat.ban_member(user.id)
-                    bot.sendMessage(
-                        chat.id,
-                        f"Banned {user.first_name} for using Blacklisted word: {trigger}",
-                    )
-                    return
-                elif getmode == 6:
+    trigger = sql.match_blacklist(chat.id, to_match)
+    if trigger:
+        try:
+            if getmode == 0:
+                return
+            elif getmode == 1:
+                try:
                     message.delete()
-                    bantime = extract_time(message, value)
-                    chat.ban_member(user.id, until_date=bantime)
-                    bot.sendMessage(
-                        chat.id,
-                        f"Banned {user.first_name} until '{value}' for using Blacklisted word: {trigger}!",
-                    )
-                    return
-                elif getmode == 7:
+                except BadRequest:
+                    pass
+            elif getmode == 2:
+                try:
                     message.delete()
-                    mutetime = extract_time(message, value)
-                    bot.restrict_chat_member(
-                        chat.id,
-                        user.id,
-                        until_date=mutetime,
-                        permissions=ChatPermissions(can_send_messages=False),
-                    )
+                except BadRequest:
+                    pass
+                warn(
+                    update.effective_user,
+                    chat,
+                    ("Using blacklisted trigger: {}".format(trigger)),
+                    message,
+                    update.effective_user,
+                )
+                return
+            elif getmode == 3:
+                message.delete()
+                bot.restrict_chat_member(
+                    chat.id,
+                    update.effective_user.id,
+                    permissions=ChatPermissions(can_send_messages=False),
+                )
+                bot.sendMessage(
+                    chat.id,
+                    f"Muted {user.first_name} for using Blacklisted word: {trigger}!",
+                )
+                return
+            elif getmode == 4:
+                message.delete()
+                res = chat.unban_member(update.effective_user.id)
+                if res:
                     bot.sendMessage(
                         chat.id,
-                        f"Muted {user.first_name} until '{value}' for using Blacklisted word: {trigger}!",
+                        f"Kicked {user.first_name} for using Blacklisted word: {trigger}!",
                     )
-                    return
-            except BadRequest as excp:
-                if excp.message != "Message to delete not found":
-                    LOGGER.exception("Error while deleting blacklist message.")
-            break
+                return
+            elif getmode == 5:
+                message.delete()
+                chat.ban_member(user.id)
+                bot.sendMessage(
+                    chat.id,
+                    f"Banned {user.first_name} for using Blacklisted word: {trigger}",
+                )
+                return
+            elif getmode == 6:
+                message.delete()
+                bantime = extract_time(message, value)
+                chat.ban_member(user.id, until_date=bantime)
+                bot.sendMessage(
+                    chat.id,
+                    f"Banned {user.first_name} until '{value}' for using Blacklisted word: {trigger}!",
+                )
+                return
+            elif getmode == 7:
+                message.delete()
+                mutetime = extract_time(message, value)
+                bot.restrict_chat_member(
+                    chat.id,
+                    user.id,
+                    until_date=mutetime,
+                    permissions=ChatPermissions(can_send_messages=False),
+                )
+                bot.sendMessage(
+                    chat.id,
+                    f"Muted {user.first_name} until '{value}' for using Blacklisted word: {trigger}!",
+                )
+                return
+        except BadRequest as excp:
+            if excp.message != "Message to delete not found":
+                LOGGER.exception("Error while deleting blacklist message.")
 
 
 def __import_data__(chat_id, data):
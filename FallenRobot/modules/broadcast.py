@@ -0,0 +1,190 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+
+from telegram import ParseMode, TelegramError, Update
+from telegram.error import BadRequest, Unauthorized
+from telegram.ext import CallbackContext, CommandHandler
+
+import FallenRobot.modules.sql.broadcast_sql as sql
+import FallenRobot.modules.sql.users_sql as users_sql
+from FallenRobot import BROADCAST_WORKERS, LOGGER, dispatcher
+from FallenRobot.modules.helper_funcs.chat_status import dev_plus
+from FallenRobot.modules.helper_funcs.outbound import BULK, outbound_priority
+
+# Recipients fetched, sent and checkpointed at a time
+BROADCAST_CHUNK = 200
+# Seconds between progress edits of the status message
+REPORT_INTERVAL = 15
+
+BROADCAST_POOL = ThreadPoolExecutor(
+    max_workers=BROADCAST_WORKERS, thread_name_prefix="broadcast"
+)
+
+
+def _send(bot, recipient, text):
+    is_user = int(recipient) > 0
+    with outbound_priority(BULK, wait=True):
+        try:
+            bot.send_message(
+                int(recipient),
+                text,
+                parse_mode=ParseMode.MARKDOWN,
+                disable_web_page_preview=True,
+            )
+            return "sent"
+        except Unauthorized as excp:
+            if not is_user or "deactivated" in excp.message:
+                # kicked from the group, or the account is gone for good
+                return "removed"
+            # blocked the bot or never started it: still a member of their
+            # chats as far as gbans, /info and username lookups go
+            return "unreachable"
+        except BadRequest as excp:
+            if excp.message == "Chat not found":
+                return "unreachable" if is_user else "removed"
+            return "failed"
+        except TelegramError:
+            return "failed"
+
+
+def _report(bot, broadcast, rate):
+    if broadcast.stage == "done":
+        text = "Broadcast complete."
+    else:
+        text = f"Broadcasting to {broadcast.stage}... ({rate:.1f} msg/s)"
+    text += (
+        f"\nSent: {broadcast.sent}."
+        f"\nFailed: {broadcast.failed}."
+        f"\nUnreachable: {broadcast.unreachable}."
+        f"\nRemoved: {broadcast.removed}."
+    )
+    try:
+        bot.edit_message_text(
+            text,
+            chat_id=int(broadcast.status_chat),
+            message_id=broadcast.status_message,
+        )
+    except TelegramError:
+        pass
+
+
+def run_broadcast(bot, broadcast):
+    """
+    Send a broadcast from where it was last checkpointed. Progress is stored
+    after every chunk, so a restart repeats at most one chunk.
+    """
+    started = monotonic()
+    handled = 0
+    last_report = started
+
+    while broadcast.stage != "done":
+        if broadcast.stage == "chats":
+            recipients = users_sql.get_chat_ids_after(
+                broadcast.last_key, BROADCAST_CHUNK
+            )
+        else:
+            recipients = users_sql.get_user_ids_after(
+                broadcast.last_key, BROADCAST_CHUNK
+            )
+
+        if not recipients:
+            if broadcast.stage == "chats" and broadcast.to_users:
+                broadcast.stage = "users"
+            else:
+                broadcast.stage = "done"
+            broadcast.last_key = None
+        else:
+            targets = [r for r in recipients if str(r) != str(bot.id)]
+            results = BROADCAST_POOL.map(
+                partial(_send, bot, text=broadcast.text), targets
+            )
+            for recipient, result in zip(targets, results):
+                if result == "sent":
+                    broadcast.sent += 1
+                elif result == "unreachable":
+                    broadcast.unreachable += 1
+                elif result == "removed":
+                    broadcast.removed += 1
+                    if broadcast.stage == "chats":
+                        users_sql.rem_chat(recipient)
+                    else:
+                        users_sql.del_user(recipient)
+                else:
+                    broadcast.failed += 1
+            handled += len(targets)
+            broadcast.last_key = str(recipients[-1])
+
+        if not sql.save_progress(broadcast):
+            LOGGER.info("Broadcast %s was stopped", broadcast.id)
+            return
+
+        now = monotonic()
+        if broadcast.stage == "done" or now - last_report >= REPORT_INTERVAL:
+            _report(bot, broadcast, handled / max(now - started, 1))
+            last_report = now
+
+
+def start_broadcast(bot, broadcast):
+    def target():
+        try:
+            run_broadcast(bot, broadcast)
+        except Exception:
+            LOGGER.exception("Broadcast %s stopped on an error", broadcast.id)
+
+    threading.Thread(
+        target=target, name=f"broadcast-{broadcast.id}", daemon=True
+    ).start()
+
+
+@dev_plus
+def broadcast(update: Update, context: CallbackContext):
+    message = update.effective_message
+    to_send = message.text.split(None, 1)
+
+    if len(to_send) >= 2:
+        command = to_send[0][1:].split("@")[0].lower()
+        if sql.get_unfinished_broadcasts():
+            message.reply_text(
+                "A broadcast is already running, use /stopbroadcast to stop it first."
+            )
+            return
+
+        status = message.reply_text("Starting broadcast...")
+        new = sql.new_broadcast(
+            to_send[1],
+            to_groups=command != "broadcastusers",
+            to_users=command != "broadcastgroups",
+            status_chat=status.chat_id,
+            status_message=status.message_id,
+        )
+        start_broadcast(context.bot, new)
+
+
+@dev_plus
+def stop_broadcast(update: Update, context: CallbackContext):
+    stopped = sql.stop_broadcasts()
+    if stopped:
+        update.effective_message.reply_text("Broadcast stopped.")
+    else:
+        update.effective_message.reply_text("There is no broadcast running.")
+
+
+def resume_broadcasts(context: CallbackContext):
+    for unfinished in sql.get_unfinished_broadcasts():
+        LOGGER.info("Resuming broadcast %s", unfinished.id)
+        start_broadcast(context.bot, unfinished)
+
+
+BROADCAST_HANDLER = CommandHandler(
+    ["broadcastall", "broadcastusers", "broadcastgroups"], broadcast, run_async=True
+)
+STOP_BROADCAST_HANDLER = CommandHandler("stopbroadcast", stop_broadcast, run_async=True)
+
+dispatcher.add_handler(BROADCAST_HANDLER)
+dispatcher.add_handler(STOP_BROADCAST_HANDLER)
+dispatcher.job_queue.run_once(resume_broadcasts, 10)
+
+__mod_name__ = "Broadcast"
+__handlers__ = [BROADCAST_HANDLER, STOP_BROADCAST_HANDLER]
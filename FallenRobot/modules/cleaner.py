@@ -3,17 +3,21 @@ import html
 from telegram import ParseMode, Update
 from telegram.ext import CallbackContext, CommandHandler, Filters, MessageHandler
 
-from FallenRobot import ALLOW_EXCL, CustomCommandHandler, dispatcher
+from FallenRobot import CustomCommandHandler, dispatcher
 from FallenRobot.modules.disable import DisableAbleCommandHandler
 from FallenRobot.modules.helper_funcs.chat_status import (
     bot_can_delete,
     connection_status,
     dev_plus,
+    get_bot_member,
     user_admin,
 )
+from FallenRobot.modules.helper_funcs.parsed_message import (
+    CMD_STARTERS,
+    parsed_message,
+)
 from FallenRobot.modules.sql import cleaner_sql as sql
 
-CMD_STARTERS = ("/", "!") if ALLOW_EXCL else "/"
 BLUE_TEXT_CLEAN_GROUP = 13
 CommandHandlerList = (CommandHandler, CustomCommandHandler, DisableAbleCommandHandler)
 command_list = [
@@ -41,12 +45,10 @@ def clean_blue_text_must_click(update: Update, context: CallbackContext):
     bot = context.bot
     chat = update.effective_chat
     message = update.effective_message
-    if chat.get_member(bot.id).can_delete_messages and sql.is_enabled(chat.id):
-        fst_word = message.text.strip().split(None, 1)[0]
+    if sql.is_enabled(chat.id) and get_bot_member(chat, bot.id).can_delete_messages:
+        fst_word = parsed_message(message).fst_word
 
-        if len(fst_word) > 1 and any(
-            fst_word.startswith(start) for start in CMD_STARTERS
-        ):
+        if fst_word and len(fst_word) > 1 and fst_word.startswith(CMD_STARTERS):
             command = fst_word[1:].split("@")
             chat = update.effective_chat
 
@@ -1,5 +1,4 @@
 import random
-import re
 from html import escape
 
 import telegram
@@ -19,11 +18,11 @@ from FallenRobot.modules.connection import connected
 from FallenRobot.modules.disable import DisableAbleCommandHandler
 from FallenRobot.modules.helper_funcs.alternate import send_message, typing_action
 from FallenRobot.modules.helper_funcs.chat_status import user_admin
-from FallenRobot.modules.helper_funcs.extraction import extract_text
 from FallenRobot.modules.helper_funcs.filters import CustomFilters
 from FallenRobot.modules.helper_funcs.handlers import MessageHandlerChecker
 from FallenRobot.modules.helper_funcs.misc import build_keyboard_parser
 from FallenRobot.modules.helper_funcs.msg_types import get_filter_type
+from FallenRobot.modules.helper_funcs.parsed_message import parsed_message
 from FallenRobot.modules.helper_funcs.string_handling import (
     button_markdown_parser,
     escape_invalid_curly_brackets,
@@ -265,246 +264,253 @@ def stop_filter(update, context):
     )
 
 
+VALID_WELCOME_FORMATTERS = [
+    "first",
+    "last",
+    "fullname",
+    "username",
+    "id",
+    "chatname",
+    "mention",
+]
+
+
+def get_filter_keyboard(bot, chat_id, cached):
+    if cached.keyboard is None:
+        keyb = build_keyboard_parser(bot, chat_id, cached.buttons)
+        cached.keyboard = InlineKeyboardMarkup(keyb)
+    return cached.keyboard
+
+
+def get_filter_variants(cached):
+    # [(reply text, reply text with invalid curly brackets escaped), ...]
+    if cached.variants is None:
+        reply_text = cached.filt.reply_text
+        texts = [reply_text]
+        if "%%%" in reply_text:
+            split = reply_text.split("%%%")
+            if all(split):
+                texts = split
+        cached.variants = [
+            (text, escape_invalid_curly_brackets(text, VALID_WELCOME_FORMATTERS))
+            for text in texts
+        ]
+    return cached.variants
+
+
 def reply_filter(update, context):
     chat = update.effective_chat  # type: Optional[Chat]
     message = update.effective_message  # type: Optional[Message]
 
     if not update.effective_user or update.effective_user.id == 777000:
         return
-    to_match = extract_text(message)
+    to_match = parsed_message(message).text
     if not to_match:
         return
 
-    chat_filters = sql.get_chat_triggers(chat.id)
-    for keyword in chat_filters:
-        pattern = r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            if MessageHandlerChecker.check_user(update.effective_user.id):
-                return
-            filt = sql.get_filter(chat.id, keyword)
-            if filt.reply == "there is should be a new reply":
-                buttons = sql.get_buttons(chat.id, filt.keyword)
-                keyb = build_keyboard_parser(context.bot, chat.id, buttons)
-                keyboard = InlineKeyboardMarkup(keyb)
-
-                VALID_WELCOME_FORMATTERS = [
-                    "first",
-                    "last",
-                    "fullname",
-                    "username",
-                    "id",
-                    "chatname",
-                    "mention",
-                ]
-                if filt.reply_text:
-                    if "%%%" in filt.reply_text:
-                        split = filt.reply_text.split("%%%")
-                        if all(split):
-                            text = random.choice(split)
-                        else:
-                            text = filt.reply_text
-                    else:
-                        text = filt.reply_text
-                    if text.startswith("~!") and text.endswith("!~"):
-                        sticker_id = text.replace("~!", "").replace("!~", "")
-                        try:
-                            context.bot.send_sticker(
-                                chat.id,
-                                sticker_id,
-                                reply_to_message_id=message.message_id,
-                            )
-                            return
-                        except BadRequest as excp:
-                            if (
-                                excp.message
-                                == "Wrong remote file identifier specified: wrong padding in the string"
-                            ):
-                                context.bot.send_message(
-                                    chat.id,
-                                    "Message couldn't be sent, Is the sticker id valid?",
-                                )
-                                return
-                            else:
-                                LOGGER.exception("Error in filters: " + excp.message)
-                                return
-                    valid_format = escape_invalid_curly_brackets(
-                        text, VALID_WELCOME_FORMATTERS
-                    )
-                    if valid_format:
-                        filtext = valid_format.format(
-                            first=escape(message.from_user.first_name),
-                            last=escape(
-                                message.from_user.last_name
-                                or message.from_user.first_name
-                            ),
-                            fullname=" ".join(
-                                [
-                                    escape(message.from_user.first_name),
-                                    escape(message.from_user.last_name),
-                                ]
-                                if message.from_user.last_name
-                                else [escape(message.from_user.first_name)]
-                            ),
-                            username=(
-                                "@" + escape(message.from_user.username)
-                                if message.from_user.username
-                                else mention_html(
-                                    message.from_user.id, message.from_user.first_name
-                                )
-                            ),
-                            mention=mention_html(
-                                message.from_user.id, message.from_user.first_name
-                            ),
-                            chatname=(
-                                escape(message.chat.title)
-                                if message.chat.type != "private"
-                                else escape(message.from_user.first_name)
-                            ),
-                            id=message.from_user.id,
-                        )
-                    else:
-                        filtext = ""
-                else:
-                    filtext = ""
-
-                if filt.file_type in (sql.Types.BUTTON_TEXT, sql.Types.TEXT):
+    keyword = sql.match_filter(chat.id, to_match)
+    if keyword:
+        if MessageHandlerChecker.check_user(update.effective_user.id):
+            return
+        cached = sql.get_cached_filter(chat.id, keyword)
+        if not cached:
+            return
+        filt = cached.filt
+        if filt.reply == "there is should be a new reply":
+            keyboard = get_filter_keyboard(context.bot, chat.id, cached)
+
+            if filt.reply_text:
+                text, valid_format = random.choice(get_filter_variants(cached))
+                if text.startswith("~!") and text.endswith("!~"):
+                    sticker_id = text.replace("~!", "").replace("!~", "")
                     try:
-                        context.bot.send_message(
+                        context.bot.send_sticker(
                             chat.id,
-                            markdown_to_html(filtext),
+                            sticker_id,
                             reply_to_message_id=message.message_id,
-                            parse_mode=ParseMode.HTML,
-                            disable_web_page_preview=True,
-                            reply_markup=keyboard,
                         )
+                        return
                     except BadRequest as excp:
-                        error_catch = get_exception(excp, filt, chat)
-                        if error_catch == "noreply":
-                            try:
-                                context.bot.send_message(
-                                    chat.id,
-                                    markdown_to_html(filtext),
-                                    parse_mode=ParseMode.HTML,
-                                    disable_web_page_preview=True,
-                                    reply_markup=keyboard,
-                                )
-                            except BadRequest as excp:
-                                LOGGER.exception("Error in filters: " + excp.message)
-                                send_message(
-                                    update.effective_message,
-                                    get_exception(excp, filt, chat),
-                                )
+                        if (
+                            excp.message
+                            == "Wrong remote file identifier specified: wrong padding in the string"
+                        ):
+                            context.bot.send_message(
+                                chat.id,
+                                "Message couldn't be sent, Is the sticker id valid?",
+                            )
+                            return
                         else:
-                            try:
-                                send_message(
-                                    update.effective_message,
-                                    get_exception(excp, filt, chat),
-                                )
-                            except BadRequest as excp:
-                                LOGGER.exception(
-                                    "Failed to send message: " + excp.message
-                                )
-                elif ENUM_FUNC_MAP[filt.file_type] == dispatcher.bot.send_sticker:
-                    try:
-                        ENUM_FUNC_MAP[filt.file_type](
-                            chat.id,
-                            filt.file_id,
-                            reply_to_message_id=message.message_id,
-                            reply_markup=keyboard,
-                        )
-                    except BadRequest:
-                        send_message(
-                            message,
-                            "I don't have the permission to send the content of the filter.",
-                        )
+                            LOGGER.exception("Error in filters: " + excp.message)
+                            return
+                if valid_format:
+                    filtext = valid_format.format(
+                        first=escape(message.from_user.first_name),
+                        last=escape(
+                            message.from_user.last_name or message.from_user.first_name
+                        ),
+                        fullname=" ".join(
+                            [
+                                escape(message.from_user.first_name),
+                                escape(message.from_user.last_name),
+                            ]
+                            if message.from_user.last_name
+                            else [escape(message.from_user.first_name)]
+                        ),
+                        username=(
+                            "@" + escape(message.from_user.username)
+                            if message.from_user.username
+                            else mention_html(
+                                message.from_user.id, message.from_user.first_name
+                            )
+                        ),
+                        mention=mention_html(
+                            message.from_user.id, message.from_user.first_name
+                        ),
+                        chatname=(
+                            escape(message.chat.title)
+                            if message.chat.type != "private"
+                            else escape(message.from_user.first_name)
+                        ),
+                        id=message.from_user.id,
+                    )
                 else:
-                    try:
-                        ENUM_FUNC_MAP[filt.file_type](
-                            chat.id,
-                            filt.file_id,
-                            caption=markdown_to_html(filtext),
-                            reply_to_message_id=message.message_id,
-                            parse_mode=ParseMode.HTML,
-                            reply_markup=keyboard,
-                        )
-                    except BadRequest:
-                        send_message(
-                            message,
-                            "I don't have the permission to send the content of the filter.",
-                        )
-                break
+                    filtext = ""
             else:
-                if filt.is_sticker:
-                    message.reply_sticker(filt.reply)
-                elif filt.is_document:
-                    message.reply_document(filt.reply)
-                elif filt.is_image:
-                    message.reply_photo(filt.reply)
-                elif filt.is_audio:
-                    message.reply_audio(filt.reply)
-                elif filt.is_voice:
-                    message.reply_voice(filt.reply)
-                elif filt.is_video:
-                    message.reply_video(filt.reply)
-                elif filt.has_markdown:
-                    buttons = sql.get_buttons(chat.id, filt.keyword)
-                    keyb = build_keyboard_parser(context.bot, chat.id, buttons)
-                    keyboard = InlineKeyboardMarkup(keyb)
-
-                    try:
-                        send_message(
-                            update.effective_message,
-                            filt.reply,
-                            parse_mode=ParseMode.MARKDOWN,
-                            disable_web_page_preview=True,
-                            reply_markup=keyboard,
-                        )
-                    except BadRequest as excp:
-                        if excp.message == "Unsupported url protocol":
-                            try:
-                                send_message(
-                                    update.effective_message,
-                                    "You seem to be trying to use an unsupported url protocol. "
-                                    "Telegram doesn't support buttons for some protocols, such as tg://. Please try "
-                                    "again...",
-                                )
-                            except BadRequest as excp:
-                                LOGGER.exception("Error in filters: " + excp.message)
-                        elif excp.message == "Reply message not found":
-                            try:
-                                context.bot.send_message(
-                                    chat.id,
-                                    filt.reply,
-                                    parse_mode=ParseMode.MARKDOWN,
-                                    disable_web_page_preview=True,
-                                    reply_markup=keyboard,
-                                )
-                            except BadRequest as excp:
-                                LOGGER.exception("Error in filters: " + excp.message)
-                        else:
-                            try:
-                                send_message(
-                                    update.effective_message,
-                                    "This message couldn't be sent as it's incorrectly formatted.",
-                                )
-                            except BadRequest as excp:
-                                LOGGER.exception("Error in filters: " + excp.message)
-                            LOGGER.warning(
-                                "Message %s could not be parsed", str(filt.reply)
+                filtext = ""
+
+            if filt.file_type in (sql.Types.BUTTON_TEXT, sql.Types.TEXT):
+                try:
+                    context.bot.send_message(
+                        chat.id,
+                        markdown_to_html(filtext),
+                        reply_to_message_id=message.message_id,
+                        parse_mode=ParseMode.HTML,
+                        disable_web_page_preview=True,
+                        reply_markup=keyboard,
+                    )
+                except BadRequest as excp:
+                    error_catch = get_exception(excp, filt, chat)
+                    if error_catch == "noreply":
+                        try:
+                            context.bot.send_message(
+                                chat.id,
+                                markdown_to_html(filtext),
+                                parse_mode=ParseMode.HTML,
+                                disable_web_page_preview=True,
+                                reply_markup=keyboard,
+                            )
+                        except BadRequest as excp:
+                            LOGGER.exception("Error in filters: " + excp.message)
+                            send_message(
+                                update.effective_message,
+                                get_exception(excp, filt, chat),
+                            )
+                    else:
+                        try:
+                            send_message(
+                                update.effective_message,
+                                get_exception(excp, filt, chat),
+                            )
+                        except BadRequest as excp:
+                            LOGGER.exception("Failed to send message: " + excp.message)
+            elif ENUM_FUNC_MAP[filt.file_type] == dispatcher.bot.send_sticker:
+                try:
+                    ENUM_FUNC_MAP[filt.file_type](
+                        chat.id,
+                        filt.file_id,
+                        reply_to_message_id=message.message_id,
+                        reply_markup=keyboard,
+                    )
+                except BadRequest:
+                    send_message(
+                        message,
+                        "I don't have the permission to send the content of the filter.",
+                    )
+            else:
+                try:
+                    ENUM_FUNC_MAP[filt.file_type](
+                        chat.id,
+                        filt.file_id,
+                        caption=markdown_to_html(filtext),
+                        reply_to_message_id=message.message_id,
+                        parse_mode=ParseMode.HTML,
+                        reply_markup=keyboard,
+                    )
+                except BadRequest:
+                    send_message(
+                        message,
+                        "I don't have the permission to send the content of the filter.",
+                    )
+        else:
+            if filt.is_sticker:
+                message.reply_sticker(filt.reply)
+            elif filt.is_document:
+                message.reply_document(filt.reply)
+            elif filt.is_image:
+                message.reply_photo(filt.reply)
+            elif filt.is_audio:
+                message.reply_audio(filt.reply)
+            elif filt.is_voice:
+                message.reply_voice(filt.reply)
+            elif filt.is_video:
+                message.reply_video(filt.reply)
+            elif filt.has_markdown:
+                keyboard = get_filter_keyboard(context.bot, chat.id, cached)
+
+                try:
+                    send_message(
+                        update.effective_message,
+                        filt.reply,
+                        parse_mode=ParseMode.MARKDOWN,
+                        disable_web_page_preview=True,
+                        reply_markup=keyboard,
+                    )
+                except BadRequest as excp:
+                    if excp.message == "Unsupported url protocol":
+                        try:
+                            send_message(
+                                update.effective_message,
+                                "You seem to be trying to use an unsupported url protocol. "
+                                "Telegram doesn't support buttons for some protocols, such as tg://. Please try "
+                                "again...",
+                            )
+                        except BadRequest as excp:
+                            LOGGER.exception("Error in filters: " + excp.message)
+                    elif excp.message == "Reply message not found":
+                        try:
+                            context.bot.send_message(
+                                chat.id,
+                                filt.reply,
+                                parse_mode=ParseMode.MARKDOWN,
+                                disable_web_page_preview=True,
+                                reply_markup=keyboard,
                             )
-                            LOGGER.exception(
-                                "Could not parse filter %s in chat %s",
-                                str(filt.keyword),
-                                str(chat.id),
+                        except BadRequest as excp:
+                            LOGGER.exception("Error in filters: " + excp.message)
+                    else:
+                        try:
+                            send_message(
+                                update.effective_message,
+                                "This message couldn't be sent as it's incorrectly formatted.",
                             )
+                        except BadRequest as excp:
+                            LOGGER.exception("Error in filters: " + excp.message)
+                        LOGGER.warning(
+                            "Message %s could not be parsed", str(filt.reply)
+                        )
+                        LOGGER.exception(
+                            "Could not parse filter %s in chat %s",
+                            str(filt.keyword),
+                            str(chat.id),
+                        )
 
-                else:
-                    # LEGACY - all new filters will have has_markdown set to True.
-                    try:
-                        send_message(update.effective_message, filt.reply)
-                    except BadRequest as excp:
-                        LOGGER.exception("Error in filters: " + excp.message)
-                break
+            else:
+                # LEGACY - all new filters will have has_markdown set to True.
+                try:
+                    send_message(update.effective_message, filt.reply)
+                except BadRequest as excp:
+                    LOGGER.exception("Error in filters: " + excp.message)
 
 
 def rmall_filters(update, context):
@@ -598,7 +604,11 @@ def addnew_filter(update, chat_id, keyword, text, file_type, file_id, buttons):
 
 
 def __stats__():
-    return "• {} filters, across {} chats.".format(sql.num_filters(), sql.num_chats())
+    hits, misses, size, rate = sql.filter_cache_stats()
+    return (
+        "• {} filters, across {} chats.\n"
+        "• filter cache: {} cached, {} hits / {} misses ({:.1f}% hit rate)."
+    ).format(sql.num_filters(), sql.num_chats(), size, hits, misses, rate)
 
 
 def __import_data__(chat_id, data):
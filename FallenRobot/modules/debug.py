@@ -1,12 +1,22 @@
 import datetime
+import html
 import os
 
-from telegram import Update
+from telegram import ParseMode, Update
 from telegram.ext import CallbackContext, CommandHandler
 from telethon import events
 
 from FallenRobot import dispatcher, telethn
 from FallenRobot.modules.helper_funcs.chat_status import dev_plus
+from FallenRobot.modules.helper_funcs.outbound import outbound_stats
+from FallenRobot.modules.sql import (
+    is_profiling,
+    pool_stats,
+    reset_sql_stats,
+    set_profiling,
+    sql_stats,
+)
+from FallenRobot.modules.sql.chat_cache import cache_stats
 
 DEBUG_MODE = False
 
@@ -55,12 +65,94 @@ def logs(update: Update, context: CallbackContext):
         context.bot.send_document(document=f, filename=f.name, chat_id=user.id)
 
 
+@dev_plus
+def sqlstats(update: Update, context: CallbackContext):
+    message = update.effective_message
+    arg = context.args[0].lower() if context.args else None
+    if arg == "reset":
+        reset_sql_stats()
+        message.reply_text("SQL stats cleared.")
+        return
+    if arg == "off":
+        set_profiling(False)
+        message.reply_text("SQL profiling stopped.")
+        return
+    if not is_profiling():
+        set_profiling(True)
+        message.reply_text(
+            "SQL profiling started, run /sqlstats again later to see the "
+            "results and /sqlstats off to stop it."
+        )
+        return
+
+    stats = sql_stats()
+    lines = ["<b>Queries by module</b> (runs, queries, total, slowest):\n"]
+    for module, (runs, queries, total, slowest, _) in stats["modules"]:
+        lines.append(
+            "• {}: {}, {} ({:.1f}/run), {:.0f}ms, {:.1f}ms\n".format(
+                html.escape(module),
+                runs,
+                queries,
+                queries / runs,
+                total * 1000,
+                slowest * 1000,
+            )
+        )
+    lines.append("\n<b>Caches</b> (chats, hit rate, evicted):\n")
+    for cache in cache_stats():
+        lookups = cache["hits"] + cache["misses"]
+        lines.append(
+            "• {}: {}{} {}, {:.1f}%, {}\n".format(
+                cache["name"],
+                cache["size"],
+                "/{}".format(cache["maxsize"]) if cache["maxsize"] else "",
+                cache["mode"],
+                cache["hits"] / lookups * 100 if lookups else 100.0,
+                cache["evictions"],
+            )
+        )
+    lines.append("\n<b>Top statements</b> (calls, total, slowest):\n")
+    for statement, (calls, total, slowest) in stats["statements"]:
+        lines.append(
+            "• {}, {:.0f}ms, {:.1f}ms\n<code>{}</code>\n".format(
+                calls,
+                total * 1000,
+                slowest * 1000,
+                html.escape(" ".join(statement.split())[:200]),
+            )
+        )
+
+    # whole entries only, a cut inside a tag makes Telegram reject the message
+    text = ""
+    for line in lines:
+        if len(text) + len(line) > 4096:
+            break
+        text += line
+    message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+def __stats__():
+    outbound = (
+        "• outbound queue: {depth} waiting (max {max_depth}), {waited}/{calls} "
+        "calls delayed, {avg_wait_ms:.0f}ms avg wait, {retry_after} flood waits, "
+        "{dropped} dropped."
+    ).format(**outbound_stats())
+    pool = (
+        "• db pool: {checked_out}/{size} in use (+{overflow} overflow), "
+        "{checkouts} checkouts, {avg_wait_ms:.1f}ms avg / {max_wait_ms:.0f}ms max "
+        "wait, {timeouts} timeouts."
+    ).format(**pool_stats())
+    return outbound + "\n" + pool
+
+
 LOG_HANDLER = CommandHandler("logs", logs, run_async=True)
 DEBUG_HANDLER = CommandHandler("debug", debug, run_async=True)
+SQLSTATS_HANDLER = CommandHandler("sqlstats", sqlstats, run_async=True)
 
 dispatcher.add_handler(LOG_HANDLER)
 dispatcher.add_handler(DEBUG_HANDLER)
+dispatcher.add_handler(SQLSTATS_HANDLER)
 
 __mod_name__ = "Debug"
-__command_list__ = ["debug"]
-__handlers__ = [DEBUG_HANDLER]
+__command_list__ = ["debug", "sqlstats"]
+__handlers__ = [DEBUG_HANDLER, SQLSTATS_HANDLER]
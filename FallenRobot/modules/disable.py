@@ -12,7 +12,11 @@ from telegram.ext import (
 from telegram.utils.helpers import escape_markdown
 
 from FallenRobot import dispatcher
-from FallenRobot.modules.helper_funcs.handlers import CMD_STARTERS, SpamChecker
+from FallenRobot.modules.helper_funcs.handlers import (
+    CMD_STARTERS,
+    SpamChecker,
+    parse_command,
+)
 from FallenRobot.modules.helper_funcs.misc import is_module_loaded
 
 FILENAME = __name__.rsplit(".", 1)[-1]
@@ -45,46 +49,37 @@ if is_module_loaded(FILENAME):
 
         def check_update(self, update):
             if isinstance(update, Update) and update.effective_message:
-                message = update.effective_message
-
-                if message.text and len(message.text) > 1:
-                    fst_word = message.text.split(None, 1)[0]
-                    if len(fst_word) > 1 and any(
-                        fst_word.startswith(start) for start in CMD_STARTERS
-                    ):
-                        args = message.text.split()[1:]
-                        command = fst_word[1:].split("@")
-                        command.append(message.bot.username)
-
-                        if not (
-                            command[0].lower() in self.command
-                            and command[1].lower() == message.bot.username.lower()
-                        ):
-                            return None
-                        chat = update.effective_chat
-                        user = update.effective_user
-                        if user.id == 1087968824:
-                            user_id = chat.id
-                        else:
-                            user_id = user.id
-                        if SpamChecker.check_user(user_id):
+                parsed = parse_command(update.effective_message)
+                if parsed is None:
+                    return None
+
+                command, args = parsed
+                if command not in self.command:
+                    return None
+                chat = update.effective_chat
+                user = update.effective_user
+                if user.id == 1087968824:
+                    user_id = chat.id
+                else:
+                    user_id = user.id
+                if SpamChecker.check_user(user_id):
+                    return None
+                filter_result = self.filters(update)
+                if filter_result:
+                    # disabled, admincmd, user admin
+                    if sql.is_command_disabled(chat.id, command):
+                        # check if command was disabled
+                        is_disabled = command in ADMIN_CMDS and is_user_admin(
+                            chat, user.id
+                        )
+                        if not is_disabled:
                             return None
-                        filter_result = self.filters(update)
-                        if filter_result:
-                            # disabled, admincmd, user admin
-                            if sql.is_command_disabled(chat.id, command[0].lower()):
-                                # check if command was disabled
-                                is_disabled = command[
-                                    0
-                                ] in ADMIN_CMDS and is_user_admin(chat, user.id)
-                                if not is_disabled:
-                                    return None
-                                else:
-                                    return args, filter_result
-
-                            return args, filter_result
                         else:
-                            return False
+                            return list(args), filter_result
+
+                    return list(args), filter_result
+                else:
+                    return False
 
     class DisableAbleMessageHandler(MessageHandler):
         def __init__(self, filters, callback, friendly, **kwargs):
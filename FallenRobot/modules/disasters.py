@@ -584,6 +584,7 @@ Group admins/group owners do not need these commands.
 *Debugging and Shell:* 
  ❍ /debug <on/off>*:* Logs commands to updates.txt
  ❍ /logs*:* Run this in support group to get logs in pm
+ ❍ /sqlstats*:* Queries run per module and the slowest statements. Starts profiling the first time, `/sqlstats off` stops it and `/sqlstats reset` clears the numbers
  ❍ /eval*:* Self explanatory
  ❍ /sh*:* Runs shell command
  ❍ /shell*:* Runs shell command
@@ -594,6 +595,7 @@ Group admins/group owners do not need these commands.
 *Global Bans:*
  ❍ /gban <id> <reason>*:* Gbans the user, works by reply too
  ❍ /ungban*:* Ungbans the user, same usage as gban
+ ❍ /cancelgban <id>*:* Stops a gban or ungban that is still going through chats
  ❍ /gbanlist*:* Outputs a list of gbanned users
 
 *Global Blue Text*
@@ -1,6 +1,8 @@
 import html
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from io import BytesIO
 
 from telegram import ParseMode, Update
@@ -14,6 +16,7 @@ from FallenRobot import (
     DEV_USERS,
     DRAGONS,
     EVENT_LOGS,
+    GBAN_WORKERS,
     OWNER_ID,
     STRICT_GBAN,
     SUPPORT_CHAT,
@@ -22,6 +25,7 @@ from FallenRobot import (
     dispatcher,
 )
 from FallenRobot.modules.helper_funcs.chat_status import (
+    get_bot_member,
     is_user_admin,
     support_plus,
     user_admin,
@@ -30,6 +34,7 @@ from FallenRobot.modules.helper_funcs.extraction import (
     extract_user,
     extract_user_and_text,
 )
+from FallenRobot.modules.helper_funcs.fanout import FanOut, FanOutAbort
 from FallenRobot.modules.helper_funcs.misc import send_to_list
 from FallenRobot.modules.sql.users_sql import get_user_com_chats
 
@@ -64,6 +69,80 @@ UNGBAN_ERRORS = {
 }
 
 
+# gban/ungban kicks run here so the command doesn't hold a dispatcher worker
+GBAN_POOL = ThreadPoolExecutor(max_workers=GBAN_WORKERS, thread_name_prefix="gban")
+# user_id -> FanOut of the gban/ungban currently running for that user
+ACTIVE_FANOUTS = {}
+FANOUT_LOCK = threading.RLock()
+
+
+def _start_fanout(user_id, fanout):
+    with FANOUT_LOCK:
+        previous = ACTIVE_FANOUTS.get(user_id)
+        ACTIVE_FANOUTS[user_id] = fanout
+    if previous:
+        previous.cancel()
+    fanout.start()
+
+
+def _forget_fanout(user_id, fanout):
+    with FANOUT_LOCK:
+        if ACTIVE_FANOUTS.get(user_id) is fanout:
+            del ACTIVE_FANOUTS[user_id]
+
+
+def _fanout_summary(fanout, success):
+    text = f"\n<b>Took:</b> <code>{fanout.elapsed:.1f}s</code>"
+    if fanout.cancelled:
+        text += (
+            f"\n<b>Cancelled</b> after <code>"
+            f"{fanout.processed - fanout.counts['cancelled']}/{fanout.total}</code> chats"
+        )
+    for outcome, count in fanout.counts.most_common():
+        if outcome not in (success, "cancelled"):
+            text += f"\n<code>{html.escape(outcome)}</code>: {count}"
+    return text
+
+
+def _gban_in_chat(bot, user_id, chat_id):
+    chat_id = int(chat_id)
+
+    # Check if this group has disabled gbans
+    if not sql.does_chat_gban(chat_id):
+        return "gbans disabled"
+
+    try:
+        bot.kick_chat_member(chat_id, user_id)
+        return "banned"
+    except BadRequest as excp:
+        if excp.message in GBAN_ERRORS:
+            return excp.message
+        raise FanOutAbort(excp.message)
+    except TelegramError as excp:
+        return excp.message
+
+
+def _ungban_in_chat(bot, user_id, chat_id):
+    chat_id = int(chat_id)
+
+    # Check if this group has disabled gbans
+    if not sql.does_chat_gban(chat_id):
+        return "gbans disabled"
+
+    try:
+        member = bot.get_chat_member(chat_id, user_id)
+        if member.status != "kicked":
+            return "not banned"
+        bot.unban_chat_member(chat_id, user_id)
+        return "unbanned"
+    except BadRequest as excp:
+        if excp.message in UNGBAN_ERRORS:
+            return excp.message
+        raise FanOutAbort(excp.message)
+    except TelegramError as excp:
+        return excp.message
+
+
 @support_plus
 def gban(update: Update, context: CallbackContext):
     bot, args = context.bot, context.args
@@ -156,7 +235,6 @@ def gban(update: Update, context: CallbackContext):
 
     message.reply_text("On it!")
 
-    start_time = time.time()
     datetime_fmt = "%Y-%m-%dT%H:%M"
     current_time = datetime.utcnow().strftime(datetime_fmt)
 
@@ -195,73 +273,77 @@ def gban(update: Update, context: CallbackContext):
 
     sql.gban_user(user_id, user_chat.username or user_chat.first_name, reason)
 
-    chats = get_user_com_chats(user_id)
-    gbanned_chats = 0
-
-    for chat in chats:
-        chat_id = int(chat)
-
-        # Check if this group has disabled gbans
-        if not sql.does_chat_gban(chat_id):
-            continue
-
-        try:
-            bot.kick_chat_member(chat_id, user_id)
-            gbanned_chats += 1
+    def progress(fanout):
+        if EVENT_LOGS:
+            log.edit_text(
+                log_message
+                + f"\n<b>Progress:</b> <code>{fanout.processed}/{fanout.total}</code>",
+                parse_mode=ParseMode.HTML,
+            )
 
-        except BadRequest as excp:
-            if excp.message in GBAN_ERRORS:
-                pass
+    def done(fanout):
+        _forget_fanout(user_id, fanout)
+        if fanout.error:
+            message.reply_text(f"Could not gban due to: {fanout.error}")
+            if EVENT_LOGS:
+                bot.send_message(
+                    EVENT_LOGS,
+                    f"Could not gban due to {fanout.error}",
+                    parse_mode=ParseMode.HTML,
+                )
             else:
-                message.reply_text(f"Could not gban due to: {excp.message}")
-                if EVENT_LOGS:
-                    bot.send_message(
-                        EVENT_LOGS,
-                        f"Could not gban due to {excp.message}",
-                        parse_mode=ParseMode.HTML,
-                    )
-                else:
-                    send_to_list(
-                        bot, DRAGONS + DEMONS, f"Could not gban due to: {excp.message}"
-                    )
-                sql.ungban_user(user_id)
-                return
-        except TelegramError:
-            pass
-
-    if EVENT_LOGS:
-        log.edit_text(
-            log_message + f"\n<b>Chats affected:</b> <code>{gbanned_chats}</code>",
-            parse_mode=ParseMode.HTML,
-        )
-    else:
-        send_to_list(
-            bot,
-            DRAGONS + DEMONS,
-            f"Gban complete! (User banned in <code>{gbanned_chats}</code> chats)",
-            html=True,
-        )
+                send_to_list(
+                    bot, DRAGONS + DEMONS, f"Could not gban due to: {fanout.error}"
+                )
+            sql.ungban_user(user_id)
+            return
 
-    end_time = time.time()
-    gban_time = round((end_time - start_time), 2)
+        gbanned_chats = fanout.counts["banned"]
+        if EVENT_LOGS:
+            log.edit_text(
+                log_message
+                + f"\n<b>Chats affected:</b> <code>{gbanned_chats}</code>"
+                + _fanout_summary(fanout, "banned"),
+                parse_mode=ParseMode.HTML,
+            )
+        else:
+            send_to_list(
+                bot,
+                DRAGONS + DEMONS,
+                f"Gban complete! (User banned in <code>{gbanned_chats}</code> chats)",
+                html=True,
+            )
 
-    if gban_time > 60:
-        gban_time = round((gban_time / 60), 2)
-        message.reply_text("Done! Gbanned.", parse_mode=ParseMode.HTML)
-    else:
+        if fanout.cancelled:
+            message.reply_text(
+                "Gban stopped early, the user is still gbanned.",
+                parse_mode=ParseMode.HTML,
+            )
+            return
         message.reply_text("Done! Gbanned.", parse_mode=ParseMode.HTML)
 
-    try:
-        bot.send_message(
-            user_id,
-            "#EVENT"
-            "You have been marked as Malicious and as such have been banned from any future groups we manage."
-            f"\n<b>Reason:</b> <code>{html.escape(user.reason)}</code>"
-            f"</b>Appeal Chat:</b> @{SUPPORT_CHAT}",
-            parse_mode=ParseMode.HTML,
-        )
-    except:
-        pass  # bot probably blocked by user
+        try:
+            bot.send_message(
+                user_id,
+                "#EVENT"
+                "You have been marked as Malicious and as such have been banned from any future groups we manage."
+                f"\n<b>Reason:</b> <code>{html.escape(user.reason)}</code>"
+                f"</b>Appeal Chat:</b> @{SUPPORT_CHAT}",
+                parse_mode=ParseMode.HTML,
+            )
+        except:
+            pass  # bot probably blocked by user
+
+    _start_fanout(
+        user_id,
+        FanOut(
+            GBAN_POOL,
+            get_user_com_chats(user_id),
+            partial(_gban_in_chat, bot, user_id),
+            progress=progress,
+            on_done=done,
+        ),
+    )
 
 
 @support_plus
@@ -291,7 +373,6 @@ def ungban(update: Update, context: CallbackContext):
 
     message.reply_text(f"I'll give {user_chat.first_name} a second chance, globally.")
 
-    start_time = time.time()
     datetime_fmt = "%Y-%m-%dT%H:%M"
     current_time = datetime.utcnow().strftime(datetime_fmt)
 
@@ -321,59 +402,82 @@ def ungban(update: Update, context: CallbackContext):
     else:
         send_to_list(bot, DRAGONS + DEMONS, log_message, html=True)
 
-    chats = get_user_com_chats(user_id)
-    ungbanned_chats = 0
+    def progress(fanout):
+        if EVENT_LOGS:
+            log.edit_text(
+                log_message
+                + f"\n<b>Progress:</b> <code>{fanout.processed}/{fanout.total}</code>",
+                parse_mode=ParseMode.HTML,
+            )
 
-    for chat in chats:
-        chat_id = int(chat)
+    def done(fanout):
+        _forget_fanout(user_id, fanout)
+        if fanout.error:
+            message.reply_text(f"Could not un-gban due to: {fanout.error}")
+            if EVENT_LOGS:
+                bot.send_message(
+                    EVENT_LOGS,
+                    f"Could not un-gban due to: {fanout.error}",
+                    parse_mode=ParseMode.HTML,
+                )
+            else:
+                bot.send_message(OWNER_ID, f"Could not un-gban due to: {fanout.error}")
+            return
 
-        # Check if this group has disabled gbans
-        if not sql.does_chat_gban(chat_id):
-            continue
+        if fanout.cancelled:
+            message.reply_text("Un-gban stopped early, the user is still gbanned.")
+            return
 
-        try:
-            member = bot.get_chat_member(chat_id, user_id)
-            if member.status == "kicked":
-                bot.unban_chat_member(chat_id, user_id)
-                ungbanned_chats += 1
-
-        except BadRequest as excp:
-            if excp.message in UNGBAN_ERRORS:
-                pass
-            else:
-                message.reply_text(f"Could not un-gban due to: {excp.message}")
-                if EVENT_LOGS:
-                    bot.send_message(
-                        EVENT_LOGS,
-                        f"Could not un-gban due to: {excp.message}",
-                        parse_mode=ParseMode.HTML,
-                    )
-                else:
-                    bot.send_message(
-                        OWNER_ID, f"Could not un-gban due to: {excp.message}"
-                    )
-                return
-        except TelegramError:
-            pass
-
-    sql.ungban_user(user_id)
+        sql.ungban_user(user_id)
 
-    if EVENT_LOGS:
-        log.edit_text(
-            log_message + f"\n<b>Chats affected:</b> {ungbanned_chats}",
-            parse_mode=ParseMode.HTML,
+        ungbanned_chats = fanout.counts["unbanned"]
+        if EVENT_LOGS:
+            log.edit_text(
+                log_message
+                + f"\n<b>Chats affected:</b> {ungbanned_chats}"
+                + _fanout_summary(fanout, "unbanned"),
+                parse_mode=ParseMode.HTML,
+            )
+        else:
+            send_to_list(bot, DRAGONS + DEMONS, "un-gban complete!")
+
+        ungban_time = round(fanout.elapsed, 2)
+        if ungban_time > 60:
+            ungban_time = round((ungban_time / 60), 2)
+            message.reply_text(f"Person has been un-gbanned. Took {ungban_time} min")
+        else:
+            message.reply_text(f"Person has been un-gbanned. Took {ungban_time} sec")
+
+    _start_fanout(
+        user_id,
+        FanOut(
+            GBAN_POOL,
+            get_user_com_chats(user_id),
+            partial(_ungban_in_chat, bot, user_id),
+            progress=progress,
+            on_done=done,
+        ),
+    )
+
+
+@support_plus
+def cancel_gban(update: Update, context: CallbackContext):
+    message = update.effective_message
+    user_id = extract_user(message, context.args)
+    if not user_id:
+        message.reply_text(
+            "You don't seem to be referring to a user or the ID specified is incorrect.."
         )
-    else:
-        send_to_list(bot, DRAGONS + DEMONS, "un-gban complete!")
+        return
 
-    end_time = time.time()
-    ungban_time = round((end_time - start_time), 2)
+    with FANOUT_LOCK:
+        fanout = ACTIVE_FANOUTS.get(user_id)
+    if not fanout:
+        message.reply_text("There is no gban or un-gban running for this user.")
+        return
 
-    if ungban_time > 60:
-        ungban_time = round((ungban_time / 60), 2)
-        message.reply_text(f"Person has been un-gbanned. Took {ungban_time} min")
-    else:
-        message.reply_text(f"Person has been un-gbanned. Took {ungban_time} sec")
+    fanout.cancel()
+    message.reply_text(f"Stopping after {fanout.processed} of {fanout.total} chats.")
 
 
 @support_plus
@@ -422,13 +526,15 @@ def check_and_ban(update, user_id, should_message=True):
 def enforce_gban(update: Update, context: CallbackContext):
     # Not using @restrict handler to avoid spamming - just ignore if cant gban.
     bot = context.bot
+    if not sql.does_chat_gban(update.effective_chat.id):
+        return
     try:
-        restrict_permission = update.effective_chat.get_member(
-            bot.id
+        restrict_permission = get_bot_member(
+            update.effective_chat, bot.id
         ).can_restrict_members
     except Unauthorized:
         return
-    if sql.does_chat_gban(update.effective_chat.id) and restrict_permission:
+    if restrict_permission:
         user = update.effective_user
         chat = update.effective_chat
         msg = update.effective_message
@@ -507,6 +613,7 @@ def __chat_settings__(chat_id, user_id):
 
 GBAN_HANDLER = CommandHandler("gban", gban, run_async=True)
 UNGBAN_HANDLER = CommandHandler("ungban", ungban, run_async=True)
+CANCEL_GBAN_HANDLER = CommandHandler("cancelgban", cancel_gban, run_async=True)
 GBAN_LIST = CommandHandler("gbanlist", gbanlist, run_async=True)
 GBAN_STATUS = CommandHandler(
     "antispam", gbanstat, filters=Filters.chat_type.groups, run_async=True
@@ -517,11 +624,18 @@ GBAN_ENFORCER = MessageHandler(
 
 dispatcher.add_handler(GBAN_HANDLER)
 dispatcher.add_handler(UNGBAN_HANDLER)
+dispatcher.add_handler(CANCEL_GBAN_HANDLER)
 dispatcher.add_handler(GBAN_LIST)
 dispatcher.add_handler(GBAN_STATUS)
 
 __mod_name__ = "Aɴᴛɪ-Sᴘᴀᴍ​"
-__handlers__ = [GBAN_HANDLER, UNGBAN_HANDLER, GBAN_LIST, GBAN_STATUS]
+__handlers__ = [
+    GBAN_HANDLER,
+    UNGBAN_HANDLER,
+    CANCEL_GBAN_HANDLER,
+    GBAN_LIST,
+    GBAN_STATUS,
+]
 
 if STRICT_GBAN:  # enforce GBANS if this is set
     dispatcher.add_handler(GBAN_ENFORCER, GBAN_ENFORCE_GROUP)
@@ -1,5 +1,5 @@
 from functools import wraps
-from threading import RLock
+from threading import Event, RLock
 from time import perf_counter
 
 from cachetools import TTLCache
@@ -7,6 +7,8 @@ from telegram import Chat, ChatMember, ParseMode, Update
 from telegram.ext import CallbackContext
 
 from FallenRobot import (
+    ADMIN_CACHE_SIZE,
+    ADMIN_CACHE_TTL,
     DEL_CMDS,
     DEMONS,
     DEV_USERS,
@@ -17,9 +19,118 @@ from FallenRobot import (
     dispatcher,
 )
 
-# stores admemes in memory for 10 min.
-ADMIN_CACHE = TTLCache(maxsize=512, ttl=60 * 10, timer=perf_counter)
+# stores admemes in memory, 10 min by default.
+ADMIN_CACHE = TTLCache(
+    maxsize=ADMIN_CACHE_SIZE, ttl=ADMIN_CACHE_TTL, timer=perf_counter
+)
+# guards ADMIN_CACHE and ADMIN_LOADS only, never held during an API call
 THREAD_LOCK = RLock()
+# chat_id -> AdminLoad for lookups currently in flight
+ADMIN_LOADS = {}
+ADMIN_CACHE_STATS = {"hits": 0, "misses": 0, "loads": 0, "load_time": 0.0}
+
+
+class AdminLoad:
+    def __init__(self):
+        self.done = Event()
+        self.admins = None
+        self.error = None
+
+
+def get_chat_admins(chat_id: int) -> frozenset:
+    """
+    Ids of the chat's admins. Concurrent misses for the same chat share one
+    getChatAdministrators call, misses for other chats don't wait on it.
+    """
+    with THREAD_LOCK:
+        try:
+            admins = ADMIN_CACHE[chat_id]
+            ADMIN_CACHE_STATS["hits"] += 1
+            return admins
+        except KeyError:
+            ADMIN_CACHE_STATS["misses"] += 1
+
+        load = ADMIN_LOADS.get(chat_id)
+        leader = load is None
+        if leader:
+            load = ADMIN_LOADS[chat_id] = AdminLoad()
+
+    if not leader:
+        load.done.wait()
+        if load.error is not None:
+            raise load.error
+        return load.admins
+
+    start = perf_counter()
+    try:
+        chat_admins = dispatcher.bot.getChatAdministrators(chat_id)
+        load.admins = frozenset(x.user.id for x in chat_admins)
+    except Exception as excp:
+        load.error = excp
+        raise
+    finally:
+        with THREAD_LOCK:
+            if load.error is None:
+                ADMIN_CACHE[chat_id] = load.admins
+                ADMIN_CACHE_STATS["loads"] += 1
+                ADMIN_CACHE_STATS["load_time"] += perf_counter() - start
+            ADMIN_LOADS.pop(chat_id, None)
+        load.done.set()
+
+    return load.admins
+
+
+def set_admin_status(chat_id: int, user_id: int, is_admin: bool):
+    # only patches chats we already hold, a miss will fetch the full list
+    with THREAD_LOCK:
+        admins = ADMIN_CACHE.get(chat_id)
+        if admins is None or (user_id in admins) == is_admin:
+            return
+        if is_admin:
+            ADMIN_CACHE[chat_id] = admins | {user_id}
+        else:
+            ADMIN_CACHE[chat_id] = admins - {user_id}
+
+
+def invalidate_admin_cache(chat_id: int):
+    with THREAD_LOCK:
+        ADMIN_CACHE.pop(chat_id, None)
+
+
+def admin_cache_stats() -> dict:
+    with THREAD_LOCK:
+        stats = dict(ADMIN_CACHE_STATS, size=len(ADMIN_CACHE))
+    stats["avg_load_ms"] = (
+        stats["load_time"] / stats["loads"] * 1000 if stats["loads"] else 0.0
+    )
+    return stats
+
+
+# stores the bot's own ChatMember per chat; kept fresh by my_chat_member
+# updates, the ttl only matters if one of those is missed.
+BOT_MEMBER_CACHE = TTLCache(maxsize=16384, ttl=60 * 30, timer=perf_counter)
+BOT_MEMBER_LOCK = RLock()
+
+
+def get_bot_member(chat: Chat, bot_id: int = None) -> ChatMember:
+    with BOT_MEMBER_LOCK:
+        try:
+            return BOT_MEMBER_CACHE[chat.id]
+        except KeyError:
+            pass
+
+    bot_member = chat.get_member(bot_id or dispatcher.bot.id)
+    with BOT_MEMBER_LOCK:
+        BOT_MEMBER_CACHE[chat.id] = bot_member
+    return bot_member
+
+
+def set_bot_member(chat_id: int, bot_member: ChatMember = None):
+    with BOT_MEMBER_LOCK:
+        if bot_member is None or bot_member.status in ("left", "kicked"):
+            BOT_MEMBER_CACHE.pop(chat_id, None)
+        else:
+            BOT_MEMBER_CACHE[chat_id] = bot_member
 
 
 def is_whitelist_plus(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
@@ -44,19 +155,7 @@ def is_user_admin(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
     ):  # Count telegram and Group Anonymous as admin
         return True
     if not member:
-        with THREAD_LOCK:
-            # try to fetch from cache first.
-            try:
-                return user_id in ADMIN_CACHE[chat.id]
-            except KeyError:
-                # keyerror happend means cache is deleted,
-                # so query bot api again and return user status
-                # while saving it in cache for future useage...
-                chat_admins = dispatcher.bot.getChatAdministrators(chat.id)
-                admin_list = [x.user.id for x in chat_admins]
-                ADMIN_CACHE[chat.id] = admin_list
-
-                return user_id in admin_list
+        return user_id in get_chat_admins(chat.id)
     else:
         return member.status in ("administrator", "creator")
 
@@ -66,13 +165,13 @@ def is_bot_admin(chat: Chat, bot_id: int, bot_member: ChatMember = None) -> bool
         return True
 
     if not bot_member:
-        bot_member = chat.get_member(bot_id)
+        bot_member = get_bot_member(chat, bot_id)
 
     return bot_member.status in ("administrator", "creator")
 
 
 def can_delete(chat: Chat, bot_id: int) -> bool:
-    return chat.get_member(bot_id).can_delete_messages
+    return get_bot_member(chat, bot_id).can_delete_messages
 
 
 def is_user_ban_protected(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
@@ -301,7 +400,7 @@ def can_pin(func):
         else:
             cant_pin = f"I can't pin messages in <b>{update_chat_title}</b>!\nMake sure I'm admin and can pin messages there."
 
-        if chat.get_member(bot.id).can_pin_messages:
+        if get_bot_member(chat, bot.id).can_pin_messages:
             return func(update, context, *args, **kwargs)
         else:
             update.effective_message.reply_text(cant_pin, parse_mode=ParseMode.HTML)
@@ -325,7 +424,7 @@ def can_promote(func):
                 f"Make sure I'm admin there and can appoint new admins."
             )
 
-        if chat.get_member(bot.id).can_promote_members:
+        if get_bot_member(chat, bot.id).can_promote_members:
             return func(update, context, *args, **kwargs)
         else:
             update.effective_message.reply_text(cant_promote, parse_mode=ParseMode.HTML)
@@ -346,7 +445,7 @@ def can_restrict(func):
         else:
             cant_restrict = f"I can't restrict people in <b>{update_chat_title}</b>!\nMake sure I'm admin there and can restrict users."
 
-        if chat.get_member(bot.id).can_restrict_members:
+        if get_bot_member(chat, bot.id).can_restrict_members:
             return func(update, context, *args, **kwargs)
         else:
             update.effective_message.reply_text(
@@ -0,0 +1,95 @@
+import threading
+from collections import Counter
+from concurrent.futures import as_completed
+from time import monotonic
+
+from FallenRobot import LOGGER
+
+
+class FanOutAbort(Exception):
+    """Raised by a fan-out action to stop the remaining chats."""
+
+
+class FanOut:
+    """
+    Runs action(chat_id) for every chat on a shared thread pool.
+
+    The action returns an outcome string, which is kept per chat in
+    `outcomes` and tallied in `counts`. Raising FanOutAbort stops the chats
+    that haven't started yet and leaves the reason in `error`. progress()
+    is called at most every `interval` seconds while it runs and on_done()
+    once at the end, both with the FanOut itself.
+    """
+
+    def __init__(self, pool, chats, action, progress=None, on_done=None, interval=10):
+        self.pool = pool
+        self.chats = list(chats)
+        self.action = action
+        self.progress = progress
+        self.on_done = on_done
+        self.interval = interval
+        self.outcomes = {}
+        self.counts = Counter()
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._stop = threading.Event()
+
+    @property
+    def total(self):
+        return len(self.chats)
+
+    @property
+    def processed(self):
+        return len(self.outcomes)
+
+    @property
+    def cancelled(self):
+        return self._stop.is_set() and self.error is None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0
+        return (self.finished or monotonic()) - self.started
+
+    def cancel(self):
+        self._stop.set()
+
+    def _run_one(self, chat_id):
+        if self._stop.is_set():
+            return chat_id, "cancelled"
+        try:
+            return chat_id, self.action(chat_id)
+        except FanOutAbort as excp:
+            if self.error is None:
+                self.error = str(excp)
+            self._stop.set()
+            return chat_id, "aborted"
+        except Exception:
+            LOGGER.exception("Fan-out action failed in %s", chat_id)
+            return chat_id, "error"
+
+    def run(self):
+        self.started = last_report = monotonic()
+        futures = [self.pool.submit(self._run_one, chat_id) for chat_id in self.chats]
+        for future in as_completed(futures):
+            chat_id, outcome = future.result()
+            self.outcomes[chat_id] = outcome
+            self.counts[outcome] += 1
+
+            now = monotonic()
+            if self.progress and now - last_report >= self.interval:
+                last_report = now
+                try:
+                    self.progress(self)
+                except Exception:
+                    LOGGER.exception("Fan-out progress report failed")
+        self.finished = monotonic()
+
+        if self.on_done:
+            self.on_done(self)
+
+    def start(self):
+        """Run in a background thread and return straight away."""
+        threading.Thread(target=self.run, daemon=True).start()
@@ -3,12 +3,16 @@ from telegram import Update
 from telegram.ext import CommandHandler, Filters, MessageHandler, RegexHandler
 
 import FallenRobot.modules.sql.blacklistusers_sql as sql
-from FallenRobot import ALLOW_EXCL, DEMONS, DEV_USERS, DRAGONS, TIGERS, WOLVES
+from FallenRobot import DEMONS, DEV_USERS, DRAGONS, TIGERS, WOLVES
+from FallenRobot.modules.helper_funcs.parsed_message import (
+    CMD_STARTERS,
+    parsed_message,
+)
 
-if ALLOW_EXCL:
-    CMD_STARTERS = ("/", "!")
-else:
-    CMD_STARTERS = "/"
+
+def parse_command(message):
+    """(command, args) for a command addressed to this bot, else None."""
+    return parsed_message(message).command
 
 
 class AntiSpam:
@@ -57,7 +61,13 @@ class CustomCommandHandler(CommandHandler):
 
     def check_update(self, update):
         if isinstance(update, Update) and update.effective_message:
-            message = update.effective_message
+            parsed = parse_command(update.effective_message)
+            if parsed is None:
+                return None
+
+            command, args = parsed
+            if command not in self.command:
+                return None
 
             try:
                 user_id = update.effective_user.id
@@ -68,28 +78,15 @@ class CustomCommandHandler(CommandHandler):
                 if sql.is_user_blacklisted(user_id):
                     return False
 
-            if message.text and len(message.text) > 1:
-                fst_word = message.text.split(None, 1)[0]
-                if len(fst_word) > 1 and any(
-                    fst_word.startswith(start) for start in CMD_STARTERS
-                ):
-                    args = message.text.split()[1:]
-                    command = fst_word[1:].split("@")
-                    command.append(message.bot.username)
-                    if user_id == 1087968824:
-                        user_id = update.effective_chat.id
-                    if not (
-                        command[0].lower() in self.command
-                        and command[1].lower() == message.bot.username.lower()
-                    ):
-                        return None
-                    if SpamChecker.check_user(user_id):
-                        return None
-                    filter_result = self.filters(update)
-                    if filter_result:
-                        return args, filter_result
-                    else:
-                        return False
+            if user_id == 1087968824:
+                user_id = update.effective_chat.id
+            if SpamChecker.check_user(user_id):
+                return None
+            filter_result = self.filters(update)
+            if filter_result:
+                return list(args), filter_result
+            else:
+                return False
 
     def handle_update(self, update, dispatcher, check_result, context=None):
         if context:
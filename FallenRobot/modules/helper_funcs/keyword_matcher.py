@@ -0,0 +1,108 @@
+import re
+import threading
+
+from cachetools import LRUCache
+
+
+def keyword_pattern(keyword):
+    """The per-keyword pattern blacklists, filters and warn filters use."""
+    return r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
+
+
+class _CompiledKeywords:
+    def __init__(self, keywords):
+        self.keywords = keywords
+        # One zero-width lookahead per start position, one group per keyword.
+        # (?<!\w) / (?!\w) are the same boundaries as keyword_pattern(), and
+        # the alternation is tried in priority order, so at every position
+        # the first matching group is the highest priority keyword there.
+        self.scan = re.compile(
+            r"(?<!\w)(?="
+            + "|".join(r"({})(?!\w)".format(re.escape(k)) for k in keywords)
+            + ")",
+            flags=re.IGNORECASE,
+        )
+        self.singles = {}
+
+    def first(self, text):
+        best = None
+        for match in self.scan.finditer(text):
+            index = match.lastindex - 1
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return None if best is None else self.keywords[best]
+
+    def all(self, text):
+        if not self.scan.search(text):
+            return []
+        # Several keywords can start at the same position, so confirm each
+        # one; this only runs for messages that matched something.
+        found = []
+        for keyword in self.keywords:
+            single = self.singles.get(keyword)
+            if single is None:
+                single = self.singles[keyword] = re.compile(
+                    keyword_pattern(keyword), flags=re.IGNORECASE
+                )
+            if single.search(text):
+                found.append(keyword)
+        return found
+
+
+class KeywordMatcher:
+    """
+    Matches a message against every trigger of a chat with one compiled regex.
+    Results are the same as running re.search(keyword_pattern(k), text,
+    re.IGNORECASE) for each keyword in priority order. The compiled set is
+    kept per chat and rebuilt on first use after invalidate(chat_id).
+    """
+
+    def __init__(self, get_keywords, maxsize=4096):
+        # get_keywords(chat_id) -> keywords of that chat in priority order
+        self.get_keywords = get_keywords
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.RLock()
+        self._version = 0
+
+    def _compiled(self, chat_id):
+        chat_id = str(chat_id)
+        with self._lock:
+            compiled = self._cache.get(chat_id)
+            version = self._version
+        if compiled is not None:
+            return compiled
+
+        keywords = tuple(self.get_keywords(chat_id))
+        if not keywords:
+            return None
+        compiled = _CompiledKeywords(keywords)
+        with self._lock:
+            # don't cache a set that was changed while we were compiling it
+            if version == self._version:
+                self._cache[chat_id] = compiled
+        return compiled
+
+    def invalidate(self, chat_id=None):
+        """Drop the compiled set of chat_id, or of every chat if None."""
+        with self._lock:
+            if chat_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(str(chat_id), None)
+            self._version += 1
+
+    def first(self, chat_id, text):
+        """Highest priority keyword found in text, or None."""
+        compiled = self._compiled(chat_id)
+        if compiled is None or not text:
+            return None
+        return compiled.first(text)
+
+    def all(self, chat_id, text):
+        """Every keyword found in text, in priority order."""
+        compiled = self._compiled(chat_id)
+        if compiled is None or not text:
+            return []
+        return compiled.all(text)
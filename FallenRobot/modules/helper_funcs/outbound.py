@@ -0,0 +1,313 @@
+import functools
+import inspect
+import itertools
+import threading
+from bisect import insort
+from contextlib import contextmanager
+from time import monotonic
+
+from cachetools import LRUCache
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import ExtBot
+
+from FallenRobot import (
+    LOGGER,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_MAX_RETRIES,
+)
+
+# Lower runs first.
+MODERATION = 0
+REPLY = 1
+BULK = 2
+
+# Telegram asks for no more than about one message a second in a private chat.
+PRIVATE_RATE = 1.0
+PRIVATE_BURST = 3
+
+# Longest a bulk call may wait for its own chat before it is dropped, unless
+# it asked to wait. Replies and moderation always wait their turn.
+MAX_CHAT_WAIT = 1.0
+
+# Calls that only count against the global limit. Sends also use the
+# per-chat bucket, since that is what the per-group limit is about.
+MODERATION_METHODS = (
+    "delete_message",
+    "ban_chat_member",
+    "unban_chat_member",
+    "restrict_chat_member",
+    "promote_chat_member",
+    "ban_chat_sender_chat",
+    "unban_chat_sender_chat",
+    "pin_chat_message",
+    "unpin_chat_message",
+)
+EDIT_METHODS = (
+    "edit_message_text",
+    "edit_message_caption",
+    "edit_message_media",
+    "edit_message_reply_markup",
+)
+SEND_METHODS = (
+    "send_message",
+    "send_photo",
+    "send_audio",
+    "send_document",
+    "send_video",
+    "send_animation",
+    "send_voice",
+    "send_video_note",
+    "send_sticker",
+    "send_media_group",
+    "send_location",
+    "send_venue",
+    "send_contact",
+    "send_poll",
+    "send_dice",
+    "forward_message",
+    "copy_message",
+)
+
+_local = threading.local()
+
+
+class Throttled(TelegramError):
+    """A bulk call was dropped because its chat is out of sends for now."""
+
+    def __init__(self, chat_id, delay):
+        super().__init__(f"Too many requests to {chat_id}, retry in {delay:.0f}s")
+        self.chat_id = chat_id
+        self.retry_after = delay
+
+
+@contextmanager
+def outbound_priority(priority, wait=False):
+    """
+    Run the Bot API calls made inside the block at the given priority.
+
+    BULK calls that would wait more than MAX_CHAT_WAIT for their chat raise
+    Throttled, unless wait=True; background jobs with their own threads ask
+    for that. Other priorities always wait.
+    """
+    previous = getattr(_local, "priority", None), getattr(_local, "wait", False)
+    _local.priority = priority
+    _local.wait = wait
+    try:
+        yield
+    finally:
+        _local.priority, _local.wait = previous
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.paused_until = 0
+
+    def delay(self, now):
+        """Seconds until a token is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class OutboundQueue:
+    """
+    Admission queue in front of the Bot API.
+
+    A sending thread asks for a permit, waits until both the global bucket
+    and (for sends) its chat's bucket have a token, then makes the call
+    itself, so return values and errors reach the caller unchanged. Waiting
+    threads are served in priority order: a waiter only goes ahead of a
+    higher priority one when that one is held back by its own chat. Only
+    droppable (bulk) calls give up, see outbound_priority().
+    """
+
+    def __init__(self, global_rate, group_rate, maxsize=16384):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate
+        self.chats = LRUCache(maxsize=maxsize)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self.stats = {
+            "calls": 0,
+            "waited": 0,
+            "wait_time": 0.0,
+            "max_wait": 0.0,
+            "max_depth": 0,
+            "retry_after": 0,
+            "dropped": 0,
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(PRIVATE_RATE, PRIVATE_BURST)
+            else:
+                bucket = TokenBucket(self.group_rate / 60, self.group_rate)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    def _chat_delay(self, ticket, now):
+        _, _, chat_id, per_chat = ticket
+        if chat_id is None:
+            return 0
+        bucket = self._chat_bucket(chat_id)
+        if per_chat:
+            return bucket.delay(now)
+        return max(0, bucket.paused_until - now)
+
+    def _delay(self, ticket, now, chat_delay):
+        delay = max(self.global_bucket.delay(now), chat_delay)
+        if delay > 0:
+            return delay
+
+        for ahead in self._waiting:
+            if ahead is ticket:
+                return 0
+            # someone with a higher priority is ready, let it go first
+            if self._chat_delay(ahead, now) <= 0:
+                return 0.05
+        return 0
+
+    def acquire(self, chat_id, per_chat, priority, droppable):
+        ticket = (priority, next(self._seq), chat_id, per_chat)
+        start = monotonic()
+        with self._cond:
+            insort(self._waiting, ticket)
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._waiting))
+            try:
+                while True:
+                    now = monotonic()
+                    chat_delay = self._chat_delay(ticket, now)
+                    if droppable and now + chat_delay > start + MAX_CHAT_WAIT:
+                        self.stats["dropped"] += 1
+                        LOGGER.warning(
+                            "Dropped a bulk call to %s, its chat is throttled for %.0fs",
+                            chat_id,
+                            chat_delay,
+                        )
+                        raise Throttled(chat_id, chat_delay)
+                    delay = self._delay(ticket, now, chat_delay)
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                self.global_bucket.take()
+                if per_chat and chat_id is not None:
+                    self._chat_bucket(chat_id).take()
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+
+            waited = monotonic() - start
+            self.stats["calls"] += 1
+            if waited > 0.001:
+                self.stats["waited"] += 1
+                self.stats["wait_time"] += waited
+                self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+
+    def pause(self, chat_id, seconds):
+        with self._cond:
+            self.stats["retry_after"] += 1
+            until = monotonic() + seconds
+            bucket = (
+                self.global_bucket if chat_id is None else self._chat_bucket(chat_id)
+            )
+            bucket.paused_until = max(bucket.paused_until, until)
+            self._cond.notify_all()
+
+    def call(self, method, chat_id, per_chat, priority, droppable):
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            self.acquire(chat_id, per_chat, priority, droppable)
+            try:
+                return method()
+            except RetryAfter as excp:
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                LOGGER.warning(
+                    "Flood wait of %ss in %s, backing off", excp.retry_after, chat_id
+                )
+                self.pause(chat_id, excp.retry_after)
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["depth"] = len(self._waiting)
+        stats["avg_wait_ms"] = (
+            stats["wait_time"] / stats["waited"] * 1000 if stats["waited"] else 0
+        )
+        return stats
+
+
+OUTBOUND = OutboundQueue(OUTBOUND_GLOBAL_RATE, OUTBOUND_GROUP_RATE)
+
+
+def _chat_key(chat_id):
+    # "-100..." and -100... are the same chat and must share a bucket
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return chat_id  # @channelusername
+
+
+def _queued(name, per_chat, default_priority):
+    method = getattr(ExtBot, name)
+    # not always the first argument, edit_message_text takes text first
+    chat_arg = list(inspect.signature(method).parameters).index("chat_id") - 1
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        chat_id = kwargs.get("chat_id")
+        if chat_id is None and len(args) > chat_arg:
+            chat_id = args[chat_arg]
+        priority = getattr(_local, "priority", None)
+        if priority is None:
+            priority = default_priority
+        return OUTBOUND.call(
+            lambda: method(self, *args, **kwargs),
+            _chat_key(chat_id),
+            per_chat,
+            priority,
+            priority >= BULK and not getattr(_local, "wait", False),
+        )
+
+    return wrapper
+
+
+def _camel_case(name):
+    first, *rest = name.split("_")
+    return first + "".join(word.capitalize() for word in rest)
+
+
+class QueuedBot(ExtBot):
+    """ExtBot whose sends, edits and moderation calls go through OUTBOUND."""
+
+
+for _methods, _per_chat, _priority in (
+    (MODERATION_METHODS, False, MODERATION),
+    (EDIT_METHODS, False, REPLY),
+    (SEND_METHODS, True, REPLY),
+):
+    for _name in _methods:
+        _wrapper = _queued(_name, _per_chat, _priority)
+        setattr(QueuedBot, _name, _wrapper)
+        # Bot binds sendMessage = send_message and friends in its own class
+        # body, so the camelCase names need pointing at the wrapper as well.
+        # kickChatMember goes through ban_chat_member and is covered by it.
+        if hasattr(Bot, _camel_case(_name)):
+            setattr(QueuedBot, _camel_case(_name), _wrapper)
+del _methods, _per_chat, _priority, _name, _wrapper
+
+
+def outbound_stats():
+    return OUTBOUND.get_stats()
@@ -0,0 +1,100 @@
+import threading
+from functools import cached_property
+
+from cachetools import LRUCache
+from telegram import Message, MessageEntity
+
+from FallenRobot import ALLOW_EXCL
+
+if ALLOW_EXCL:
+    CMD_STARTERS = ("/", "!")
+else:
+    CMD_STARTERS = ("/",)
+
+MENTION_TYPES = [MessageEntity.TEXT_MENTION, MessageEntity.MENTION]
+
+# (chat id, message id) -> ParsedMessage of the messages being handled. Kept
+# here rather than on the Message, PTB objects don't take new attributes.
+PARSED = LRUCache(maxsize=1024)
+PARSED_LOCK = threading.Lock()
+
+
+class ParsedMessage:
+    """
+    Lazily computed view of a message that every handler group can share.
+    Each attribute is worked out on first access and then kept for the rest
+    of the update, so the text is only split and lowered once per message.
+    """
+
+    def __init__(self, message: Message):
+        self.message = message
+
+    @cached_property
+    def text(self):
+        """Text, caption or sticker emoji - same as extraction.extract_text."""
+        message = self.message
+        return (
+            message.text
+            or message.caption
+            or (message.sticker.emoji if message.sticker else None)
+        )
+
+    @cached_property
+    def lower_text(self):
+        return self.text.lower() if self.text else None
+
+    @cached_property
+    def tokens(self):
+        return self.message.text.split() if self.message.text else []
+
+    @cached_property
+    def fst_word(self):
+        return self.tokens[0] if self.tokens else None
+
+    @cached_property
+    def args(self):
+        return self.tokens[1:]
+
+    @cached_property
+    def command(self):
+        """
+        (command, args) when the message is a command addressed to this bot,
+        otherwise None.
+        """
+        fst_word = self.fst_word
+        if not fst_word or len(self.message.text) < 2 or len(fst_word) < 2:
+            return None
+        if not fst_word.startswith(CMD_STARTERS):
+            return None
+
+        command = fst_word[1:].split("@")
+        command.append(self.message.bot.username)
+        if command[1].lower() != self.message.bot.username.lower():
+            return None
+        return command[0].lower(), self.args
+
+    @cached_property
+    def entities(self):
+        """Entity -> text map, as returned by Message.parse_entities()."""
+        return self.message.parse_entities() if self.message.entities else {}
+
+    @cached_property
+    def mentions(self):
+        if not self.entities:
+            return {}
+        return {
+            ent: text
+            for ent, text in self.entities.items()
+            if ent.type in MENTION_TYPES
+        }
+
+
+def parsed_message(message: Message) -> ParsedMessage:
+    """Return the ParsedMessage of this message, creating it once."""
+    key = (message.chat_id, message.message_id)
+    with PARSED_LOCK:
+        parsed = PARSED.get(key)
+        # an edit of the message arrives as a new Message object
+        if parsed is None or parsed.message is not message:
+            parsed = PARSED[key] = ParsedMessage(message)
+        return parsed
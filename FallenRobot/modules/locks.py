@@ -3,7 +3,7 @@ import unicodedata as ud
 
 from telegram import ChatPermissions, MessageEntity, ParseMode, TelegramError
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, Filters, MessageHandler
+from telegram.ext import CommandHandler, Filters, MessageFilter, MessageHandler
 from telegram.utils.helpers import mention_html
 
 import FallenRobot.modules.sql.locks_sql as sql
@@ -352,6 +352,11 @@ def unlock(update, context) -> str:
     return ""
 
 
+class _HasLocks(MessageFilter):
+    def filter(self, message):
+        return sql.has_locks(message.chat_id)
+
+
 @user_not_admin
 def del_lockables(update, context):
     chat = update.effective_chat  # type: Optional[Chat]
@@ -360,34 +365,15 @@ def del_lockables(update, context):
     if is_approved(chat.id, user.id):
         return
     for lockable, filter in LOCK_TYPES.items():
-        if lockable == "rtl":
-            if sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
-                if message.caption:
-                    check = al_detect("{}".format(message.caption))
-                    if "ARABIC" in check:
-                        try:
-                            message.delete()
-                        except BadRequest as excp:
-                            if excp.message == "Message to delete not found":
-                                pass
-                            else:
-                                LOGGER.exception("ERROR in lockables")
-                        break
-                if message.text:
-                    check = al_detect("{}".format(message.text))
-                    if "ARABIC" in check:
-                        try:
-                            message.delete()
-                        except BadRequest as excp:
-                            if excp.message == "Message to delete not found":
-                                pass
-                            else:
-                                LOGGER.exception("ERROR in lockables")
-                        break
+        if not sql.is_locked(chat.id, lockable):
             continue
-        if lockable == "button":
-            if sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
-                if message.reply_markup and message.reply_markup.inline_keyboard:
+        if lockable == "rtl":
+            if message.caption:
+                check = al_detect("{}".format(message.caption))
+                if "ARABIC" in check:
+                    # only asked once a lock matches, most messages don't
+                    if not can_delete(chat, context.bot.id):
+                        return
                     try:
                         message.delete()
                     except BadRequest as excp:
@@ -396,10 +382,11 @@ def del_lockables(update, context):
                         else:
                             LOGGER.exception("ERROR in lockables")
                     break
-            continue
-        if lockable == "inline":
-            if sql.is_locked(chat.id, lockable) and can_delete(chat, context.bot.id):
-                if message and message.via_bot:
+            if message.text:
+                check = al_detect("{}".format(message.text))
+                if "ARABIC" in check:
+                    if not can_delete(chat, context.bot.id):
+                        return
                     try:
                         message.delete()
                     except BadRequest as excp:
@@ -409,11 +396,35 @@ def del_lockables(update, context):
                             LOGGER.exception("ERROR in lockables")
                     break
             continue
-        if (
-            filter(update)
-            and sql.is_locked(chat.id, lockable)
-            and can_delete(chat, context.bot.id)
-        ):
+        if lockable == "button":
+            if message.reply_markup and message.reply_markup.inline_keyboard:
+                if not can_delete(chat, context.bot.id):
+                    return
+                try:
+                    message.delete()
+                except BadRequest as excp:
+                    if excp.message == "Message to delete not found":
+                        pass
+                    else:
+                        LOGGER.exception("ERROR in lockables")
+                break
+            continue
+        if lockable == "inline":
+            if message and message.via_bot:
+                if not can_delete(chat, context.bot.id):
+                    return
+                try:
+                    message.delete()
+                except BadRequest as excp:
+                    if excp.message == "Message to delete not found":
+                        pass
+                    else:
+                        LOGGER.exception("ERROR in lockables")
+                break
+            continue
+        if filter(update):
+            if not can_delete(chat, context.bot.id):
+                return
             if lockable == "bots":
                 new_members = update.effective_message.new_chat_members
                 for new_mem in new_members:
@@ -600,7 +611,9 @@ dispatcher.add_handler(LOCKED_HANDLER)
 
 dispatcher.add_handler(
     MessageHandler(
-        Filters.all & Filters.chat_type.groups, del_lockables, run_async=True
+        Filters.all & Filters.chat_type.groups & _HasLocks(),
+        del_lockables,
+        run_async=True,
     ),
     PERM_GROUP,
 )
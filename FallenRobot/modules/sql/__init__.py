@@ -1,16 +1,205 @@
-from sqlalchemy import create_engine
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+from cachetools import LRUCache
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
-from FallenRobot import DB_URI
+from FallenRobot import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_URI,
+    SQL_PROFILE,
+    SQL_QUERY_BUDGET,
+)
 from FallenRobot import LOGGER as log
+from FallenRobot import WORKERS
 
 if DB_URI and DB_URI.startswith("postgres://"):
     DB_URI = DB_URI.replace("postgres://", "postgresql://", 1)
 
+POOL_STATS_LOCK = threading.Lock()
+POOL_STATS = {"checkouts": 0, "wait_time": 0.0, "max_wait": 0.0, "timeouts": 0}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long threads wait for a connection."""
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with POOL_STATS_LOCK:
+                POOL_STATS["timeouts"] += 1
+            raise
+        finally:
+            waited = perf_counter() - start
+            with POOL_STATS_LOCK:
+                POOL_STATS["checkouts"] += 1
+                POOL_STATS["wait_time"] += waited
+                POOL_STATS["max_wait"] = max(POOL_STATS["max_wait"], waited)
+
+
+PROFILE_LOCK = threading.Lock()
+# statement -> [executions, total time, slowest]
+STATEMENT_STATS = LRUCache(maxsize=500)
+# module -> [handler runs, queries, total time, slowest, slowest statement]
+MODULE_STATS = {}
+# update id -> queries run for it so far, across all the handlers it reached
+UPDATE_QUERIES = LRUCache(maxsize=1024)
+_PROFILE = threading.local()
+# off unless SQL_PROFILE is set or a dev starts it with /sqlstats, it takes
+# PROFILE_LOCK on every statement
+PROFILING = False
+
+
+class QueryTally:
+    """Queries run by one handler call, collected on its thread."""
+
+    __slots__ = ("module", "update_id", "queries", "time", "slowest", "statement")
+
+    def __init__(self, module, update_id):
+        self.module = module
+        self.update_id = update_id
+        self.queries = 0
+        self.time = 0.0
+        self.slowest = 0.0
+        self.statement = None
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:  # profiling was switched on mid-statement
+        return
+    elapsed = perf_counter() - starts.pop()
+    with PROFILE_LOCK:
+        stats = STATEMENT_STATS.get(statement)
+        if stats is None:
+            stats = STATEMENT_STATS[statement] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    tally = getattr(_PROFILE, "tally", None)
+    if tally is not None:
+        tally.queries += 1
+        tally.time += elapsed
+        if elapsed >= tally.slowest:
+            tally.slowest = elapsed
+            tally.statement = statement
+
+
+def _execute_failed(exception_context):
+    # after_cursor_execute doesn't run for a failed statement, don't leave its
+    # start time behind on the pooled connection
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def _record(tally):
+    with PROFILE_LOCK:
+        stats = MODULE_STATS.get(tally.module)
+        if stats is None:
+            stats = MODULE_STATS[tally.module] = [0, 0, 0.0, 0.0, None]
+        stats[0] += 1
+        stats[1] += tally.queries
+        stats[2] += tally.time
+        if tally.slowest > stats[3]:
+            stats[3] = tally.slowest
+            stats[4] = tally.statement
+
+        if not tally.queries or tally.update_id is None:
+            return
+        before = UPDATE_QUERIES.get(tally.update_id, 0)
+        total = UPDATE_QUERIES[tally.update_id] = before + tally.queries
+
+    # log each update once, from the handler that took it over budget
+    if SQL_QUERY_BUDGET and before <= SQL_QUERY_BUDGET < total:
+        log.warning(
+            "[PostgreSQL] Update %s ran %d queries, over the budget of %d "
+            "(%s: %d in %.1fms, slowest %.1fms: %.200s)",
+            tally.update_id,
+            total,
+            SQL_QUERY_BUDGET,
+            tally.module,
+            tally.queries,
+            tally.time * 1000,
+            tally.slowest * 1000,
+            " ".join(tally.statement.split()),
+        )
+
+
+def profiled(callback):
+    """Wrap a handler callback so the queries it runs are counted for /sqlstats."""
+    if getattr(callback, "__profiled__", False):
+        return callback
+    module = (getattr(callback, "__module__", None) or "unknown").rsplit(".", 1)[-1]
+
+    @wraps(callback)
+    def wrapper(update, context, *args, **kwargs):
+        if not PROFILING:
+            return callback(update, context, *args, **kwargs)
+        outer = getattr(_PROFILE, "tally", None)
+        tally = _PROFILE.tally = QueryTally(module, getattr(update, "update_id", None))
+        try:
+            return callback(update, context, *args, **kwargs)
+        finally:
+            _PROFILE.tally = outer
+            _record(tally)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def profile_handlers(dispatcher):
+    """
+    Wrap every handler registered so far so set_profiling() can count their
+    queries; call once all are added.
+    """
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            if hasattr(handler, "callback"):
+                handler.callback = profiled(handler.callback)
+
+
+def sql_stats(top=10) -> dict:
+    with PROFILE_LOCK:
+        modules = sorted(MODULE_STATS.items(), key=lambda m: m[1][2], reverse=True)
+        statements = sorted(
+            STATEMENT_STATS.items(), key=lambda s: s[1][1], reverse=True
+        )
+    return {"modules": modules[:top], "statements": statements[:top]}
+
+
+def reset_sql_stats():
+    with PROFILE_LOCK:
+        STATEMENT_STATS.clear()
+        MODULE_STATS.clear()
+        UPDATE_QUERIES.clear()
+
 
 def start() -> scoped_session:
-    engine = create_engine(DB_URI, client_encoding="utf8")
+    engine = create_engine(
+        DB_URI,
+        client_encoding="utf8",
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE or WORKERS + 4,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
     log.info("[PostgreSQL] Connecting to database......")
     BASE.metadata.bind = engine
     BASE.metadata.create_all(engine)
@@ -25,3 +214,83 @@ except Exception as e:
     exit()
 
 log.info("[PostgreSQL] Connection successful, session started.")
+
+PROFILE_LISTENERS = (
+    ("before_cursor_execute", _before_execute),
+    ("after_cursor_execute", _after_execute),
+    ("handle_error", _execute_failed),
+)
+
+
+def set_profiling(enabled):
+    """Start or stop counting queries for /sqlstats."""
+    global PROFILING
+    engine = SESSION.get_bind()
+    with PROFILE_LOCK:
+        if enabled == PROFILING:
+            return
+        PROFILING = enabled
+        for name, listener in PROFILE_LISTENERS:
+            if enabled:
+                event.listen(engine, name, listener)
+            else:
+                event.remove(engine, name, listener)
+
+
+def is_profiling():
+    return PROFILING
+
+
+set_profiling(SQL_PROFILE)
+
+_SCOPE = threading.local()
+
+
+@contextmanager
+def session_scope():
+    """
+    Unit of work on this thread's session: commits when the block ends,
+    rolls back if it raises, and always hands the connection back to the
+    pool. Nested scopes join the outermost one.
+    """
+    depth = getattr(_SCOPE, "depth", 0)
+    _SCOPE.depth = depth + 1
+    try:
+        yield SESSION()
+        if not depth:
+            SESSION.commit()
+    except BaseException:
+        if not depth:
+            SESSION.rollback()
+        raise
+    finally:
+        _SCOPE.depth = depth
+        if not depth:
+            SESSION.remove()
+
+
+def reset_session():
+    """Throw away this thread's session, e.g. after an unhandled error left
+    it in a failed transaction."""
+    try:
+        SESSION.remove()
+    except Exception:
+        log.exception("[PostgreSQL] Failed to reset session")
+
+
+def pool_stats() -> dict:
+    pool = SESSION.get_bind().pool
+    with POOL_STATS_LOCK:
+        stats = dict(POOL_STATS)
+    stats.update(
+        size=pool.size(),
+        checked_out=pool.checkedout(),
+        overflow=max(pool.overflow(), 0),
+        avg_wait_ms=(
+            stats["wait_time"] / stats["checkouts"] * 1000
+            if stats["checkouts"]
+            else 0.0
+        ),
+        max_wait_ms=stats["max_wait"] * 1000,
+    )
+    return stats
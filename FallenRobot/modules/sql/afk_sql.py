@@ -1,8 +1,10 @@
 import threading
+import time
 
 from sqlalchemy import BigInteger, Boolean, Column, UnicodeText
 
-from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql import BASE, SESSION, cache_bus
+from FallenRobot.modules.sql.users_sql import Users
 
 
 class AFK(BASE):
@@ -24,13 +26,52 @@ class AFK(BASE):
 AFK.__table__.create(checkfirst=True)
 INSERTION_LOCK = threading.RLock()
 
+
+class AfkUser:
+    __slots__ = ("user_id", "username", "first_name", "reason", "since")
+
+    def __init__(self, user_id, reason="", username=None, first_name=None, since=None):
+        self.user_id = user_id
+        self.reason = reason
+        self.username = username
+        self.first_name = first_name
+        # unix time they went away, None if it predates the last restart
+        self.since = since
+
+
+# Everyone who is AFK, by id and by lowercased username, so checking a
+# mention of someone who isn't away is a dict lookup.
 AFK_USERS = {}
+AFK_USERNAMES = {}
+_MISSING = object()
+
+
+def _index(afk_user):
+    AFK_USERS[afk_user.user_id] = afk_user
+    if afk_user.username:
+        AFK_USERNAMES[afk_user.username.lower()] = afk_user
+
+
+def _unindex(user_id):
+    afk_user = AFK_USERS.pop(user_id, _MISSING)
+    if afk_user is not _MISSING and afk_user.username:
+        if AFK_USERNAMES.get(afk_user.username.lower()) is afk_user:
+            del AFK_USERNAMES[afk_user.username.lower()]
+    return afk_user
 
 
 def is_afk(user_id):
     return user_id in AFK_USERS
 
 
+def get_afk(user_id):
+    return AFK_USERS.get(user_id)
+
+
+def get_afk_by_username(username):
+    return AFK_USERNAMES.get(username.lower())
+
+
 def check_afk_status(user_id):
     try:
         return SESSION.query(AFK).get(user_id)
@@ -38,33 +79,41 @@ def check_afk_status(user_id):
         SESSION.close()
 
 
-def set_afk(user_id, reason=""):
+def set_afk(user_id, reason="", username=None, first_name=None):
     with INSERTION_LOCK:
         curr = SESSION.query(AFK).get(user_id)
         if not curr:
             curr = AFK(user_id, reason, True)
         else:
             curr.is_afk = True
+            curr.reason = reason
 
-        AFK_USERS[user_id] = reason
+        _unindex(user_id)
+        _index(AfkUser(user_id, reason, username, first_name, time.time()))
 
         SESSION.add(curr)
         SESSION.commit()
+        cache_bus.publish("afk", user_id)
 
 
 def rm_afk(user_id):
+    # AFK_USERS mirrors the table, so the common "not afk" case never needs
+    # the lock or a query.
+    if user_id not in AFK_USERS:
+        return False
+
     with INSERTION_LOCK:
+        if _unindex(user_id) is _MISSING:  # lost a race
+            return False
+
         curr = SESSION.query(AFK).get(user_id)
         if curr:
-            if user_id in AFK_USERS:  # sanity check
-                del AFK_USERS[user_id]
-
             SESSION.delete(curr)
             SESSION.commit()
-            return True
-
-        SESSION.close()
-        return False
+            cache_bus.publish("afk", user_id)
+        else:
+            SESSION.close()
+        return True
 
 
 def toggle_afk(user_id, reason=""):
@@ -76,17 +125,54 @@ def toggle_afk(user_id, reason=""):
             curr.is_afk = False
         elif not curr.is_afk:
             curr.is_afk = True
+
+        _unindex(user_id)
+        if curr.is_afk:
+            _index(AfkUser(user_id, curr.reason, since=time.time()))
+
         SESSION.add(curr)
         SESSION.commit()
+        cache_bus.publish("afk", user_id)
 
 
 def __load_afk_users():
-    global AFK_USERS
+    global AFK_USERS, AFK_USERNAMES
     try:
-        all_afk = SESSION.query(AFK).all()
-        AFK_USERS = {user.user_id: user.reason for user in all_afk if user.is_afk}
+        AFK_USERS, AFK_USERNAMES = {}, {}
+        # the afk table doesn't keep usernames, users does
+        all_afk = (
+            SESSION.query(AFK, Users.username)
+            .outerjoin(Users, Users.user_id == AFK.user_id)
+            .filter(AFK.is_afk)
+            .all()
+        )
+        for user, username in all_afk:
+            _index(AfkUser(user.user_id, user.reason, username))
     finally:
         SESSION.close()
 
 
+def __reload_user(user_id):
+    if user_id is None:
+        __load_afk_users()
+        return
+    user_id = int(user_id)
+    try:
+        row = (
+            SESSION.query(AFK, Users.username)
+            .outerjoin(Users, Users.user_id == AFK.user_id)
+            .filter(AFK.user_id == user_id, AFK.is_afk)
+            .first()
+        )
+    finally:
+        SESSION.close()
+    with INSERTION_LOCK:
+        _unindex(user_id)
+        if row:
+            user, username = row
+            # when they went afk isn't stored, don't make it up
+            _index(AfkUser(user_id, user.reason, username))
+
+
 __load_afk_users()
+cache_bus.subscribe("afk", __reload_user)
@@ -1,12 +1,16 @@
 import threading
+from array import array
+from collections import OrderedDict
+from time import monotonic
 
 from sqlalchemy import BigInteger, Column, String, UnicodeText
 
+from FallenRobot import FLOOD_CHAT_FACTOR, FLOOD_WINDOW
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 DEF_COUNT = 1
 DEF_LIMIT = 0
-DEF_OBJ = (None, DEF_COUNT, DEF_LIMIT)
 
 
 class FloodControl(BASE):
@@ -44,7 +48,130 @@ FloodSettings.__table__.create(checkfirst=True)
 INSERTION_FLOOD_LOCK = threading.RLock()
 INSERTION_FLOOD_SETTINGS_LOCK = threading.RLock()
 
-CHAT_FLOOD = {}
+# Sliding window state of chats that had messages in the last FLOOD_WINDOW
+# seconds, least recently active first so idle chats can be dropped cheaply.
+FLOOD_WINDOWS = OrderedDict()
+FLOOD_WINDOWS_LOCK = threading.Lock()
+
+
+def __load_chat_flood(chat_id):
+    try:
+        flood = SESSION.query(FloodControl).get(chat_id)
+        return flood and flood.limit
+    finally:
+        SESSION.close()
+
+
+def __load_flood_limits():
+    try:
+        all_chats = SESSION.query(FloodControl).all()
+        return {chat.chat_id: chat.limit for chat in all_chats if chat.limit}
+    finally:
+        SESSION.close()
+
+
+def __load_chat_setting(chat_id):
+    try:
+        setting = SESSION.query(FloodSettings).get(chat_id)
+        return setting and (setting.flood_type, setting.value)
+    finally:
+        SESSION.close()
+
+
+def __load_flood_settings():
+    try:
+        all_settings = SESSION.query(FloodSettings).all()
+        return {
+            setting.chat_id: (setting.flood_type, setting.value)
+            for setting in all_settings
+        }
+    finally:
+        SESSION.close()
+
+
+def __limit_changed(chat_id):
+    with FLOOD_WINDOWS_LOCK:
+        if chat_id is None:
+            FLOOD_WINDOWS.clear()
+        else:
+            FLOOD_WINDOWS.pop(chat_id, None)
+
+
+# chat_id -> message limit, chats without antiflood aren't kept
+CHAT_FLOOD = ChatCache(
+    "antiflood",
+    __load_chat_flood,
+    __load_flood_limits,
+    topic="antiflood",
+    on_change=__limit_changed,
+)
+# chat_id -> (flood_type, value)
+CHAT_FLOOD_SETTINGS = ChatCache(
+    "antiflood_settings",
+    __load_chat_setting,
+    __load_flood_settings,
+    topic="antiflood_settings",
+)
+
+
+class _Ring:
+    """Timestamps of the last `size` messages, oldest at `pos`."""
+
+    __slots__ = ("times", "pos")
+
+    def __init__(self, size):
+        self.times = array("d", bytes(8 * size))
+        self.pos = 0
+
+    def push(self, now):
+        """Record a message, return the time of the one `size` messages ago."""
+        oldest = self.times[self.pos]
+        self.times[self.pos] = now
+        self.pos = (self.pos + 1) % len(self.times)
+        return oldest
+
+    def newest(self):
+        return self.times[self.pos - 1]
+
+    def count_since(self, since):
+        return sum(1 for t in self.times if t > since)
+
+
+class FloodWindow:
+    __slots__ = ("limit", "chat", "users", "prune_at", "last_seen")
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chat = _Ring(limit * FLOOD_CHAT_FACTOR) if FLOOD_CHAT_FACTOR else None
+        self.users = {}
+        self.prune_at = 64
+        self.last_seen = 0.0
+
+    def hit(self, user_id, now):
+        """Count a message, True if it takes the sender over the limit."""
+        self.last_seen = now
+        ring = self.users.get(user_id)
+        if ring is None:
+            if len(self.users) >= self.prune_at:
+                self.users = {
+                    uid: r
+                    for uid, r in self.users.items()
+                    if now - r.newest() < FLOOD_WINDOW
+                }
+                self.prune_at = max(64, 2 * len(self.users))
+            ring = self.users[user_id] = _Ring(self.limit)
+
+        flooded = now - ring.push(now) < FLOOD_WINDOW
+        if self.chat is not None and now - self.chat.push(now) < FLOOD_WINDOW:
+            # many accounts flooding together: act on the ones that sent at
+            # least half a user's limit of it, not on every regular of a busy
+            # chat who happened to say something twice
+            share = max(2, (self.limit + 1) // 2)
+            flooded = flooded or ring.count_since(now - FLOOD_WINDOW) >= share
+        if flooded:
+            # start over so one burst is only acted on once
+            del self.users[user_id]
+        return flooded
 
 
 def set_flood(chat_id, amount):
@@ -56,35 +183,46 @@ def set_flood(chat_id, amount):
         flood.user_id = None
         flood.limit = amount
 
-        CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, amount)
-
         SESSION.add(flood)
         SESSION.commit()
+        CHAT_FLOOD.set(chat_id, amount)
 
 
 def update_flood(chat_id: str, user_id) -> bool:
-    if str(chat_id) in CHAT_FLOOD:
-        curr_user_id, count, limit = CHAT_FLOOD.get(str(chat_id), DEF_OBJ)
-
-        if limit == 0:  # no antiflood
-            return False
-
-        if user_id != curr_user_id or user_id is None:  # other user
-            CHAT_FLOOD[str(chat_id)] = (user_id, DEF_COUNT, limit)
-            return False
+    """
+    Record a message from user_id, True if they sent more than the chat's
+    limit within FLOOD_WINDOW seconds, or they are one of the senders while
+    the chat as a whole gets more than FLOOD_CHAT_FACTOR times that and they
+    sent at least half their limit of it.
+    user_id None (admins) isn't counted.
+    """
+    if user_id is None:
+        return False
+    limit = CHAT_FLOOD.get(chat_id, DEF_LIMIT)
+    if not limit:  # no antiflood
+        return False
 
-        count += 1
-        if count > limit:  # too many msgs, kick
-            CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, limit)
-            return True
+    chat_id = str(chat_id)
+    now = monotonic()
+    with FLOOD_WINDOWS_LOCK:
+        window = FLOOD_WINDOWS.get(chat_id)
+        if window is None or window.limit != limit:
+            window = FLOOD_WINDOWS[chat_id] = FloodWindow(limit)
+        else:
+            FLOOD_WINDOWS.move_to_end(chat_id)
+        flooded = window.hit(user_id, now)
 
-        # default -> update
-        CHAT_FLOOD[str(chat_id)] = (user_id, count, limit)
-        return False
+        # drop chats that have been quiet for a whole window
+        while FLOOD_WINDOWS:
+            idle_id, idle = next(iter(FLOOD_WINDOWS.items()))
+            if now - idle.last_seen < FLOOD_WINDOW:
+                break
+            del FLOOD_WINDOWS[idle_id]
+    return flooded
 
 
 def get_flood_limit(chat_id):
-    return CHAT_FLOOD.get(str(chat_id), DEF_OBJ)[2]
+    return CHAT_FLOOD.get(chat_id, DEF_LIMIT)
 
 
 def set_flood_strength(chat_id, flood_type, value):
@@ -106,38 +244,26 @@ def set_flood_strength(chat_id, flood_type, value):
 
         SESSION.add(curr_setting)
         SESSION.commit()
+        CHAT_FLOOD_SETTINGS.set(chat_id, (int(flood_type), str(value)))
 
 
 def get_flood_setting(chat_id):
-    try:
-        setting = SESSION.query(FloodSettings).get(str(chat_id))
-        if setting:
-            return setting.flood_type, setting.value
-        else:
-            return 1, "0"
-
-    finally:
-        SESSION.close()
+    return CHAT_FLOOD_SETTINGS.get(chat_id, (1, "0"))
 
 
 def migrate_chat(old_chat_id, new_chat_id):
     with INSERTION_FLOOD_LOCK:
         flood = SESSION.query(FloodControl).get(str(old_chat_id))
         if flood:
-            CHAT_FLOOD[str(new_chat_id)] = CHAT_FLOOD.get(str(old_chat_id), DEF_OBJ)
             flood.chat_id = str(new_chat_id)
             SESSION.commit()
+        CHAT_FLOOD.migrate(old_chat_id, new_chat_id)
 
-        SESSION.close()
-
+    with INSERTION_FLOOD_SETTINGS_LOCK:
+        setting = SESSION.query(FloodSettings).get(str(old_chat_id))
+        if setting:
+            setting.chat_id = str(new_chat_id)
+            SESSION.commit()
 
-def __load_flood_settings():
-    global CHAT_FLOOD
-    try:
-        all_chats = SESSION.query(FloodControl).all()
-        CHAT_FLOOD = {chat.chat_id: (None, DEF_COUNT, chat.limit) for chat in all_chats}
-    finally:
         SESSION.close()
-
-
-__load_flood_settings()
+        CHAT_FLOOD_SETTINGS.migrate(old_chat_id, new_chat_id)
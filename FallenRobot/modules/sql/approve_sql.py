@@ -4,6 +4,7 @@ from sqlalchemy import Column, String
 from sqlalchemy.sql.sqltypes import BigInteger
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class Approvals(BASE):
@@ -24,18 +25,46 @@ Approvals.__table__.create(checkfirst=True)
 APPROVE_INSERTION_LOCK = threading.RLock()
 
 
+def __load_chat_approved(chat_id):
+    try:
+        return frozenset(
+            user_id
+            for (user_id,) in SESSION.query(Approvals.user_id).filter(
+                Approvals.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_approved_users():
+    try:
+        approved = {}
+        for approval in SESSION.query(Approvals).all():
+            approved.setdefault(approval.chat_id, set()).add(approval.user_id)
+        return {chat_id: frozenset(users) for chat_id, users in approved.items()}
+    finally:
+        SESSION.close()
+
+
+# chat_id -> frozenset of approved user ids, mirrors the approval table
+APPROVED_USERS = ChatCache(
+    "approve", __load_chat_approved, __load_approved_users, topic="approve"
+)
+
+
 def approve(chat_id, user_id):
     with APPROVE_INSERTION_LOCK:
         approve_user = Approvals(str(chat_id), user_id)
         SESSION.add(approve_user)
         SESSION.commit()
+        APPROVED_USERS.set(
+            chat_id, APPROVED_USERS.get(chat_id, frozenset()) | {user_id}
+        )
 
 
 def is_approved(chat_id, user_id):
-    try:
-        return SESSION.query(Approvals).get((str(chat_id), user_id))
-    finally:
-        SESSION.close()
+    return user_id in APPROVED_USERS.get(chat_id, ())
 
 
 def disapprove(chat_id, user_id):
@@ -44,6 +73,9 @@ def disapprove(chat_id, user_id):
         if disapprove_user:
             SESSION.delete(disapprove_user)
             SESSION.commit()
+            APPROVED_USERS.set(
+                chat_id, APPROVED_USERS.get(chat_id, frozenset()) - {user_id}
+            )
             return True
         else:
             SESSION.close()
@@ -60,3 +92,14 @@ def list_approved(chat_id):
         )
     finally:
         SESSION.close()
+
+
+def migrate_chat(old_chat_id, new_chat_id):
+    with APPROVE_INSERTION_LOCK:
+        approvals = (
+            SESSION.query(Approvals).filter(Approvals.chat_id == str(old_chat_id)).all()
+        )
+        for approval in approvals:
+            approval.chat_id = str(new_chat_id)
+        SESSION.commit()
+        APPROVED_USERS.migrate(old_chat_id, new_chat_id)
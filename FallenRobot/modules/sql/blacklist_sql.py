@@ -2,7 +2,9 @@ import threading
 
 from sqlalchemy import BigInteger, Column, String, UnicodeText, distinct, func
 
+from FallenRobot.modules.helper_funcs.keyword_matcher import KeywordMatcher
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class BlackListFilters(BASE):
@@ -48,8 +50,69 @@ BlacklistSettings.__table__.create(checkfirst=True)
 BLACKLIST_FILTER_INSERTION_LOCK = threading.RLock()
 BLACKLIST_SETTINGS_INSERTION_LOCK = threading.RLock()
 
-CHAT_BLACKLISTS = {}
-CHAT_SETTINGS_BLACKLISTS = {}
+
+def __load_chat_triggers(chat_id):
+    try:
+        return frozenset(
+            trigger
+            for (trigger,) in SESSION.query(BlackListFilters.trigger).filter(
+                BlackListFilters.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_chat_blacklists():
+    try:
+        blacklists = {}
+        all_filters = SESSION.query(BlackListFilters).all()
+        for x in all_filters:
+            blacklists.setdefault(x.chat_id, set()).add(x.trigger)
+        return {chat_id: frozenset(x) for chat_id, x in blacklists.items()}
+
+    finally:
+        SESSION.close()
+
+
+def __to_setting(x):
+    return {"blacklist_type": x.blacklist_type, "value": x.value}
+
+
+def __load_chat_setting(chat_id):
+    try:
+        setting = SESSION.query(BlacklistSettings).get(chat_id)
+        return setting and __to_setting(setting)
+    finally:
+        SESSION.close()
+
+
+def __load_chat_settings_blacklists():
+    try:
+        chats_settings = SESSION.query(BlacklistSettings).all()
+        return {x.chat_id: __to_setting(x) for x in chats_settings}
+
+    finally:
+        SESSION.close()
+
+
+BLACKLIST_MATCHER = KeywordMatcher(
+    lambda chat_id: sorted(get_chat_blacklist(chat_id), key=lambda x: (-len(x), x))
+)
+# chat_id -> frozenset of triggers
+CHAT_BLACKLISTS = ChatCache(
+    "blacklist",
+    __load_chat_triggers,
+    __load_chat_blacklists,
+    topic="blacklist",
+    on_change=BLACKLIST_MATCHER.invalidate,
+)
+CHAT_SETTINGS_BLACKLISTS = ChatCache(
+    "blacklist_settings",
+    __load_chat_setting,
+    __load_chat_settings_blacklists,
+    topic="blacklist_settings",
+)
 
 
 def add_to_blacklist(chat_id, trigger):
@@ -58,22 +121,20 @@ def add_to_blacklist(chat_id, trigger):
 
         SESSION.merge(blacklist_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
-        global CHAT_BLACKLISTS
-        if CHAT_BLACKLISTS.get(str(chat_id), set()) == set():
-            CHAT_BLACKLISTS[str(chat_id)] = {trigger}
-        else:
-            CHAT_BLACKLISTS.get(str(chat_id), set()).add(trigger)
+        CHAT_BLACKLISTS.set(
+            chat_id, CHAT_BLACKLISTS.get(chat_id, frozenset()) | {trigger}
+        )
 
 
 def rm_from_blacklist(chat_id, trigger):
     with BLACKLIST_FILTER_INSERTION_LOCK:
         blacklist_filt = SESSION.query(BlackListFilters).get((str(chat_id), trigger))
         if blacklist_filt:
-            if trigger in CHAT_BLACKLISTS.get(str(chat_id), set()):  # sanity check
-                CHAT_BLACKLISTS.get(str(chat_id), set()).remove(trigger)
-
             SESSION.delete(blacklist_filt)
             SESSION.commit()
+            CHAT_BLACKLISTS.set(
+                chat_id, CHAT_BLACKLISTS.get(chat_id, frozenset()) - {trigger}
+            )
             return True
 
         SESSION.close()
@@ -81,7 +142,11 @@ def rm_from_blacklist(chat_id, trigger):
 
 
 def get_chat_blacklist(chat_id):
-    return CHAT_BLACKLISTS.get(str(chat_id), set())
+    return CHAT_BLACKLISTS.get(chat_id, frozenset())
+
+
+def match_blacklist(chat_id, text):
+    return BLACKLIST_MATCHER.first(chat_id, text)
 
 
 def num_blacklist_filters():
@@ -120,7 +185,6 @@ def set_blacklist_strength(chat_id, blacklist_type, value):
     # 6 = tban
     # 7 = tmute
     with BLACKLIST_SETTINGS_INSERTION_LOCK:
-        global CHAT_SETTINGS_BLACKLISTS
         curr_setting = SESSION.query(BlacklistSettings).get(str(chat_id))
         if not curr_setting:
             curr_setting = BlacklistSettings(
@@ -129,56 +193,20 @@ def set_blacklist_strength(chat_id, blacklist_type, value):
 
         curr_setting.blacklist_type = int(blacklist_type)
         curr_setting.value = str(value)
-        CHAT_SETTINGS_BLACKLISTS[str(chat_id)] = {
-            "blacklist_type": int(blacklist_type),
-            "value": value,
-        }
 
         SESSION.add(curr_setting)
         SESSION.commit()
+        CHAT_SETTINGS_BLACKLISTS.set(
+            chat_id, {"blacklist_type": int(blacklist_type), "value": value}
+        )
 
 
 def get_blacklist_setting(chat_id):
-    try:
-        setting = CHAT_SETTINGS_BLACKLISTS.get(str(chat_id))
-        if setting:
-            return setting["blacklist_type"], setting["value"]
-        else:
-            return 1, "0"
-
-    finally:
-        SESSION.close()
-
-
-def __load_chat_blacklists():
-    global CHAT_BLACKLISTS
-    try:
-        chats = SESSION.query(BlackListFilters.chat_id).distinct().all()
-        for (chat_id,) in chats:  # remove tuple by ( ,)
-            CHAT_BLACKLISTS[chat_id] = []
-
-        all_filters = SESSION.query(BlackListFilters).all()
-        for x in all_filters:
-            CHAT_BLACKLISTS[x.chat_id] += [x.trigger]
-
-        CHAT_BLACKLISTS = {x: set(y) for x, y in CHAT_BLACKLISTS.items()}
-
-    finally:
-        SESSION.close()
-
-
-def __load_chat_settings_blacklists():
-    global CHAT_SETTINGS_BLACKLISTS
-    try:
-        chats_settings = SESSION.query(BlacklistSettings).all()
-        for x in chats_settings:  # remove tuple by ( ,)
-            CHAT_SETTINGS_BLACKLISTS[x.chat_id] = {
-                "blacklist_type": x.blacklist_type,
-                "value": x.value,
-            }
-
-    finally:
-        SESSION.close()
+    setting = CHAT_SETTINGS_BLACKLISTS.get(chat_id)
+    if setting:
+        return setting["blacklist_type"], setting["value"]
+    else:
+        return 1, "0"
 
 
 def migrate_chat(old_chat_id, new_chat_id):
@@ -191,7 +219,12 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
+        CHAT_BLACKLISTS.migrate(old_chat_id, new_chat_id)
 
-
-__load_chat_blacklists()
-__load_chat_settings_blacklists()
+    with BLACKLIST_SETTINGS_INSERTION_LOCK:
+        setting = SESSION.query(BlacklistSettings).get(str(old_chat_id))
+        if setting:
+            setting.chat_id = str(new_chat_id)
+            SESSION.commit()
+        SESSION.close()
+        CHAT_SETTINGS_BLACKLISTS.migrate(old_chat_id, new_chat_id)
@@ -2,7 +2,7 @@ import threading
 
 from sqlalchemy import Column, String, UnicodeText
 
-from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql import BASE, SESSION, cache_bus
 
 
 class BlacklistUsers(BASE):
@@ -31,7 +31,8 @@ def blacklist_user(user_id, reason=None):
 
         SESSION.add(user)
         SESSION.commit()
-        __load_blacklist_userid_list()
+        BLACKLIST_USERS.add(int(user_id))
+        cache_bus.publish("blacklist_user", user_id)
 
 
 def unblacklist_user(user_id):
@@ -41,7 +42,8 @@ def unblacklist_user(user_id):
             SESSION.delete(user)
 
         SESSION.commit()
-        __load_blacklist_userid_list()
+        BLACKLIST_USERS.discard(int(user_id))
+        cache_bus.publish("blacklist_user", user_id)
 
 
 def get_reason(user_id):
@@ -66,4 +68,20 @@ def __load_blacklist_userid_list():
         SESSION.close()
 
 
+def __reload_user(user_id):
+    if user_id is None:
+        __load_blacklist_userid_list()
+        return
+    try:
+        blacklisted = SESSION.query(BlacklistUsers).get(user_id) is not None
+    finally:
+        SESSION.close()
+    with BLACKLIST_LOCK:
+        if blacklisted:
+            BLACKLIST_USERS.add(int(user_id))
+        else:
+            BLACKLIST_USERS.discard(int(user_id))
+
+
 __load_blacklist_userid_list()
+cache_bus.subscribe("blacklist_user", __reload_user)
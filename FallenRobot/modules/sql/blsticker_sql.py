@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import BigInteger, Column, String, UnicodeText, distinct, func
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class StickersFilters(BASE):
@@ -48,8 +49,62 @@ StickerSettings.__table__.create(checkfirst=True)
 STICKERS_FILTER_INSERTION_LOCK = threading.RLock()
 STICKSET_FILTER_INSERTION_LOCK = threading.RLock()
 
-CHAT_STICKERS = {}
-CHAT_BLSTICK_BLACKLISTS = {}
+
+def __load_chat_stickers(chat_id):
+    try:
+        return frozenset(
+            trigger
+            for (trigger,) in SESSION.query(StickersFilters.trigger).filter(
+                StickersFilters.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_CHAT_STICKERS():
+    try:
+        stickers = {}
+        all_filters = SESSION.query(StickersFilters).all()
+        for x in all_filters:
+            stickers.setdefault(x.chat_id, set()).add(x.trigger)
+        return {chat_id: frozenset(x) for chat_id, x in stickers.items()}
+
+    finally:
+        SESSION.close()
+
+
+def __to_setting(x):
+    return {"blacklist_type": x.blacklist_type, "value": x.value}
+
+
+def __load_chat_setting(chat_id):
+    try:
+        setting = SESSION.query(StickerSettings).get(chat_id)
+        return setting and __to_setting(setting)
+    finally:
+        SESSION.close()
+
+
+def __load_chat_stickerset_blacklists():
+    try:
+        chats_settings = SESSION.query(StickerSettings).all()
+        return {x.chat_id: __to_setting(x) for x in chats_settings}
+
+    finally:
+        SESSION.close()
+
+
+# chat_id -> frozenset of blacklisted sticker set names
+CHAT_STICKERS = ChatCache(
+    "blsticker", __load_chat_stickers, __load_CHAT_STICKERS, topic="blsticker"
+)
+CHAT_BLSTICK_BLACKLISTS = ChatCache(
+    "blsticker_settings",
+    __load_chat_setting,
+    __load_chat_stickerset_blacklists,
+    topic="blsticker_settings",
+)
 
 
 def add_to_stickers(chat_id, trigger):
@@ -58,22 +113,18 @@ def add_to_stickers(chat_id, trigger):
 
         SESSION.merge(stickers_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
-        global CHAT_STICKERS
-        if CHAT_STICKERS.get(str(chat_id), set()) == set():
-            CHAT_STICKERS[str(chat_id)] = {trigger}
-        else:
-            CHAT_STICKERS.get(str(chat_id), set()).add(trigger)
+        CHAT_STICKERS.set(chat_id, CHAT_STICKERS.get(chat_id, frozenset()) | {trigger})
 
 
 def rm_from_stickers(chat_id, trigger):
     with STICKERS_FILTER_INSERTION_LOCK:
         stickers_filt = SESSION.query(StickersFilters).get((str(chat_id), trigger))
         if stickers_filt:
-            if trigger in CHAT_STICKERS.get(str(chat_id), set()):  # sanity check
-                CHAT_STICKERS.get(str(chat_id), set()).remove(trigger)
-
             SESSION.delete(stickers_filt)
             SESSION.commit()
+            CHAT_STICKERS.set(
+                chat_id, CHAT_STICKERS.get(chat_id, frozenset()) - {trigger}
+            )
             return True
 
         SESSION.close()
@@ -81,7 +132,7 @@ def rm_from_stickers(chat_id, trigger):
 
 
 def get_chat_stickers(chat_id):
-    return CHAT_STICKERS.get(str(chat_id), set())
+    return CHAT_STICKERS.get(chat_id, frozenset())
 
 
 def num_stickers_filters():
@@ -120,7 +171,6 @@ def set_blacklist_strength(chat_id, blacklist_type, value):
     # 6 = tban
     # 7 = tmute
     with STICKSET_FILTER_INSERTION_LOCK:
-        global CHAT_BLSTICK_BLACKLISTS
         curr_setting = SESSION.query(StickerSettings).get(str(chat_id))
         if not curr_setting:
             curr_setting = StickerSettings(
@@ -129,56 +179,20 @@ def set_blacklist_strength(chat_id, blacklist_type, value):
 
         curr_setting.blacklist_type = int(blacklist_type)
         curr_setting.value = str(value)
-        CHAT_BLSTICK_BLACKLISTS[str(chat_id)] = {
-            "blacklist_type": int(blacklist_type),
-            "value": value,
-        }
 
         SESSION.add(curr_setting)
         SESSION.commit()
+        CHAT_BLSTICK_BLACKLISTS.set(
+            chat_id, {"blacklist_type": int(blacklist_type), "value": value}
+        )
 
 
 def get_blacklist_setting(chat_id):
-    try:
-        setting = CHAT_BLSTICK_BLACKLISTS.get(str(chat_id))
-        if setting:
-            return setting["blacklist_type"], setting["value"]
-        else:
-            return 1, "0"
-
-    finally:
-        SESSION.close()
-
-
-def __load_CHAT_STICKERS():
-    global CHAT_STICKERS
-    try:
-        chats = SESSION.query(StickersFilters.chat_id).distinct().all()
-        for (chat_id,) in chats:  # remove tuple by ( ,)
-            CHAT_STICKERS[chat_id] = []
-
-        all_filters = SESSION.query(StickersFilters).all()
-        for x in all_filters:
-            CHAT_STICKERS[x.chat_id] += [x.trigger]
-
-        CHAT_STICKERS = {x: set(y) for x, y in CHAT_STICKERS.items()}
-
-    finally:
-        SESSION.close()
-
-
-def __load_chat_stickerset_blacklists():
-    global CHAT_BLSTICK_BLACKLISTS
-    try:
-        chats_settings = SESSION.query(StickerSettings).all()
-        for x in chats_settings:  # remove tuple by ( ,)
-            CHAT_BLSTICK_BLACKLISTS[x.chat_id] = {
-                "blacklist_type": x.blacklist_type,
-                "value": x.value,
-            }
-
-    finally:
-        SESSION.close()
+    setting = CHAT_BLSTICK_BLACKLISTS.get(chat_id)
+    if setting:
+        return setting["blacklist_type"], setting["value"]
+    else:
+        return 1, "0"
 
 
 def migrate_chat(old_chat_id, new_chat_id):
@@ -191,7 +205,4 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
-
-
-__load_CHAT_STICKERS()
-__load_chat_stickerset_blacklists()
+        CHAT_STICKERS.migrate(old_chat_id, new_chat_id)
@@ -0,0 +1,87 @@
+import threading
+
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, UnicodeText
+
+from FallenRobot.modules.sql import BASE, session_scope
+
+
+class Broadcasts(BASE):
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True)
+    text = Column(UnicodeText, nullable=False)
+    to_groups = Column(Boolean, default=True)
+    to_users = Column(Boolean, default=True)
+    # "chats", then "users", then "done"
+    stage = Column(String(8), default="chats")
+    # id of the last recipient handled in the current stage
+    last_key = Column(UnicodeText)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    # users who blocked or never started the bot, kept in the database
+    unreachable = Column(Integer, default=0)
+    removed = Column(Integer, default=0)
+    status_chat = Column(String(14))
+    status_message = Column(BigInteger)
+
+    def __init__(self, text, to_groups, to_users, status_chat, status_message):
+        self.text = text
+        self.to_groups = to_groups
+        self.to_users = to_users
+        self.stage = "chats" if to_groups else "users"
+        self.last_key = None
+        self.sent = 0
+        self.failed = 0
+        self.unreachable = 0
+        self.removed = 0
+        self.status_chat = str(status_chat)
+        self.status_message = status_message
+
+    def __repr__(self):
+        return "<Broadcast {} at {} {}>".format(self.id, self.stage, self.last_key)
+
+
+Broadcasts.__table__.create(checkfirst=True)
+
+BROADCAST_LOCK = threading.RLock()
+
+
+def new_broadcast(text, to_groups, to_users, status_chat, status_message):
+    with BROADCAST_LOCK, session_scope() as session:
+        broadcast = Broadcasts(text, to_groups, to_users, status_chat, status_message)
+        session.add(broadcast)
+        session.flush()
+        session.expunge(broadcast)
+        return broadcast
+
+
+def get_unfinished_broadcasts():
+    with session_scope() as session:
+        broadcasts = session.query(Broadcasts).filter(Broadcasts.stage != "done").all()
+        for broadcast in broadcasts:
+            session.expunge(broadcast)
+        return broadcasts
+
+
+def save_progress(broadcast):
+    """Store the stage, cursor and counters of a detached Broadcasts row."""
+    with BROADCAST_LOCK, session_scope() as session:
+        curr = session.query(Broadcasts).get(broadcast.id)
+        # gone, or stopped from another thread
+        if not curr or curr.stage == "done":
+            return False
+        curr.stage = broadcast.stage
+        curr.last_key = broadcast.last_key
+        curr.sent = broadcast.sent
+        curr.failed = broadcast.failed
+        curr.unreachable = broadcast.unreachable
+        curr.removed = broadcast.removed
+        return True
+
+
+def stop_broadcasts():
+    with BROADCAST_LOCK, session_scope() as session:
+        return (
+            session.query(Broadcasts)
+            .filter(Broadcasts.stage != "done")
+            .update({Broadcasts.stage: "done"}, synchronize_session=False)
+        )
@@ -0,0 +1,131 @@
+import json
+import select
+import threading
+import time
+import uuid
+from queue import Empty, SimpleQueue
+
+from sqlalchemy import text
+
+from FallenRobot import CACHE_SYNC, LOGGER
+from FallenRobot.modules.sql import SESSION
+
+# Keeps the in-memory caches of several bot processes sharing one database
+# in step over Postgres LISTEN/NOTIFY. A sql module calls publish(topic, key)
+# after committing a change and subscribe(topic, callback) to hear about the
+# changes other processes make. callback(key) gets the key as a string, or
+# None when the whole topic has to be reloaded because the listener had to
+# reconnect and may have missed some. Callbacks run on the listener thread.
+CHANNEL = "fallen_cache"
+# notifications are delivered to the sender too, this tells ours apart
+PROCESS_ID = uuid.uuid4().hex[:12]
+# Postgres rejects payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+
+ENABLED = bool(CACHE_SYNC) and SESSION.get_bind().dialect.name == "postgresql"
+
+SUBSCRIBERS = {}
+SUBSCRIBERS_LOCK = threading.Lock()
+_OUTBOX = SimpleQueue()
+_started = False
+
+
+def publish(topic, key=None):
+    """Tell the other processes that `key` under `topic` changed."""
+    if ENABLED:
+        _OUTBOX.put((topic, None if key is None else str(key)))
+
+
+def subscribe(topic, callback):
+    global _started
+    if not ENABLED:
+        return
+    with SUBSCRIBERS_LOCK:
+        SUBSCRIBERS.setdefault(topic, []).append(callback)
+        if not _started:
+            _started = True
+            threading.Thread(target=_listen, name="cache-listen", daemon=True).start()
+            threading.Thread(target=_send, name="cache-notify", daemon=True).start()
+
+
+def _payload(topic, key):
+    payload = json.dumps({"p": PROCESS_ID, "t": topic, "k": key})
+    if len(payload.encode()) > MAX_PAYLOAD:
+        # too long to name, have everyone reload the whole topic instead
+        payload = json.dumps({"p": PROCESS_ID, "t": topic, "k": None})
+    return payload
+
+
+def _send():
+    while True:
+        batch = {_OUTBOX.get(): None}
+        try:
+            while len(batch) < 500:
+                batch[_OUTBOX.get_nowait()] = None
+        except Empty:
+            pass
+
+        try:
+            engine = SESSION.get_bind()
+            with engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as conn:
+                for topic, key in batch:
+                    conn.execute(
+                        text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": CHANNEL, "payload": _payload(topic, key)},
+                    )
+        except Exception:
+            LOGGER.exception("[CacheBus] Failed to publish %d changes", len(batch))
+            for change in batch:
+                _OUTBOX.put(change)
+            time.sleep(5)
+
+
+def _deliver(topic, key):
+    with SUBSCRIBERS_LOCK:
+        callbacks = list(SUBSCRIBERS.get(topic, ()))
+    for callback in callbacks:
+        try:
+            callback(key)
+        except Exception:
+            LOGGER.exception("[CacheBus] Failed to apply %s change %s", topic, key)
+
+
+def _listen():
+    missed = False
+    while True:
+        conn = None
+        try:
+            # a connection of our own, kept out of the pool for good
+            raw = SESSION.get_bind().raw_connection()
+            raw.detach()
+            conn = getattr(raw, "dbapi_connection", None) or raw.connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("LISTEN " + CHANNEL)
+            LOGGER.info("[CacheBus] Listening for cache changes on %s", CHANNEL)
+
+            if missed:
+                with SUBSCRIBERS_LOCK:
+                    topics = list(SUBSCRIBERS)
+                for topic in topics:
+                    _deliver(topic, None)
+            missed = True
+
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    change = json.loads(conn.notifies.pop(0).payload)
+                    if change["p"] != PROCESS_ID:
+                        _deliver(change["t"], change["k"])
+        except Exception:
+            LOGGER.exception("[CacheBus] Listener failed, reconnecting")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(5)
@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from FallenRobot import SQL_CACHE_IDLE, SQL_CACHE_LAZY, SQL_CACHE_SIZE
+from FallenRobot.modules.sql import cache_bus
+
+_MISSING = object()
+
+# every ChatCache made, for /sqlstats
+CACHES = []
+CACHES_LOCK = threading.Lock()
+
+
+class ChatCache:
+    """
+    Per-chat (or per-user) copy of what a sql module reads on the hot path.
+
+    load(key) reads one chat from the database and returns its value, anything
+    empty (None, 0, an empty set...) meaning the chat has nothing stored;
+    load_all() returns {key: value} for every chat that has something.
+
+    Eager caches read the whole table once and answer every get() from memory
+    after that. Lazy caches load a chat on its first get() and keep the
+    `maxsize` most recently used, chats without rows included, dropping any
+    not used for `idle` seconds, so only active chats cost memory. Caches are
+    lazy when SQL_CACHE_LAZY is set, when given a maxsize, or when they have
+    no load_all.
+
+    Writers commit first, then call set(), discard() or refresh() so the cache
+    follows; with a topic the other processes hear about it over cache_bus.
+    on_change(key) runs whenever a key changes, with None for all of them, to
+    drop state derived from the values such as compiled keyword matchers.
+    Values are shared with readers, so replace them instead of editing them.
+    """
+
+    def __init__(
+        self,
+        name,
+        load,
+        load_all=None,
+        maxsize=None,
+        idle=None,
+        topic=None,
+        on_change=None,
+    ):
+        self.name = name
+        self.load = load
+        self.load_all = load_all
+        self.lazy = SQL_CACHE_LAZY or maxsize is not None or load_all is None
+        self.maxsize = (maxsize or SQL_CACHE_SIZE) if self.lazy else None
+        self.idle = (SQL_CACHE_IDLE if idle is None else idle) if self.lazy else 0
+        self.topic = topic
+        self.on_change = on_change
+        # lazy: key -> (value, last used), least recently used first
+        self._data = OrderedDict() if self.lazy else self.load_all()
+        self._lock = threading.RLock()
+        # bumped on every write so a load racing with it isn't cached
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with CACHES_LOCK:
+            CACHES.append(self)
+        if topic:
+            cache_bus.subscribe(topic, self._changed_elsewhere)
+
+    def get(self, key, default=None):
+        key = str(key)
+        with self._lock:
+            if not self.lazy:
+                self.hits += 1
+                return self._data.get(key, default)
+
+            now = monotonic()
+            entry = self._data.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._data[key] = (entry[0], now)
+                self._data.move_to_end(key)
+                self._evict(now)
+                return default if entry[0] is None else entry[0]
+            self.misses += 1
+            version = self._version
+
+        value = self.load(key) or None
+        with self._lock:
+            if version == self._version:
+                self._store(key, value)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def _evict(self, now):
+        data = self._data
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+            self.evictions += 1
+        if self.idle:
+            while data:
+                _, last_used = next(iter(data.values()))
+                if now - last_used < self.idle:
+                    break
+                data.popitem(last=False)
+                self.evictions += 1
+
+    def _store(self, key, value):
+        if not self.lazy:
+            if value:
+                self._data[key] = value
+            else:
+                self._data.pop(key, None)
+            return
+        now = monotonic()
+        self._data[key] = (value or None, now)
+        self._data.move_to_end(key)
+        self._evict(now)
+
+    def _changed(self, key, publish):
+        if self.on_change is not None:
+            self.on_change(key)
+        if publish and self.topic:
+            cache_bus.publish(self.topic, key)
+
+    def set(self, key, value):
+        """Store the committed value of `key`."""
+        key = str(key)
+        with self._lock:
+            self._version += 1
+            self._store(key, value)
+        self._changed(key, True)
+
+    def discard(self, key):
+        self.set(key, None)
+
+    def refresh(self, key, publish=True):
+        """Forget `key` so it is read from the database again."""
+        key = str(key)
+        if self.lazy:
+            with self._lock:
+                self._version += 1
+                self._data.pop(key, None)
+        else:
+            with self._lock:
+                self._version += 1
+            value = self.load(key)
+            with self._lock:
+                self._store(key, value)
+        self._changed(key, publish)
+
+    def migrate(self, old_key, new_key):
+        """Call after moving a chat's rows from old_key to new_key."""
+        self.refresh(old_key)
+        self.refresh(new_key)
+
+    def clear(self, publish=True):
+        """Drop everything, reloading the whole table if eager."""
+        if self.lazy:
+            with self._lock:
+                self._version += 1
+                self._data.clear()
+        else:
+            data = self.load_all()
+            with self._lock:
+                self._version += 1
+                self._data = data
+        self._changed(None, publish)
+
+    def _changed_elsewhere(self, key):
+        if key is None:
+            self.clear(publish=False)
+        else:
+            self.refresh(key, publish=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "mode": "lazy" if self.lazy else "eager",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def cache_stats() -> list:
+    with CACHES_LOCK:
+        caches = list(CACHES)
+    return [cache.stats() for cache in caches]
@@ -2,7 +2,8 @@ import threading
 
 from sqlalchemy import Boolean, Column, UnicodeText
 
-from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql import BASE, SESSION, cache_bus
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class CleanerBlueTextChatSettings(BASE):
@@ -44,8 +45,57 @@ CLEANER_CHAT_SETTINGS = threading.RLock()
 CLEANER_CHAT_LOCK = threading.RLock()
 CLEANER_GLOBAL_LOCK = threading.RLock()
 
-CLEANER_CHATS = {}
-GLOBAL_IGNORE_COMMANDS = set()
+
+def __load_chat(chat_id):
+    try:
+        setting = SESSION.query(CleanerBlueTextChatSettings).get(chat_id)
+        commands = frozenset(
+            command
+            for (command,) in SESSION.query(CleanerBlueTextChat.command).filter(
+                CleanerBlueTextChat.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+    if setting or commands:
+        return {
+            "setting": setting.is_enable if setting else False,
+            "commands": commands,
+        }
+
+
+def __load_cleaner_chats():
+    chats = {}
+    try:
+        for x in SESSION.query(CleanerBlueTextChatSettings).all():
+            chats.setdefault(x.chat_id, {"setting": False, "commands": set()})
+            chats[x.chat_id]["setting"] = x.is_enable
+    finally:
+        SESSION.close()
+
+    try:
+        for x in SESSION.query(CleanerBlueTextChat).all():
+            chats.setdefault(x.chat_id, {"setting": False, "commands": set()})
+            chats[x.chat_id]["commands"].add(x.command)
+    finally:
+        SESSION.close()
+
+    for chat in chats.values():
+        chat["commands"] = frozenset(chat["commands"])
+    return chats
+
+
+def __load_global_ignored():
+    try:
+        return {(x.command) for x in SESSION.query(CleanerBlueTextGlobal).all()}
+    finally:
+        SESSION.close()
+
+
+# chat_id -> {"setting": bool, "commands": frozenset of ignored commands}
+CLEANER_CHATS = ChatCache("cleaner", __load_chat, __load_cleaner_chats, topic="cleaner")
+GLOBAL_IGNORE_COMMANDS = __load_global_ignored()
+NO_CLEANER = {"setting": False, "commands": frozenset()}
 
 
 def set_cleanbt(chat_id, is_enable):
@@ -58,6 +108,9 @@ def set_cleanbt(chat_id, is_enable):
 
         SESSION.add(newcurr)
         SESSION.commit()
+        CLEANER_CHATS.set(
+            chat_id, dict(CLEANER_CHATS.get(chat_id, NO_CLEANER), setting=is_enable)
+        )
 
 
 def chat_ignore_command(chat_id, ignore):
@@ -66,17 +119,11 @@ def chat_ignore_command(chat_id, ignore):
         ignored = SESSION.query(CleanerBlueTextChat).get((str(chat_id), ignore))
 
         if not ignored:
-            if str(chat_id) not in CLEANER_CHATS:
-                CLEANER_CHATS.setdefault(
-                    str(chat_id),
-                    {"setting": False, "commands": set()},
-                )
-
-            CLEANER_CHATS[str(chat_id)]["commands"].add(ignore)
-
             ignored = CleanerBlueTextChat(str(chat_id), ignore)
             SESSION.add(ignored)
             SESSION.commit()
+            chat = CLEANER_CHATS.get(chat_id, NO_CLEANER)
+            CLEANER_CHATS.set(chat_id, dict(chat, commands=chat["commands"] | {ignore}))
             return True
         SESSION.close()
         return False
@@ -88,16 +135,12 @@ def chat_unignore_command(chat_id, unignore):
         unignored = SESSION.query(CleanerBlueTextChat).get((str(chat_id), unignore))
 
         if unignored:
-            if str(chat_id) not in CLEANER_CHATS:
-                CLEANER_CHATS.setdefault(
-                    str(chat_id),
-                    {"setting": False, "commands": set()},
-                )
-            if unignore in CLEANER_CHATS.get(str(chat_id)).get("commands"):
-                CLEANER_CHATS[str(chat_id)]["commands"].remove(unignore)
-
             SESSION.delete(unignored)
             SESSION.commit()
+            chat = CLEANER_CHATS.get(chat_id, NO_CLEANER)
+            CLEANER_CHATS.set(
+                chat_id, dict(chat, commands=chat["commands"] - {unignore})
+            )
             return True
 
         SESSION.close()
@@ -115,6 +158,7 @@ def global_ignore_command(command):
             ignored = CleanerBlueTextGlobal(str(command))
             SESSION.add(ignored)
             SESSION.commit()
+            cache_bus.publish("cleaner_global", command)
             return True
 
         SESSION.close()
@@ -130,8 +174,9 @@ def global_unignore_command(command):
             if command in GLOBAL_IGNORE_COMMANDS:
                 GLOBAL_IGNORE_COMMANDS.remove(command)
 
-            SESSION.delete(command)
+            SESSION.delete(unignored)
             SESSION.commit()
+            cache_bus.publish("cleaner_global", command)
             return True
 
         SESSION.close()
@@ -142,56 +187,33 @@ def is_command_ignored(chat_id, command):
     if command.lower() in GLOBAL_IGNORE_COMMANDS:
         return True
 
-    if str(chat_id) in CLEANER_CHATS:
-        if command.lower() in CLEANER_CHATS.get(str(chat_id)).get("commands"):
-            return True
-
-    return False
+    return command.lower() in CLEANER_CHATS.get(chat_id, NO_CLEANER)["commands"]
 
 
 def is_enabled(chat_id):
-    try:
-        resultcurr = SESSION.query(CleanerBlueTextChatSettings).get(str(chat_id))
-        if resultcurr:
-            return resultcurr.is_enable
-        return False  # default
-    finally:
-        SESSION.close()
+    return CLEANER_CHATS.get(chat_id, NO_CLEANER)["setting"]
 
 
 def get_all_ignored(chat_id):
-    if str(chat_id) in CLEANER_CHATS:
-        LOCAL_IGNORE_COMMANDS = CLEANER_CHATS.get(str(chat_id)).get("commands")
-    else:
-        LOCAL_IGNORE_COMMANDS = set()
+    LOCAL_IGNORE_COMMANDS = CLEANER_CHATS.get(chat_id, NO_CLEANER)["commands"]
 
     return GLOBAL_IGNORE_COMMANDS, LOCAL_IGNORE_COMMANDS
 
 
-def __load_cleaner_list():
+def __reload_global(command):
     global GLOBAL_IGNORE_COMMANDS
-    global CLEANER_CHATS
-
+    if command is None:
+        GLOBAL_IGNORE_COMMANDS = __load_global_ignored()
+        return
     try:
-        GLOBAL_IGNORE_COMMANDS = {
-            (x.command) for x in SESSION.query(CleanerBlueTextGlobal).all()
-        }
-    finally:
-        SESSION.close()
-
-    try:
-        for x in SESSION.query(CleanerBlueTextChatSettings).all():
-            CLEANER_CHATS.setdefault(x.chat_id, {"setting": False, "commands": set()})
-            CLEANER_CHATS[x.chat_id]["setting"] = x.is_enable
-    finally:
-        SESSION.close()
-
-    try:
-        for x in SESSION.query(CleanerBlueTextChat).all():
-            CLEANER_CHATS.setdefault(x.chat_id, {"setting": False, "commands": set()})
-            CLEANER_CHATS[x.chat_id]["commands"].add(x.command)
+        ignored = SESSION.query(CleanerBlueTextGlobal).get(command) is not None
     finally:
         SESSION.close()
+    with CLEANER_GLOBAL_LOCK:
+        if ignored:
+            GLOBAL_IGNORE_COMMANDS.add(command)
+        else:
+            GLOBAL_IGNORE_COMMANDS.discard(command)
 
 
-__load_cleaner_list()
+cache_bus.subscribe("cleaner_global", __reload_global)
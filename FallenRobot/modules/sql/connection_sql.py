@@ -5,6 +5,7 @@ from typing import Union
 from sqlalchemy import BigInteger, Boolean, Column, String, UnicodeText
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class ChatAccessConnectionSettings(BASE):
@@ -57,7 +58,37 @@ CHAT_ACCESS_LOCK = threading.RLock()
 CONNECTION_INSERTION_LOCK = threading.RLock()
 CONNECTION_HISTORY_LOCK = threading.RLock()
 
-HISTORY_CONNECT = {}
+
+def __to_history(x):
+    return {"chat_name": x.chat_name, "chat_id": x.chat_id}
+
+
+def __load_history(user_id):
+    try:
+        return {
+            x.conn_time: __to_history(x)
+            for x in SESSION.query(ConnectionHistory).filter(
+                ConnectionHistory.user_id == int(user_id)
+            )
+        }
+    finally:
+        SESSION.close()
+
+
+def __load_user_history():
+    try:
+        history = {}
+        for x in SESSION.query(ConnectionHistory).all():
+            history.setdefault(str(x.user_id), {})[x.conn_time] = __to_history(x)
+        return history
+    finally:
+        SESSION.close()
+
+
+# user_id -> {connect time: {"chat_name", "chat_id"}}, at most 5 per user
+HISTORY_CONNECT = ChatCache(
+    "connection_history", __load_history, __load_user_history, topic="connection"
+)
 
 
 def allow_connect_to_chat(chat_id: Union[str, int]) -> bool:
@@ -119,86 +150,40 @@ def disconnect(user_id):
 
 
 def add_history_conn(user_id, chat_id, chat_name):
-    global HISTORY_CONNECT
     with CONNECTION_HISTORY_LOCK:
         conn_time = int(time.time())
-        if HISTORY_CONNECT.get(int(user_id)):
-            counting = (
-                SESSION.query(ConnectionHistory.user_id)
-                .filter(ConnectionHistory.user_id == str(user_id))
-                .count()
+        history = dict(HISTORY_CONNECT.get(user_id, {}))
+        # reconnecting moves a chat to the top, otherwise the oldest go
+        # so that only the 5 most recent are kept
+        stale = [x for x in history if history[x]["chat_id"] == str(chat_id)]
+        if not stale:
+            stale = sorted(history)[:-4]
+        for x in stale:
+            delold = SESSION.query(ConnectionHistory).get(
+                (int(user_id), history.pop(x)["chat_id"])
             )
-            getchat_id = {}
-            for x in HISTORY_CONNECT[int(user_id)]:
-                getchat_id[HISTORY_CONNECT[int(user_id)][x]["chat_id"]] = x
-            if chat_id in getchat_id:
-                todeltime = getchat_id[str(chat_id)]
-                delold = SESSION.query(ConnectionHistory).get(
-                    (int(user_id), str(chat_id))
-                )
-                if delold:
-                    SESSION.delete(delold)
-                    HISTORY_CONNECT[int(user_id)].pop(todeltime)
-            elif counting >= 5:
-                todel = list(HISTORY_CONNECT[int(user_id)])
-                todel.reverse()
-                todel = todel[4:]
-                for x in todel:
-                    chat_old = HISTORY_CONNECT[int(user_id)][x]["chat_id"]
-                    delold = SESSION.query(ConnectionHistory).get(
-                        (int(user_id), str(chat_old))
-                    )
-                    if delold:
-                        SESSION.delete(delold)
-                        HISTORY_CONNECT[int(user_id)].pop(x)
-        else:
-            HISTORY_CONNECT[int(user_id)] = {}
-        delold = SESSION.query(ConnectionHistory).get((int(user_id), str(chat_id)))
-        if delold:
-            SESSION.delete(delold)
-        history = ConnectionHistory(int(user_id), str(chat_id), chat_name, conn_time)
-        SESSION.add(history)
+            if delold:
+                SESSION.delete(delold)
+        SESSION.flush()
+
+        history_row = ConnectionHistory(
+            int(user_id), str(chat_id), chat_name, conn_time
+        )
+        SESSION.add(history_row)
         SESSION.commit()
-        HISTORY_CONNECT[int(user_id)][conn_time] = {
-            "chat_name": chat_name,
-            "chat_id": str(chat_id),
-        }
+        history[conn_time] = {"chat_name": chat_name, "chat_id": str(chat_id)}
+        HISTORY_CONNECT.set(user_id, history)
 
 
 def get_history_conn(user_id):
-    if not HISTORY_CONNECT.get(int(user_id)):
-        HISTORY_CONNECT[int(user_id)] = {}
-    return HISTORY_CONNECT[int(user_id)]
+    return HISTORY_CONNECT.get(user_id, {})
 
 
 def clear_history_conn(user_id):
-    global HISTORY_CONNECT
-    todel = list(HISTORY_CONNECT[int(user_id)])
-    for x in todel:
-        chat_old = HISTORY_CONNECT[int(user_id)][x]["chat_id"]
-        delold = SESSION.query(ConnectionHistory).get((int(user_id), str(chat_old)))
-        if delold:
-            SESSION.delete(delold)
-            HISTORY_CONNECT[int(user_id)].pop(x)
-    SESSION.commit()
+    with CONNECTION_HISTORY_LOCK:
+        SESSION.query(ConnectionHistory).filter(
+            ConnectionHistory.user_id == int(user_id)
+        ).delete()
+        SESSION.commit()
+        HISTORY_CONNECT.discard(user_id)
     return True
-
-
-def __load_user_history():
-    global HISTORY_CONNECT
-    try:
-        qall = SESSION.query(ConnectionHistory).all()
-        HISTORY_CONNECT = {}
-        for x in qall:
-            check = HISTORY_CONNECT.get(x.user_id)
-            if check is None:
-                HISTORY_CONNECT[x.user_id] = {}
-            HISTORY_CONNECT[x.user_id][x.conn_time] = {
-                "chat_name": x.chat_name,
-                "chat_id": x.chat_id,
-            }
-    finally:
-        SESSION.close()
-
-
-__load_user_history()
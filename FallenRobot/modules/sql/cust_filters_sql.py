@@ -1,9 +1,12 @@
 import threading
 
+from cachetools import LRUCache
 from sqlalchemy import BigInteger, Boolean, Column, String, UnicodeText, distinct, func
 
+from FallenRobot.modules.helper_funcs.keyword_matcher import KeywordMatcher
 from FallenRobot.modules.helper_funcs.msg_types import Types
-from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql import BASE, SESSION, cache_bus
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class CustomFilters(BASE):
@@ -121,7 +124,58 @@ Buttons.__table__.create(checkfirst=True)
 
 CUST_FILT_LOCK = threading.RLock()
 BUTTON_LOCK = threading.RLock()
-CHAT_FILTERS = {}
+
+# (chat_id, keyword) -> CachedFilter, so a popular filter only hits the
+# database once until it is edited or removed.
+FILTER_CACHE = LRUCache(maxsize=2048)
+FILTER_CACHE_LOCK = threading.RLock()
+FILTER_CACHE_STATS = {"hits": 0, "misses": 0}
+_FILTER_CACHE_VERSION = 0
+
+FILTER_MATCHER = KeywordMatcher(lambda chat_id: get_chat_triggers(chat_id))
+
+
+def __sorted_triggers(keywords):
+    return tuple(sorted(set(keywords), key=lambda i: (-len(i), i)))
+
+
+def __load_chat_triggers(chat_id):
+    try:
+        return __sorted_triggers(
+            keyword
+            for (keyword,) in SESSION.query(CustomFilters.keyword).filter(
+                CustomFilters.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_chat_filters():
+    try:
+        filters = {}
+        all_filters = SESSION.query(CustomFilters.chat_id, CustomFilters.keyword)
+        for x in all_filters:
+            filters.setdefault(x.chat_id, []).append(x.keyword)
+        return {x: __sorted_triggers(y) for x, y in filters.items()}
+
+    finally:
+        SESSION.close()
+
+
+def __filters_changed(chat_id):
+    FILTER_MATCHER.invalidate(chat_id)
+    invalidate_cached_filter(chat_id)
+
+
+# chat_id -> triggers, longest first
+CHAT_FILTERS = ChatCache(
+    "filters",
+    __load_chat_triggers,
+    __load_chat_filters,
+    topic="filters",
+    on_change=__filters_changed,
+)
 
 
 def get_all_filters():
@@ -143,8 +197,6 @@ def add_filter(
     is_video=False,
     buttons=None,
 ):
-    global CHAT_FILTERS
-
     if buttons is None:
         buttons = []
 
@@ -174,22 +226,17 @@ def add_filter(
             bool(buttons),
         )
 
-        if keyword not in CHAT_FILTERS.get(str(chat_id), []):
-            CHAT_FILTERS[str(chat_id)] = sorted(
-                CHAT_FILTERS.get(str(chat_id), []) + [keyword],
-                key=lambda x: (-len(x), x),
-            )
-
         SESSION.add(filt)
         SESSION.commit()
+        CHAT_FILTERS.set(
+            chat_id, __sorted_triggers(CHAT_FILTERS.get(chat_id, ()) + (keyword,))
+        )
 
     for b_name, url, same_line in buttons:
         add_note_button_to_db(chat_id, keyword, b_name, url, same_line)
 
 
 def new_add_filter(chat_id, keyword, reply_text, file_type, file_id, buttons):
-    global CHAT_FILTERS
-
     if buttons is None:
         buttons = []
 
@@ -222,27 +269,20 @@ def new_add_filter(chat_id, keyword, reply_text, file_type, file_id, buttons):
             file_id=file_id,
         )
 
-        if keyword not in CHAT_FILTERS.get(str(chat_id), []):
-            CHAT_FILTERS[str(chat_id)] = sorted(
-                CHAT_FILTERS.get(str(chat_id), []) + [keyword],
-                key=lambda x: (-len(x), x),
-            )
-
         SESSION.add(filt)
         SESSION.commit()
+        CHAT_FILTERS.set(
+            chat_id, __sorted_triggers(CHAT_FILTERS.get(chat_id, ()) + (keyword,))
+        )
 
     for b_name, url, same_line in buttons:
         add_note_button_to_db(chat_id, keyword, b_name, url, same_line)
 
 
 def remove_filter(chat_id, keyword):
-    global CHAT_FILTERS
     with CUST_FILT_LOCK:
         filt = SESSION.query(CustomFilters).get((str(chat_id), keyword))
         if filt:
-            if keyword in CHAT_FILTERS.get(str(chat_id), []):  # Sanity check
-                CHAT_FILTERS.get(str(chat_id), []).remove(keyword)
-
             with BUTTON_LOCK:
                 prev_buttons = (
                     SESSION.query(Buttons)
@@ -254,6 +294,10 @@ def remove_filter(chat_id, keyword):
 
             SESSION.delete(filt)
             SESSION.commit()
+            CHAT_FILTERS.set(
+                chat_id,
+                tuple(k for k in CHAT_FILTERS.get(chat_id, ()) if k != keyword),
+            )
             return True
 
         SESSION.close()
@@ -261,7 +305,11 @@ def remove_filter(chat_id, keyword):
 
 
 def get_chat_triggers(chat_id):
-    return CHAT_FILTERS.get(str(chat_id), set())
+    return CHAT_FILTERS.get(chat_id, ())
+
+
+def match_filter(chat_id, text):
+    return FILTER_MATCHER.first(chat_id, text)
 
 
 def get_chat_filters(chat_id):
@@ -284,11 +332,66 @@ def get_filter(chat_id, keyword):
         SESSION.close()
 
 
+class CachedFilter:
+    """A filter row and its buttons; cust_filters memoises its reply on it."""
+
+    def __init__(self, filt, buttons):
+        self.filt = filt
+        self.buttons = buttons
+        self.keyboard = None
+        self.variants = None
+
+
+def get_cached_filter(chat_id, keyword):
+    key = (str(chat_id), keyword)
+    with FILTER_CACHE_LOCK:
+        cached = FILTER_CACHE.get(key)
+        if cached is not None:
+            FILTER_CACHE_STATS["hits"] += 1
+            return cached
+        FILTER_CACHE_STATS["misses"] += 1
+        version = _FILTER_CACHE_VERSION
+
+    filt = get_filter(chat_id, keyword)
+    if not filt:
+        return None
+    cached = CachedFilter(filt, get_buttons(chat_id, keyword))
+
+    with FILTER_CACHE_LOCK:
+        # an edit landed while we were reading, don't keep the stale copy
+        if version == _FILTER_CACHE_VERSION:
+            FILTER_CACHE[key] = cached
+    return cached
+
+
+def invalidate_cached_filter(chat_id=None, keyword=None):
+    global _FILTER_CACHE_VERSION
+    with FILTER_CACHE_LOCK:
+        _FILTER_CACHE_VERSION += 1
+        if chat_id is None:
+            FILTER_CACHE.clear()
+        elif keyword is not None:
+            FILTER_CACHE.pop((str(chat_id), keyword), None)
+        else:
+            for key in [k for k in FILTER_CACHE if k[0] == str(chat_id)]:
+                FILTER_CACHE.pop(key, None)
+
+
+def filter_cache_stats():
+    with FILTER_CACHE_LOCK:
+        hits, misses = FILTER_CACHE_STATS["hits"], FILTER_CACHE_STATS["misses"]
+        size = len(FILTER_CACHE)
+    total = hits + misses
+    return hits, misses, size, (hits / total * 100 if total else 0.0)
+
+
 def add_note_button_to_db(chat_id, keyword, b_name, url, same_line):
     with BUTTON_LOCK:
         button = Buttons(chat_id, keyword, b_name, url, same_line)
         SESSION.add(button)
         SESSION.commit()
+        invalidate_cached_filter(chat_id, keyword)
+        cache_bus.publish("filters", chat_id)
 
 
 def get_buttons(chat_id, keyword):
@@ -317,26 +420,6 @@ def num_chats():
         SESSION.close()
 
 
-def __load_chat_filters():
-    global CHAT_FILTERS
-    try:
-        chats = SESSION.query(CustomFilters.chat_id).distinct().all()
-        for (chat_id,) in chats:  # remove tuple by ( ,)
-            CHAT_FILTERS[chat_id] = []
-
-        all_filters = SESSION.query(CustomFilters).all()
-        for x in all_filters:
-            CHAT_FILTERS[x.chat_id] += [x.keyword]
-
-        CHAT_FILTERS = {
-            x: sorted(set(y), key=lambda i: (-len(i), i))
-            for x, y in CHAT_FILTERS.items()
-        }
-
-    finally:
-        SESSION.close()
-
-
 # ONLY USE FOR MIGRATE OLD FILTERS TO NEW FILTERS
 def __migrate_filters():
     try:
@@ -384,10 +467,6 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
-        old_filt = CHAT_FILTERS.get(str(old_chat_id))
-        if old_filt:
-            CHAT_FILTERS[str(new_chat_id)] = old_filt
-            del CHAT_FILTERS[str(old_chat_id)]
 
         with BUTTON_LOCK:
             chat_buttons = (
@@ -396,6 +475,4 @@ def migrate_chat(old_chat_id, new_chat_id):
             for btn in chat_buttons:
                 btn.chat_id = str(new_chat_id)
             SESSION.commit()
-
-
-__load_chat_filters()
+        CHAT_FILTERS.migrate(old_chat_id, new_chat_id)
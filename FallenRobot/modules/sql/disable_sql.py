@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import Column, String, UnicodeText, distinct, func
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class Disable(BASE):
@@ -21,7 +22,35 @@ class Disable(BASE):
 Disable.__table__.create(checkfirst=True)
 DISABLE_INSERTION_LOCK = threading.RLock()
 
-DISABLED = {}
+
+def __load_chat_commands(chat_id):
+    try:
+        return frozenset(
+            command
+            for (command,) in SESSION.query(Disable.command).filter(
+                Disable.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_disabled_commands():
+    try:
+        disabled = {}
+        all_chats = SESSION.query(Disable).all()
+        for chat in all_chats:
+            disabled.setdefault(chat.chat_id, set()).add(chat.command)
+        return {chat_id: frozenset(cmds) for chat_id, cmds in disabled.items()}
+
+    finally:
+        SESSION.close()
+
+
+# chat_id -> frozenset of disabled commands
+DISABLED = ChatCache(
+    "disable", __load_chat_commands, __load_disabled_commands, topic="disable"
+)
 
 
 def disable_command(chat_id, disable):
@@ -29,11 +58,10 @@ def disable_command(chat_id, disable):
         disabled = SESSION.query(Disable).get((str(chat_id), disable))
 
         if not disabled:
-            DISABLED.setdefault(str(chat_id), set()).add(disable)
-
             disabled = Disable(str(chat_id), disable)
             SESSION.add(disabled)
             SESSION.commit()
+            DISABLED.set(chat_id, DISABLED.get(chat_id, frozenset()) | {disable})
             return True
 
         SESSION.close()
@@ -45,11 +73,9 @@ def enable_command(chat_id, enable):
         disabled = SESSION.query(Disable).get((str(chat_id), enable))
 
         if disabled:
-            if enable in DISABLED.get(str(chat_id)):  # sanity check
-                DISABLED.setdefault(str(chat_id), set()).remove(enable)
-
             SESSION.delete(disabled)
             SESSION.commit()
+            DISABLED.set(chat_id, DISABLED.get(chat_id, frozenset()) - {enable})
             return True
 
         SESSION.close()
@@ -57,11 +83,11 @@ def enable_command(chat_id, enable):
 
 
 def is_command_disabled(chat_id, cmd):
-    return str(cmd).lower() in DISABLED.get(str(chat_id), set())
+    return str(cmd).lower() in DISABLED.get(chat_id, ())
 
 
 def get_all_disabled(chat_id):
-    return DISABLED.get(str(chat_id), set())
+    return DISABLED.get(chat_id, frozenset())
 
 
 def num_chats():
@@ -85,21 +111,5 @@ def migrate_chat(old_chat_id, new_chat_id):
             chat.chat_id = str(new_chat_id)
             SESSION.add(chat)
 
-        if str(old_chat_id) in DISABLED:
-            DISABLED[str(new_chat_id)] = DISABLED.get(str(old_chat_id), set())
-
         SESSION.commit()
-
-
-def __load_disabled_commands():
-    global DISABLED
-    try:
-        all_chats = SESSION.query(Disable).all()
-        for chat in all_chats:
-            DISABLED.setdefault(chat.chat_id, set()).add(chat.command)
-
-    finally:
-        SESSION.close()
-
-
-__load_disabled_commands()
+        DISABLED.migrate(old_chat_id, new_chat_id)
@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import BigInteger, Boolean, Column, String, UnicodeText
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class GloballyBannedUsers(BASE):
@@ -41,8 +42,50 @@ GbanSettings.__table__.create(checkfirst=True)
 
 GBANNED_USERS_LOCK = threading.RLock()
 GBAN_SETTING_LOCK = threading.RLock()
-GBANNED_LIST = set()
-GBANSTAT_LIST = set()
+
+
+def __load_gbanned_user(user_id):
+    try:
+        return SESSION.query(GloballyBannedUsers).get(int(user_id)) is not None
+    finally:
+        SESSION.close()
+
+
+def __load_gbanned_userid_list():
+    try:
+        return {
+            str(user_id): True
+            for (user_id,) in SESSION.query(GloballyBannedUsers.user_id)
+        }
+    finally:
+        SESSION.close()
+
+
+def __load_gban_stat(chat_id):
+    try:
+        chat = SESSION.query(GbanSettings).get(chat_id)
+        return chat is not None and not chat.setting
+    finally:
+        SESSION.close()
+
+
+def __load_gban_stat_list():
+    try:
+        return {
+            x.chat_id: True for x in SESSION.query(GbanSettings).all() if not x.setting
+        }
+    finally:
+        SESSION.close()
+
+
+# user_id -> True for gbanned users
+GBANNED_LIST = ChatCache(
+    "gban", __load_gbanned_user, __load_gbanned_userid_list, topic="gban"
+)
+# chat_id -> True for chats that turned gbans off
+GBANSTAT_LIST = ChatCache(
+    "gban_setting", __load_gban_stat, __load_gban_stat_list, topic="gban_setting"
+)
 
 
 def gban_user(user_id, name, reason=None):
@@ -56,7 +99,7 @@ def gban_user(user_id, name, reason=None):
 
         SESSION.merge(user)
         SESSION.commit()
-        __load_gbanned_userid_list()
+        GBANNED_LIST.set(user_id, True)
 
 
 def update_gban_reason(user_id, name, reason=None):
@@ -80,7 +123,7 @@ def ungban_user(user_id):
             SESSION.delete(user)
 
         SESSION.commit()
-        __load_gbanned_userid_list()
+        GBANNED_LIST.discard(user_id)
 
 
 def is_user_gbanned(user_id):
@@ -110,8 +153,7 @@ def enable_gbans(chat_id):
         chat.setting = True
         SESSION.add(chat)
         SESSION.commit()
-        if str(chat_id) in GBANSTAT_LIST:
-            GBANSTAT_LIST.remove(str(chat_id))
+        GBANSTAT_LIST.discard(chat_id)
 
 
 def disable_gbans(chat_id):
@@ -123,31 +165,16 @@ def disable_gbans(chat_id):
         chat.setting = False
         SESSION.add(chat)
         SESSION.commit()
-        GBANSTAT_LIST.add(str(chat_id))
+        GBANSTAT_LIST.set(chat_id, True)
 
 
 def does_chat_gban(chat_id):
-    return str(chat_id) not in GBANSTAT_LIST
+    return chat_id not in GBANSTAT_LIST
 
 
 def num_gbanned_users():
-    return len(GBANNED_LIST)
-
-
-def __load_gbanned_userid_list():
-    global GBANNED_LIST
     try:
-        GBANNED_LIST = {x.user_id for x in SESSION.query(GloballyBannedUsers).all()}
-    finally:
-        SESSION.close()
-
-
-def __load_gban_stat_list():
-    global GBANSTAT_LIST
-    try:
-        GBANSTAT_LIST = {
-            x.chat_id for x in SESSION.query(GbanSettings).all() if not x.setting
-        }
+        return SESSION.query(GloballyBannedUsers).count()
     finally:
         SESSION.close()
 
@@ -160,8 +187,4 @@ def migrate_chat(old_chat_id, new_chat_id):
             SESSION.add(chat)
 
         SESSION.commit()
-
-
-# Create in memory userid to avoid disk access
-__load_gbanned_userid_list()
-__load_gban_stat_list()
+        GBANSTAT_LIST.migrate(old_chat_id, new_chat_id)
@@ -4,6 +4,7 @@ import threading
 from sqlalchemy import Boolean, Column, String
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class Permissions(BASE):
@@ -82,6 +83,74 @@ Restrictions.__table__.create(checkfirst=True)
 PERM_LOCK = threading.RLock()
 RESTR_LOCK = threading.RLock()
 
+# Bit positions for the per-chat masks below; names match the column names.
+PERM_FIELDS = (
+    "audio",
+    "voice",
+    "contact",
+    "video",
+    "document",
+    "photo",
+    "sticker",
+    "gif",
+    "url",
+    "bots",
+    "forward",
+    "game",
+    "location",
+    "rtl",
+    "button",
+    "egame",
+    "inline",
+)
+RESTR_FIELDS = ("messages", "media", "other", "preview")
+PERM_BITS = {field: 1 << i for i, field in enumerate(PERM_FIELDS)}
+RESTR_BITS = {field: 1 << i for i, field in enumerate(RESTR_FIELDS)}
+RESTR_BITS["previews"] = RESTR_BITS["preview"]
+RESTR_BITS["all"] = sum(1 << i for i in range(len(RESTR_FIELDS)))
+
+
+def __to_mask(row, fields):
+    mask = 0
+    for i, field in enumerate(fields):
+        if getattr(row, field):
+            mask |= 1 << i
+    return mask
+
+
+def __mask_loaders(table, fields):
+    def load_chat(chat_id):
+        try:
+            row = SESSION.query(table).get(chat_id)
+            return __to_mask(row, fields) if row else 0
+        finally:
+            SESSION.close()
+
+    def load_all():
+        try:
+            return {
+                row.chat_id: mask
+                for row in SESSION.query(table).all()
+                if (mask := __to_mask(row, fields))
+            }
+        finally:
+            SESSION.close()
+
+    return load_chat, load_all
+
+
+# chat_id -> bitmask; chats with nothing locked are not stored at all
+CHAT_LOCKS = ChatCache(
+    "locks", *__mask_loaders(Permissions, PERM_FIELDS), topic="locks"
+)
+CHAT_RESTRICTIONS = ChatCache(
+    "restrictions", *__mask_loaders(Restrictions, RESTR_FIELDS), topic="restrictions"
+)
+
+
+def __cache_mask(cache, chat_id, row, fields):
+    cache.set(chat_id, __to_mask(row, fields) if row else 0)
+
 
 def init_permissions(chat_id, reset=False):
     curr_perm = SESSION.query(Permissions).get(str(chat_id))
@@ -91,6 +160,7 @@ def init_permissions(chat_id, reset=False):
     perm = Permissions(str(chat_id))
     SESSION.add(perm)
     SESSION.commit()
+    CHAT_LOCKS.discard(chat_id)
     return perm
 
 
@@ -102,6 +172,7 @@ def init_restrictions(chat_id, reset=False):
     restr = Restrictions(str(chat_id))
     SESSION.add(restr)
     SESSION.commit()
+    CHAT_RESTRICTIONS.discard(chat_id)
     return restr
 
 
@@ -148,6 +219,7 @@ def update_lock(chat_id, lock_type, locked):
 
         SESSION.add(curr_perm)
         SESSION.commit()
+        __cache_mask(CHAT_LOCKS, chat_id, curr_perm, PERM_FIELDS)
 
 
 def update_restriction(chat_id, restr_type, locked):
@@ -171,73 +243,25 @@ def update_restriction(chat_id, restr_type, locked):
             curr_restr.preview = locked
         SESSION.add(curr_restr)
         SESSION.commit()
+        __cache_mask(CHAT_RESTRICTIONS, chat_id, curr_restr, RESTR_FIELDS)
+
+
+def has_locks(chat_id):
+    return chat_id in CHAT_LOCKS
 
 
 def is_locked(chat_id, lock_type):
-    curr_perm = SESSION.query(Permissions).get(str(chat_id))
-    SESSION.close()
-
-    if not curr_perm:
-        return False
-
-    elif lock_type == "sticker":
-        return curr_perm.sticker
-    elif lock_type == "photo":
-        return curr_perm.photo
-    elif lock_type == "audio":
-        return curr_perm.audio
-    elif lock_type == "voice":
-        return curr_perm.voice
-    elif lock_type == "contact":
-        return curr_perm.contact
-    elif lock_type == "video":
-        return curr_perm.video
-    elif lock_type == "document":
-        return curr_perm.document
-    elif lock_type == "gif":
-        return curr_perm.gif
-    elif lock_type == "url":
-        return curr_perm.url
-    elif lock_type == "bots":
-        return curr_perm.bots
-    elif lock_type == "forward":
-        return curr_perm.forward
-    elif lock_type == "game":
-        return curr_perm.game
-    elif lock_type == "location":
-        return curr_perm.location
-    elif lock_type == "rtl":
-        return curr_perm.rtl
-    elif lock_type == "button":
-        return curr_perm.button
-    elif lock_type == "egame":
-        return curr_perm.egame
-    elif lock_type == "inline":
-        return curr_perm.inline
+    bit = PERM_BITS.get(lock_type)
+    if bit is None:
+        return None
+    return bool(CHAT_LOCKS.get(chat_id, 0) & bit)
 
 
 def is_restr_locked(chat_id, lock_type):
-    curr_restr = SESSION.query(Restrictions).get(str(chat_id))
-    SESSION.close()
-
-    if not curr_restr:
-        return False
-
-    if lock_type == "messages":
-        return curr_restr.messages
-    elif lock_type == "media":
-        return curr_restr.media
-    elif lock_type == "other":
-        return curr_restr.other
-    elif lock_type == "previews":
-        return curr_restr.preview
-    elif lock_type == "all":
-        return (
-            curr_restr.messages
-            and curr_restr.media
-            and curr_restr.other
-            and curr_restr.preview
-        )
+    bits = RESTR_BITS.get(lock_type)
+    if bits is None:
+        return None
+    return (CHAT_RESTRICTIONS.get(chat_id, 0) & bits) == bits
 
 
 def get_locks(chat_id):
@@ -260,9 +284,11 @@ def migrate_chat(old_chat_id, new_chat_id):
         if perms:
             perms.chat_id = str(new_chat_id)
         SESSION.commit()
+        CHAT_LOCKS.migrate(old_chat_id, new_chat_id)
 
     with RESTR_LOCK:
         rest = SESSION.query(Restrictions).get(str(old_chat_id))
         if rest:
             rest.chat_id = str(new_chat_id)
         SESSION.commit()
+        CHAT_RESTRICTIONS.migrate(old_chat_id, new_chat_id)
@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import Column, String, distinct, func
 
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class GroupLogs(BASE):
@@ -19,7 +20,26 @@ GroupLogs.__table__.create(checkfirst=True)
 
 LOGS_INSERTION_LOCK = threading.RLock()
 
-CHANNELS = {}
+
+def __load_chat_log_channel(chat_id):
+    try:
+        res = SESSION.query(GroupLogs).get(chat_id)
+        return res and res.log_channel
+    finally:
+        SESSION.close()
+
+
+def __load_log_channels():
+    try:
+        all_chats = SESSION.query(GroupLogs).all()
+        return {chat.chat_id: chat.log_channel for chat in all_chats}
+    finally:
+        SESSION.close()
+
+
+CHANNELS = ChatCache(
+    "log_channel", __load_chat_log_channel, __load_log_channels, topic="log_channel"
+)
 
 
 def set_chat_log_channel(chat_id, log_channel):
@@ -31,24 +51,22 @@ def set_chat_log_channel(chat_id, log_channel):
             res = GroupLogs(chat_id, log_channel)
             SESSION.add(res)
 
-        CHANNELS[str(chat_id)] = log_channel
         SESSION.commit()
+        CHANNELS.set(chat_id, log_channel)
 
 
 def get_chat_log_channel(chat_id):
-    return CHANNELS.get(str(chat_id))
+    return CHANNELS.get(chat_id)
 
 
 def stop_chat_logging(chat_id):
     with LOGS_INSERTION_LOCK:
         res = SESSION.query(GroupLogs).get(str(chat_id))
         if res:
-            if str(chat_id) in CHANNELS:
-                del CHANNELS[str(chat_id)]
-
             log_channel = res.log_channel
             SESSION.delete(res)
             SESSION.commit()
+            CHANNELS.discard(chat_id)
             return log_channel
 
 
@@ -65,19 +83,6 @@ def migrate_chat(old_chat_id, new_chat_id):
         if chat:
             chat.chat_id = str(new_chat_id)
             SESSION.add(chat)
-            if str(old_chat_id) in CHANNELS:
-                CHANNELS[str(new_chat_id)] = CHANNELS.get(str(old_chat_id))
 
         SESSION.commit()
-
-
-def __load_log_channels():
-    global CHANNELS
-    try:
-        all_chats = SESSION.query(GroupLogs).all()
-        CHANNELS = {chat.chat_id: chat.log_channel for chat in all_chats}
-    finally:
-        SESSION.close()
-
-
-__load_log_channels()
+        CHANNELS.migrate(old_chat_id, new_chat_id)
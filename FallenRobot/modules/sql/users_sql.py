@@ -1,16 +1,20 @@
 import threading
+from time import perf_counter
 
+from cachetools import LRUCache
 from sqlalchemy import (
     BigInteger,
     Column,
     ForeignKey,
+    Index,
     String,
     UnicodeText,
     UniqueConstraint,
     func,
 )
+from sqlalchemy.dialects.postgresql import insert
 
-from FallenRobot import dispatcher
+from FallenRobot import LOGGER, USER_FLUSH_SIZE, USERNAME_CACHE_SIZE, dispatcher
 from FallenRobot.modules.sql import BASE, SESSION
 
 
@@ -69,9 +73,14 @@ class ChatMembers(BASE):
         )
 
 
+# get_userid_by_name matches case-insensitively, without this it scans
+# the whole users table.
+USERNAME_INDEX = Index("ix_users_username_lower", func.lower(Users.username))
+
 Users.__table__.create(checkfirst=True)
 Chats.__table__.create(checkfirst=True)
 ChatMembers.__table__.create(checkfirst=True)
+USERNAME_INDEX.create(checkfirst=True)
 
 INSERTION_LOCK = threading.RLock()
 
@@ -83,42 +92,178 @@ def ensure_bot_in_db():
         SESSION.commit()
 
 
+# Write-behind buffer: update_user only records what changed, flush_users
+# writes it out in bulk. The KNOWN_* caches remember what is already stored
+# so repeat messages from the same member in the same chat cost nothing.
+PENDING_LOCK = threading.RLock()
+PENDING_USERS = {}
+PENDING_CHATS = {}
+PENDING_MEMBERS = set()
+
+KNOWN_USERS = LRUCache(maxsize=100000)
+KNOWN_CHATS = LRUCache(maxsize=20000)
+KNOWN_MEMBERS = LRUCache(maxsize=200000)
+
+# lower(username) -> user id. Usernames are unique on Telegram at any one
+# time, so whoever update_user last saw with a name owns it, even when stale
+# rows in the table still carry it.
+USERNAME_CACHE = LRUCache(maxsize=USERNAME_CACHE_SIZE)
+USERNAME_CACHE_STATS = {"hits": 0, "misses": 0, "loads": 0, "load_time": 0.0}
+
+FLUSH_CHUNK = 1000
+# After this many failed bulk flushes in a row the buffer is written row by
+# row, so one bad row can't keep it from ever draining.
+FLUSH_RETRIES = 3
+FLUSH_FAILURES = 0
+_MISSING = object()
+
+
 def update_user(user_id, username, chat_id=None, chat_name=None):
-    with INSERTION_LOCK:
-        user = SESSION.query(Users).get(user_id)
-        if not user:
-            user = Users(user_id, username)
-            SESSION.add(user)
-            SESSION.flush()
-        else:
-            user.username = username
+    with PENDING_LOCK:
+        known = KNOWN_USERS.get(user_id, _MISSING)
+        if known != username:
+            PENDING_USERS[user_id] = username
+            # drop the old name unless someone else has taken it since
+            if (
+                known is not _MISSING
+                and known
+                and USERNAME_CACHE.get(known.lower()) == user_id
+            ):
+                del USERNAME_CACHE[known.lower()]
+        if username:
+            USERNAME_CACHE[username.lower()] = user_id
+
+        if chat_id and chat_name:
+            chat_id = str(chat_id)
+            if KNOWN_CHATS.get(chat_id, _MISSING) != chat_name:
+                PENDING_CHATS[chat_id] = chat_name
+            if (chat_id, user_id) not in KNOWN_MEMBERS:
+                PENDING_MEMBERS.add((chat_id, user_id))
+
+        pending = len(PENDING_USERS) + len(PENDING_CHATS) + len(PENDING_MEMBERS)
+
+    if pending >= USER_FLUSH_SIZE:
+        flush_users()
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), FLUSH_CHUNK):
+        yield rows[i : i + FLUSH_CHUNK]
+
+
+def _write(users, chats, members):
+    user_rows = [{"user_id": k, "username": v} for k, v in users.items()]
+    for rows in _chunks(user_rows):
+        stmt = insert(Users).values(rows)
+        SESSION.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Users.user_id],
+                set_={"username": stmt.excluded.username},
+            )
+        )
 
-        if not chat_id or not chat_name:
+    chat_rows = [{"chat_id": k, "chat_name": v} for k, v in chats.items()]
+    for rows in _chunks(chat_rows):
+        stmt = insert(Chats).values(rows)
+        SESSION.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Chats.chat_id],
+                set_={"chat_name": stmt.excluded.chat_name},
+            )
+        )
+
+    member_rows = [{"chat": c, "user": u} for c, u in members]
+    for rows in _chunks(member_rows):
+        SESSION.execute(
+            insert(ChatMembers)
+            .values(rows)
+            .on_conflict_do_nothing(constraint="_chat_members_uc")
+        )
+
+
+def _write_each(users, chats, members):
+    """
+    Write a batch that keeps failing row by row, dropping the rows that
+    still fail. Returns what was stored.
+    """
+    stored_users, stored_chats, stored_members = {}, {}, set()
+    entries = (
+        [({k: v}, {}, ()) for k, v in users.items()]
+        + [({}, {k: v}, ()) for k, v in chats.items()]
+        + [({}, {}, (member,)) for member in members]
+    )
+    for entry in entries:
+        try:
+            _write(*entry)
             SESSION.commit()
+        except Exception:
+            SESSION.rollback()
+            LOGGER.warning("Dropping buffered row %s that can't be stored", entry)
+            continue
+        stored_users.update(entry[0])
+        stored_chats.update(entry[1])
+        stored_members.update(entry[2])
+    return stored_users, stored_chats, stored_members
+
+
+def flush_users():
+    global PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS, FLUSH_FAILURES
+    with PENDING_LOCK:
+        users, chats, members = PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS
+        PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS = {}, {}, set()
+
+    if not (users or chats or members):
+        return
+
+    with INSERTION_LOCK:
+        try:
+            if FLUSH_FAILURES >= FLUSH_RETRIES:
+                users, chats, members = _write_each(users, chats, members)
+            else:
+                _write(users, chats, members)
+                SESSION.commit()
+            FLUSH_FAILURES = 0
+        except Exception:
+            SESSION.rollback()
+            FLUSH_FAILURES += 1
+            LOGGER.exception("Failed to flush %d users to the database", len(users))
+            # Put the batch back, newer values recorded meanwhile win.
+            with PENDING_LOCK:
+                for user_id, username in users.items():
+                    PENDING_USERS.setdefault(user_id, username)
+                for chat_id, chat_name in chats.items():
+                    PENDING_CHATS.setdefault(chat_id, chat_name)
+                PENDING_MEMBERS.update(members)
             return
+        finally:
+            SESSION.close()
 
-        chat = SESSION.query(Chats).get(str(chat_id))
-        if not chat:
-            chat = Chats(str(chat_id), chat_name)
-            SESSION.add(chat)
-            SESSION.flush()
+    with PENDING_LOCK:
+        KNOWN_USERS.update(users)
+        KNOWN_CHATS.update(chats)
+        for member in members:
+            KNOWN_MEMBERS[member] = True
 
-        else:
-            chat.chat_name = chat_name
 
-        member = (
-            SESSION.query(ChatMembers)
-            .filter(ChatMembers.chat == chat.chat_id, ChatMembers.user == user.user_id)
-            .first()
-        )
-        if not member:
-            chat_member = ChatMembers(chat.chat_id, user.user_id)
-            SESSION.add(chat_member)
+def _forget_chat(chat_id):
+    chat_id = str(chat_id)
+    with PENDING_LOCK:
+        KNOWN_CHATS.pop(chat_id, None)
+        for member in [m for m in KNOWN_MEMBERS if m[0] == chat_id]:
+            KNOWN_MEMBERS.pop(member, None)
 
-        SESSION.commit()
+
+def _forget_user(user_id):
+    with PENDING_LOCK:
+        username = KNOWN_USERS.pop(user_id, None)
+        if username and USERNAME_CACHE.get(username.lower()) == user_id:
+            del USERNAME_CACHE[username.lower()]
+        for member in [m for m in KNOWN_MEMBERS if m[1] == user_id]:
+            KNOWN_MEMBERS.pop(member, None)
 
 
 def get_userid_by_name(username):
+    start = perf_counter()
     try:
         return (
             SESSION.query(Users)
@@ -127,6 +272,34 @@ def get_userid_by_name(username):
         )
     finally:
         SESSION.close()
+        with PENDING_LOCK:
+            USERNAME_CACHE_STATS["loads"] += 1
+            USERNAME_CACHE_STATS["load_time"] += perf_counter() - start
+
+
+def get_cached_userid(username):
+    """The user id last seen with this username, or None if it isn't cached."""
+    with PENDING_LOCK:
+        user_id = USERNAME_CACHE.get(username.lower())
+        if user_id is None:
+            USERNAME_CACHE_STATS["misses"] += 1
+        else:
+            USERNAME_CACHE_STATS["hits"] += 1
+        return user_id
+
+
+def cache_userid(username, user_id):
+    with PENDING_LOCK:
+        USERNAME_CACHE[username.lower()] = user_id
+
+
+def username_cache_stats() -> dict:
+    with PENDING_LOCK:
+        stats = dict(USERNAME_CACHE_STATS, size=len(USERNAME_CACHE))
+    stats["avg_load_ms"] = (
+        stats["load_time"] / stats["loads"] * 1000 if stats["loads"] else 0.0
+    )
+    return stats
 
 
 def get_name_by_userid(user_id):
@@ -157,6 +330,28 @@ def get_all_users():
         SESSION.close()
 
 
+def get_chat_ids_after(last_chat_id=None, limit=500):
+    """Next page of chat ids in chat_id order, for walking the table in chunks."""
+    try:
+        query = SESSION.query(Chats.chat_id)
+        if last_chat_id is not None:
+            query = query.filter(Chats.chat_id > str(last_chat_id))
+        return [row.chat_id for row in query.order_by(Chats.chat_id).limit(limit)]
+    finally:
+        SESSION.close()
+
+
+def get_user_ids_after(last_user_id=None, limit=500):
+    """Next page of user ids in user_id order, for walking the table in chunks."""
+    try:
+        query = SESSION.query(Users.user_id)
+        if last_user_id is not None:
+            query = query.filter(Users.user_id > int(last_user_id))
+        return [row.user_id for row in query.order_by(Users.user_id).limit(limit)]
+    finally:
+        SESSION.close()
+
+
 def get_user_num_chats(user_id):
     try:
         return (
@@ -191,6 +386,8 @@ def num_users():
 
 
 def migrate_chat(old_chat_id, new_chat_id):
+    flush_users()
+    _forget_chat(old_chat_id)
     with INSERTION_LOCK:
         chat = SESSION.query(Chats).get(str(old_chat_id))
         if chat:
@@ -211,6 +408,8 @@ ensure_bot_in_db()
 
 
 def del_user(user_id):
+    flush_users()
+    _forget_user(user_id)
     with INSERTION_LOCK:
         curr = SESSION.query(Users).get(user_id)
         if curr:
@@ -225,6 +424,8 @@ def del_user(user_id):
 
 
 def rem_chat(chat_id):
+    flush_users()
+    _forget_chat(chat_id)
     with INSERTION_LOCK:
         chat = SESSION.query(Chats).get(str(chat_id))
         if chat:
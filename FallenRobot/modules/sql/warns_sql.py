@@ -3,7 +3,9 @@ import threading
 from sqlalchemy import BigInteger, Boolean, Column, String, UnicodeText, distinct, func
 from sqlalchemy.dialects import postgresql
 
+from FallenRobot.modules.helper_funcs.keyword_matcher import KeywordMatcher
 from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 
 class Warns(BASE):
@@ -71,7 +73,44 @@ WARN_INSERTION_LOCK = threading.RLock()
 WARN_FILTER_INSERTION_LOCK = threading.RLock()
 WARN_SETTINGS_LOCK = threading.RLock()
 
-WARN_FILTERS = {}
+
+def __sorted_triggers(keywords):
+    return tuple(sorted(set(keywords), key=lambda i: (-len(i), i)))
+
+
+def __load_chat_triggers(chat_id):
+    try:
+        return __sorted_triggers(
+            keyword
+            for (keyword,) in SESSION.query(WarnFilters.keyword).filter(
+                WarnFilters.chat_id == chat_id
+            )
+        )
+    finally:
+        SESSION.close()
+
+
+def __load_chat_warn_filters():
+    try:
+        filters = {}
+        all_filters = SESSION.query(WarnFilters).all()
+        for x in all_filters:
+            filters.setdefault(x.chat_id, []).append(x.keyword)
+        return {x: __sorted_triggers(y) for x, y in filters.items()}
+
+    finally:
+        SESSION.close()
+
+
+WARN_FILTER_MATCHER = KeywordMatcher(lambda chat_id: get_chat_warn_triggers(chat_id))
+# chat_id -> warn filter keywords, longest first
+WARN_FILTERS = ChatCache(
+    "warns",
+    __load_chat_triggers,
+    __load_chat_warn_filters,
+    topic="warns",
+    on_change=WARN_FILTER_MATCHER.invalidate,
+)
 
 
 def warn_user(user_id, chat_id, reason=None):
@@ -139,32 +178,34 @@ def add_warn_filter(chat_id, keyword, reply):
     with WARN_FILTER_INSERTION_LOCK:
         warn_filt = WarnFilters(str(chat_id), keyword, reply)
 
-        if keyword not in WARN_FILTERS.get(str(chat_id), []):
-            WARN_FILTERS[str(chat_id)] = sorted(
-                WARN_FILTERS.get(str(chat_id), []) + [keyword],
-                key=lambda x: (-len(x), x),
-            )
-
         SESSION.merge(warn_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
+        WARN_FILTERS.set(
+            chat_id, __sorted_triggers(WARN_FILTERS.get(chat_id, ()) + (keyword,))
+        )
 
 
 def remove_warn_filter(chat_id, keyword):
     with WARN_FILTER_INSERTION_LOCK:
         warn_filt = SESSION.query(WarnFilters).get((str(chat_id), keyword))
         if warn_filt:
-            if keyword in WARN_FILTERS.get(str(chat_id), []):  # sanity check
-                WARN_FILTERS.get(str(chat_id), []).remove(keyword)
-
             SESSION.delete(warn_filt)
             SESSION.commit()
+            WARN_FILTERS.set(
+                chat_id,
+                tuple(k for k in WARN_FILTERS.get(chat_id, ()) if k != keyword),
+            )
             return True
         SESSION.close()
         return False
 
 
 def get_chat_warn_triggers(chat_id):
-    return WARN_FILTERS.get(str(chat_id), set())
+    return WARN_FILTERS.get(chat_id, ())
+
+
+def match_warn_filter(chat_id, text):
+    return WARN_FILTER_MATCHER.first(chat_id, text)
 
 
 def get_chat_warn_filters(chat_id):
@@ -258,26 +299,6 @@ def num_warn_filter_chats():
         SESSION.close()
 
 
-def __load_chat_warn_filters():
-    global WARN_FILTERS
-    try:
-        chats = SESSION.query(WarnFilters.chat_id).distinct().all()
-        for (chat_id,) in chats:  # remove tuple by ( ,)
-            WARN_FILTERS[chat_id] = []
-
-        all_filters = SESSION.query(WarnFilters).all()
-        for x in all_filters:
-            WARN_FILTERS[x.chat_id] += [x.keyword]
-
-        WARN_FILTERS = {
-            x: sorted(set(y), key=lambda i: (-len(i), i))
-            for x, y in WARN_FILTERS.items()
-        }
-
-    finally:
-        SESSION.close()
-
-
 def migrate_chat(old_chat_id, new_chat_id):
     with WARN_INSERTION_LOCK:
         chat_notes = (
@@ -296,10 +317,7 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
-        old_warn_filt = WARN_FILTERS.get(str(old_chat_id))
-        if old_warn_filt is not None:
-            WARN_FILTERS[str(new_chat_id)] = old_warn_filt
-            del WARN_FILTERS[str(old_chat_id)]
+        WARN_FILTERS.migrate(old_chat_id, new_chat_id)
 
     with WARN_SETTINGS_LOCK:
         chat_settings = (
@@ -310,6 +328,3 @@ def migrate_chat(old_chat_id, new_chat_id):
         for setting in chat_settings:
             setting.chat_id = str(new_chat_id)
         SESSION.commit()
-
-
-__load_chat_warn_filters()
@@ -1,11 +1,14 @@
 import random
 import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from typing import Union
 
 from sqlalchemy import BigInteger, Boolean, Column, Integer, String, UnicodeText
 
 from FallenRobot.modules.helper_funcs.msg_types import Types
-from FallenRobot.modules.sql import BASE, SESSION
+from FallenRobot.modules.sql import BASE, SESSION, session_scope
+from FallenRobot.modules.sql.chat_cache import ChatCache
 
 DEFAULT_WELCOME = "Hey {first}, how are you?"
 DEFAULT_GOODBYE = "Nice knowing ya!"
@@ -307,6 +310,24 @@ class WelcomeMuteUsers(BASE):
         self.human_check = human_check
 
 
+class WelcomeCaptcha(BASE):
+    __tablename__ = "welcome_captcha"
+    chat_id = Column(String(14), primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger)
+    # unix time after which the user is kicked
+    expires = Column(BigInteger, index=True)
+
+    def __init__(self, chat_id, user_id, message_id, expires):
+        self.chat_id = str(chat_id)
+        self.user_id = user_id
+        self.message_id = message_id
+        self.expires = expires
+
+    def __repr__(self):
+        return "<Captcha for {} in {}>".format(self.user_id, self.chat_id)
+
+
 class CleanServiceSetting(BASE):
     __tablename__ = "clean_service"
     chat_id = Column(String(14), primary_key=True)
@@ -325,22 +346,151 @@ GoodbyeButtons.__table__.create(checkfirst=True)
 WelcomeMute.__table__.create(checkfirst=True)
 WelcomeMuteUsers.__table__.create(checkfirst=True)
 CleanServiceSetting.__table__.create(checkfirst=True)
+WelcomeCaptcha.__table__.create(checkfirst=True)
 
 INSERTION_LOCK = threading.RLock()
 WELC_BTN_LOCK = threading.RLock()
 LEAVE_BTN_LOCK = threading.RLock()
 WM_LOCK = threading.RLock()
 CS_LOCK = threading.RLock()
+CAPTCHA_LOCK = threading.RLock()
+# held from copying a chat's cached settings until the edited copy is stored
+SETTINGS_LOCK = threading.RLock()
+
+# What build_keyboard() and revert_buttons() need of a welcome/goodbye button
+CachedButton = namedtuple("CachedButton", ["name", "url", "same_line"])
+
+
+class WelcomeSettings:
+    """Everything a join or leave needs to know about a chat, in one place."""
+
+    __slots__ = (
+        "has_welcome",
+        "should_welcome",
+        "should_goodbye",
+        "custom_content",
+        "custom_welcome",
+        "welcome_type",
+        "custom_leave",
+        "leave_type",
+        "clean_welcome",
+        "welcomemutes",
+        "clean_service",
+        "welc_buttons",
+        "gdbye_buttons",
+    )
 
+    def __init__(self):
+        # no welcome_pref row yet, the getters fall back to the defaults
+        self.has_welcome = False
+        self.should_welcome = True
+        self.should_goodbye = True
+        self.custom_content = None
+        self.custom_welcome = None
+        self.welcome_type = Types.TEXT
+        self.custom_leave = None
+        self.leave_type = Types.TEXT
+        self.clean_welcome = None
+        self.welcomemutes = False
+        self.clean_service = False
+        self.welc_buttons = ()
+        self.gdbye_buttons = ()
+
+    def copy(self):
+        settings = WelcomeSettings()
+        for slot in self.__slots__:
+            setattr(settings, slot, getattr(self, slot))
+        return settings
+
+
+def _cache_welcome(welc, settings):
+    """Copy a welcome_pref row into `settings`."""
+    settings.has_welcome = True
+    settings.should_welcome = welc.should_welcome
+    settings.should_goodbye = welc.should_goodbye
+    settings.custom_content = welc.custom_content
+    settings.custom_welcome = welc.custom_welcome
+    settings.welcome_type = welc.welcome_type
+    settings.custom_leave = welc.custom_leave
+    settings.leave_type = welc.leave_type
+    settings.clean_welcome = welc.clean_welcome
+
+
+def _query_settings(chat_id=None) -> dict:
+    """Build WelcomeSettings for every chat, or just for `chat_id`."""
+
+    def rows(table, *order):
+        query = SESSION.query(table)
+        if chat_id is not None:
+            query = query.filter(table.chat_id == str(chat_id))
+        return query.order_by(*order) if order else query
+
+    cache = {}
+
+    def edit(key):
+        settings = cache.get(key)
+        if settings is None:
+            settings = cache[key] = WelcomeSettings()
+        return settings
 
-def welcome_mutes(chat_id):
     try:
-        welcomemutes = SESSION.query(WelcomeMute).get(str(chat_id))
-        if welcomemutes:
-            return welcomemutes.welcomemutes
-        return False
+        for welc in rows(Welcome):
+            _cache_welcome(welc, edit(welc.chat_id))
+        for mutes in rows(WelcomeMute):
+            edit(mutes.chat_id).welcomemutes = mutes.welcomemutes
+        for chat_setting in rows(CleanServiceSetting):
+            edit(chat_setting.chat_id).clean_service = chat_setting.clean_service
+
+        welc_buttons = {}
+        for btn in rows(WelcomeButtons, WelcomeButtons.id):
+            welc_buttons.setdefault(btn.chat_id, []).append(
+                CachedButton(btn.name, btn.url, btn.same_line)
+            )
+        for key, buttons in welc_buttons.items():
+            edit(key).welc_buttons = tuple(buttons)
+
+        gdbye_buttons = {}
+        for btn in rows(GoodbyeButtons, GoodbyeButtons.id):
+            gdbye_buttons.setdefault(btn.chat_id, []).append(
+                CachedButton(btn.name, btn.url, btn.same_line)
+            )
+        for key, buttons in gdbye_buttons.items():
+            edit(key).gdbye_buttons = tuple(buttons)
     finally:
         SESSION.close()
+    return cache
+
+
+# chat_id -> WelcomeSettings, kept in step by the setters below, so joins
+# and leaves never have to hit the database.
+WELCOME_SETTINGS = ChatCache(
+    "welcome",
+    lambda chat_id: _query_settings(chat_id).get(chat_id),
+    _query_settings,
+    topic="welcome",
+)
+NO_SETTINGS = WelcomeSettings()
+
+
+def _settings(chat_id):
+    return WELCOME_SETTINGS.get(chat_id, NO_SETTINGS)
+
+
+@contextmanager
+def _edit_settings(chat_id):
+    """
+    A copy of the chat's settings to change, stored when the block ends
+    without raising. Setters take turns, so one can't store a stale copy
+    over another's change.
+    """
+    with SETTINGS_LOCK:
+        settings = _settings(chat_id).copy()
+        yield settings
+        WELCOME_SETTINGS.set(chat_id, settings)
+
+
+def welcome_mutes(chat_id):
+    return _settings(chat_id).welcomemutes
 
 
 def set_welcome_mutes(chat_id, welcomemutes):
@@ -350,7 +500,9 @@ def set_welcome_mutes(chat_id, welcomemutes):
             SESSION.delete(prev)
         welcome_m = WelcomeMute(str(chat_id), welcomemutes)
         SESSION.add(welcome_m)
-        SESSION.commit()
+        with _edit_settings(chat_id) as settings:
+            SESSION.commit()
+            settings.welcomemutes = welcomemutes
 
 
 def set_human_checks(user_id, chat_id):
@@ -368,6 +520,33 @@ def set_human_checks(user_id, chat_id):
         return human_check
 
 
+def add_captcha(chat_id, user_id, message_id, expires):
+    with CAPTCHA_LOCK, session_scope() as session:
+        session.merge(WelcomeCaptcha(chat_id, user_id, message_id, expires))
+
+
+def pop_captcha(chat_id, user_id):
+    """Remove a pending captcha, returning its message id, or None if it was
+    already solved or expired."""
+    with CAPTCHA_LOCK, session_scope() as session:
+        captcha = session.query(WelcomeCaptcha).get((str(chat_id), user_id))
+        if not captcha:
+            return None
+        session.delete(captcha)
+        return captcha.message_id
+
+
+def get_expired_captchas(now, limit=200):
+    with session_scope() as session:
+        return [
+            (int(c.chat_id), c.user_id)
+            for c in session.query(WelcomeCaptcha)
+            .filter(WelcomeCaptcha.expires <= now)
+            .order_by(WelcomeCaptcha.expires)
+            .limit(limit)
+        ]
+
+
 def get_human_checks(user_id, chat_id):
     try:
         human_check = SESSION.query(WelcomeMuteUsers).get((user_id, str(chat_id)))
@@ -380,19 +559,12 @@ def get_human_checks(user_id, chat_id):
 
 
 def get_welc_mutes_pref(chat_id):
-    welcomemutes = SESSION.query(WelcomeMute).get(str(chat_id))
-    SESSION.close()
-
-    if welcomemutes:
-        return welcomemutes.welcomemutes
-
-    return False
+    return _settings(chat_id).welcomemutes
 
 
 def get_welc_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
-    if welc:
+    welc = _settings(chat_id)
+    if welc.has_welcome:
         return (
             welc.should_welcome,
             welc.custom_welcome,
@@ -406,9 +578,8 @@ def get_welc_pref(chat_id):
 
 
 def get_gdbye_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
-    if welc:
+    welc = _settings(chat_id)
+    if welc.has_welcome:
         return welc.should_goodbye, welc.custom_leave, welc.leave_type
     else:
         # Welcome by default.
@@ -424,14 +595,15 @@ def set_clean_welcome(chat_id, clean_welcome):
         curr.clean_welcome = int(clean_welcome)
 
         SESSION.add(curr)
-        SESSION.commit()
+        SESSION.flush()
+        with _edit_settings(chat_id) as settings:
+            _cache_welcome(curr, settings)
+            SESSION.commit()
 
 
 def get_clean_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
-
-    if welc:
+    welc = _settings(chat_id)
+    if welc.has_welcome:
         return welc.clean_welcome
 
     return False
@@ -446,7 +618,10 @@ def set_welc_preference(chat_id, should_welcome):
             curr.should_welcome = should_welcome
 
         SESSION.add(curr)
-        SESSION.commit()
+        SESSION.flush()
+        with _edit_settings(chat_id) as settings:
+            _cache_welcome(curr, settings)
+            SESSION.commit()
 
 
 def set_gdbye_preference(chat_id, should_goodbye):
@@ -458,7 +633,10 @@ def set_gdbye_preference(chat_id, should_goodbye):
             curr.should_goodbye = should_goodbye
 
         SESSION.add(curr)
-        SESSION.commit()
+        SESSION.flush()
+        with _edit_settings(chat_id) as settings:
+            _cache_welcome(curr, settings)
+            SESSION.commit()
 
 
 def set_custom_welcome(
@@ -496,16 +674,21 @@ def set_custom_welcome(
                 button = WelcomeButtons(chat_id, b_name, url, same_line)
                 SESSION.add(button)
 
-        SESSION.commit()
+        SESSION.flush()
+        with _edit_settings(chat_id) as settings:
+            _cache_welcome(welcome_settings, settings)
+            settings.welc_buttons = tuple(
+                CachedButton(b_name, url, same_line)
+                for b_name, url, same_line in buttons
+            )
+            SESSION.commit()
 
 
 def get_custom_welcome(chat_id):
-    welcome_settings = SESSION.query(Welcome).get(str(chat_id))
+    welcome_settings = _settings(chat_id)
     ret = DEFAULT_WELCOME
-    if welcome_settings and welcome_settings.custom_welcome:
+    if welcome_settings.has_welcome and welcome_settings.custom_welcome:
         ret = welcome_settings.custom_welcome
-
-    SESSION.close()
     return ret
 
 
@@ -541,51 +724,34 @@ def set_custom_gdbye(chat_id, custom_goodbye, goodbye_type, buttons=None):
                 button = GoodbyeButtons(chat_id, b_name, url, same_line)
                 SESSION.add(button)
 
-        SESSION.commit()
+        SESSION.flush()
+        with _edit_settings(chat_id) as settings:
+            _cache_welcome(welcome_settings, settings)
+            settings.gdbye_buttons = tuple(
+                CachedButton(b_name, url, same_line)
+                for b_name, url, same_line in buttons
+            )
+            SESSION.commit()
 
 
 def get_custom_gdbye(chat_id):
-    welcome_settings = SESSION.query(Welcome).get(str(chat_id))
+    welcome_settings = _settings(chat_id)
     ret = DEFAULT_GOODBYE
-    if welcome_settings and welcome_settings.custom_leave:
+    if welcome_settings.has_welcome and welcome_settings.custom_leave:
         ret = welcome_settings.custom_leave
-
-    SESSION.close()
     return ret
 
 
 def get_welc_buttons(chat_id):
-    try:
-        return (
-            SESSION.query(WelcomeButtons)
-            .filter(WelcomeButtons.chat_id == str(chat_id))
-            .order_by(WelcomeButtons.id)
-            .all()
-        )
-    finally:
-        SESSION.close()
+    return list(_settings(chat_id).welc_buttons)
 
 
 def get_gdbye_buttons(chat_id):
-    try:
-        return (
-            SESSION.query(GoodbyeButtons)
-            .filter(GoodbyeButtons.chat_id == str(chat_id))
-            .order_by(GoodbyeButtons.id)
-            .all()
-        )
-    finally:
-        SESSION.close()
+    return list(_settings(chat_id).gdbye_buttons)
 
 
 def clean_service(chat_id: Union[str, int]) -> bool:
-    try:
-        chat_setting = SESSION.query(CleanServiceSetting).get(str(chat_id))
-        if chat_setting:
-            return chat_setting.clean_service
-        return False
-    finally:
-        SESSION.close()
+    return _settings(chat_id).clean_service
 
 
 def set_clean_service(chat_id: Union[int, str], setting: bool):
@@ -596,7 +762,9 @@ def set_clean_service(chat_id: Union[int, str], setting: bool):
 
         chat_setting.clean_service = setting
         SESSION.add(chat_setting)
-        SESSION.commit()
+        with _edit_settings(chat_id) as settings:
+            SESSION.commit()
+            settings.clean_service = setting
 
 
 def migrate_chat(old_chat_id, new_chat_id):
@@ -623,4 +791,24 @@ def migrate_chat(old_chat_id, new_chat_id):
             for btn in chat_buttons:
                 btn.chat_id = str(new_chat_id)
 
+        with CAPTCHA_LOCK:
+            captchas = (
+                SESSION.query(WelcomeCaptcha)
+                .filter(WelcomeCaptcha.chat_id == str(old_chat_id))
+                .all()
+            )
+            for captcha in captchas:
+                captcha.chat_id = str(new_chat_id)
+
+        with WM_LOCK:
+            mutes = SESSION.query(WelcomeMute).get(str(old_chat_id))
+            if mutes:
+                mutes.chat_id = str(new_chat_id)
+
+        with CS_LOCK:
+            chat_setting = SESSION.query(CleanServiceSetting).get(str(old_chat_id))
+            if chat_setting:
+                chat_setting.chat_id = str(new_chat_id)
+
         SESSION.commit()
+        WELCOME_SETTINGS.migrate(old_chat_id, new_chat_id)
@@ -1,14 +1,22 @@
 from io import BytesIO
-from time import sleep
 
-from telegram import TelegramError, Update
+from telegram import Update
 from telegram.error import BadRequest, Unauthorized
-from telegram.ext import CallbackContext, CommandHandler, Filters, MessageHandler
+from telegram.ext import (
+    CallbackContext,
+    ChatMemberHandler,
+    CommandHandler,
+    Filters,
+    MessageHandler,
+)
 
 import FallenRobot.modules.sql.users_sql as sql
-from FallenRobot import DEV_USERS, LOGGER, OWNER_ID, dispatcher
-from FallenRobot.modules.helper_funcs.chat_status import dev_plus, sudo_plus
-from FallenRobot.modules.sql.users_sql import get_all_users
+from FallenRobot import DEV_USERS, LOGGER, OWNER_ID, USER_FLUSH_INTERVAL, dispatcher
+from FallenRobot.modules.helper_funcs.chat_status import (
+    get_bot_member,
+    set_bot_member,
+    sudo_plus,
+)
 
 USERS_GROUP = 4
 CHAT_GROUP = 5
@@ -23,19 +31,25 @@ def get_user_id(username):
     if username.startswith("@"):
         username = username[1:]
 
+    user_id = sql.get_cached_userid(username)
+    if user_id is not None:
+        return user_id
+
     users = sql.get_userid_by_name(username)
 
     if not users:
         return None
 
     elif len(users) == 1:
+        sql.cache_userid(username, users[0].user_id)
         return users[0].user_id
 
     else:
         for user_obj in users:
             try:
                 userdat = dispatcher.bot.get_chat(user_obj.user_id)
-                if userdat.username == username:
+                if userdat.username and userdat.username.lower() == username.lower():
+                    sql.cache_userid(username, userdat.id)
                     return userdat.id
 
             except BadRequest as excp:
@@ -47,50 +61,8 @@ def get_user_id(username):
     return None
 
 
-@dev_plus
-def broadcast(update: Update, context: CallbackContext):
-    to_send = update.effective_message.text.split(None, 1)
-
-    if len(to_send) >= 2:
-        to_group = False
-        to_user = False
-        if to_send[0] == "/broadcastgroups":
-            to_group = True
-        if to_send[0] == "/broadcastusers":
-            to_user = True
-        else:
-            to_group = to_user = True
-        chats = sql.get_all_chats() or []
-        users = get_all_users()
-        failed = 0
-        failed_user = 0
-        if to_group:
-            for chat in chats:
-                try:
-                    context.bot.sendMessage(
-                        int(chat.chat_id),
-                        to_send[1],
-                        parse_mode="MARKDOWN",
-                        disable_web_page_preview=True,
-                    )
-                    sleep(0.1)
-                except TelegramError:
-                    failed += 1
-        if to_user:
-            for user in users:
-                try:
-                    context.bot.sendMessage(
-                        int(user.user_id),
-                        to_send[1],
-                        parse_mode="MARKDOWN",
-                        disable_web_page_preview=True,
-                    )
-                    sleep(0.1)
-                except TelegramError:
-                    failed_user += 1
-        update.effective_message.reply_text(
-            f"Broadcast complete.\nGroups failed: {failed}.\nUsers failed: {failed_user}."
-        )
+def flush_users(context: CallbackContext):
+    sql.flush_users()
 
 
 def log_user(update: Update, context: CallbackContext):
@@ -140,12 +112,18 @@ def chats(update: Update, context: CallbackContext):
 def chat_checker(update: Update, context: CallbackContext):
     bot = context.bot
     try:
-        if update.effective_message.chat.get_member(bot.id).can_send_messages is False:
-            bot.leaveChat(update.effective_message.chat.id)
+        chat = update.effective_message.chat
+        if get_bot_member(chat, bot.id).can_send_messages is False:
+            bot.leaveChat(chat.id)
     except Unauthorized:
         pass
 
 
+def bot_member_updated(update: Update, context: CallbackContext):
+    my_member = update.my_chat_member
+    set_bot_member(my_member.chat.id, my_member.new_chat_member)
+
+
 def __user_info__(user_id):
     if user_id in [777000, 1087968824]:
         return """<b>➻ ᴄᴏᴍᴍᴏɴ ᴄʜᴀᴛs:</b> <code>???</code>"""
@@ -156,7 +134,12 @@ def __user_info__(user_id):
 
 
 def __stats__():
-    return f"• {sql.num_users()} users, across {sql.num_chats()} chats"
+    stats = sql.username_cache_stats()
+    return (
+        "• {users} users, across {chats} chats\n"
+        "• username cache: {size} names, {hits} hits / {misses} misses, "
+        "{loads} lookups averaging {avg_load_ms:.1f}ms."
+    ).format(users=sql.num_users(), chats=sql.num_chats(), **stats)
 
 
 def __migrate__(old_chat_id, new_chat_id):
@@ -165,9 +148,6 @@ def __migrate__(old_chat_id, new_chat_id):
 
 __help__ = ""  # no help string
 
-BROADCAST_HANDLER = CommandHandler(
-    ["broadcastall", "broadcastusers", "broadcastgroups"], broadcast, run_async=True
-)
 USER_HANDLER = MessageHandler(
     Filters.all & Filters.chat_type.groups, log_user, run_async=True
 )
@@ -175,11 +155,17 @@ CHAT_CHECKER_HANDLER = MessageHandler(
     Filters.all & Filters.chat_type.groups, chat_checker, run_async=True
 )
 CHATLIST_HANDLER = CommandHandler("groups", chats, run_async=True)
+BOT_MEMBER_HANDLER = ChatMemberHandler(
+    bot_member_updated, ChatMemberHandler.MY_CHAT_MEMBER
+)
 
 dispatcher.add_handler(USER_HANDLER, USERS_GROUP)
-dispatcher.add_handler(BROADCAST_HANDLER)
 dispatcher.add_handler(CHATLIST_HANDLER)
 dispatcher.add_handler(CHAT_CHECKER_HANDLER, CHAT_GROUP)
+dispatcher.add_handler(BOT_MEMBER_HANDLER, CHAT_GROUP)
+dispatcher.job_queue.run_repeating(
+    flush_users, interval=USER_FLUSH_INTERVAL, first=USER_FLUSH_INTERVAL
+)
 
 __mod_name__ = "Users"
-__handlers__ = [(USER_HANDLER, USERS_GROUP), BROADCAST_HANDLER, CHATLIST_HANDLER]
+__handlers__ = [(USER_HANDLER, USERS_GROUP), CHATLIST_HANDLER]
@@ -34,12 +34,12 @@ from FallenRobot.modules.helper_funcs.chat_status import (
     user_admin_no_reply,
 )
 from FallenRobot.modules.helper_funcs.extraction import (
-    extract_text,
     extract_user,
     extract_user_and_text,
 )
 from FallenRobot.modules.helper_funcs.filters import CustomFilters
 from FallenRobot.modules.helper_funcs.misc import split_message
+from FallenRobot.modules.helper_funcs.parsed_message import parsed_message
 from FallenRobot.modules.helper_funcs.string_handling import split_quotes
 from FallenRobot.modules.log_channel import loggable
 from FallenRobot.modules.sql import warns_sql as sql
@@ -387,17 +387,14 @@ def reply_filter(update: Update, context: CallbackContext) -> str:
         return
     if is_approved(chat.id, user.id):
         return
-    chat_warn_filters = sql.get_chat_warn_triggers(chat.id)
-    to_match = extract_text(message)
+    to_match = parsed_message(message).text
     if not to_match:
         return ""
 
-    for keyword in chat_warn_filters:
-        pattern = r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            user: Optional[User] = update.effective_user
-            warn_filter = sql.get_warn_filter(chat.id, keyword)
-            return warn(user, chat, warn_filter.reply, message)
+    keyword = sql.match_warn_filter(chat.id, to_match)
+    if keyword:
+        warn_filter = sql.get_warn_filter(chat.id, keyword)
+        return warn(user, chat, warn_filter.reply, message)
     return ""
 
 
@@ -1,9 +1,10 @@
 import html
 import random
 import re
+import threading
 import time
+from collections import deque
 from contextlib import suppress
-from functools import partial
 
 from telegram import (
     ChatPermissions,
@@ -31,6 +32,7 @@ from FallenRobot import (
     EVENT_LOGS,
     LOGGER,
     OWNER_ID,
+    RAID_JOIN_LIMIT,
     TIGERS,
     WOLVES,
     dispatcher,
@@ -70,7 +72,40 @@ ENUM_FUNC_MAP = {
     sql.Types.VIDEO.value: dispatcher.bot.send_video,
 }
 
-VERIFIED_USER_WAITLIST = {}
+# Seconds a strong-muted member has to press the captcha button
+CAPTCHA_TIMEOUT = 120
+
+# More than RAID_JOIN_LIMIT joins in RAID_WINDOW seconds puts a chat in raid
+# mode until nobody has joined for RAID_COOLDOWN seconds. Joins are then still
+# muted right away but only queued for their welcome, and every
+# RAID_FLUSH_INTERVAL seconds the queued members are announced together in a
+# single summary message.
+RAID_WINDOW = 60
+RAID_COOLDOWN = 120
+RAID_FLUSH_INTERVAL = 30
+RAID_LOCK = threading.Lock()
+RAID_CHATS = {}
+
+MUTE_PERMISSIONS = ChatPermissions(
+    can_send_messages=False,
+    can_invite_users=False,
+    can_pin_messages=False,
+    can_send_polls=False,
+    can_change_info=False,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False,
+)
+SOFT_MUTE_PERMISSIONS = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_invite_users=False,
+    can_pin_messages=False,
+    can_send_polls=False,
+    can_change_info=False,
+    can_add_web_page_previews=False,
+)
 
 
 # do not async
@@ -146,13 +181,224 @@ def send(update, message, keyboard, backup_message):
     return msg
 
 
+def build_welcome(chat, new_mem, cust_welcome):
+    """The chat's welcome text for new_mem, its keyboard and a fallback text."""
+    buttons = sql.get_welc_buttons(chat.id)
+    keyb = build_keyboard(buttons)
+
+    first_name = (
+        new_mem.first_name or "PersonWithNoName"
+    )  # edge case of empty name - occurs for some bugs.
+
+    if cust_welcome:
+        if cust_welcome == sql.DEFAULT_WELCOME:
+            cust_welcome = random.choice(sql.DEFAULT_WELCOME_MESSAGES).format(
+                first=escape_markdown(first_name)
+            )
+
+        if new_mem.last_name:
+            fullname = escape_markdown(f"{first_name} {new_mem.last_name}")
+        else:
+            fullname = escape_markdown(first_name)
+        count = chat.get_member_count()
+        mention = mention_markdown(new_mem.id, escape_markdown(first_name))
+        if new_mem.username:
+            username = "@" + escape_markdown(new_mem.username)
+        else:
+            username = mention
+
+        valid_format = escape_invalid_curly_brackets(
+            cust_welcome, VALID_WELCOME_FORMATTERS
+        )
+        res = valid_format.format(
+            first=escape_markdown(first_name),
+            last=escape_markdown(new_mem.last_name or first_name),
+            fullname=escape_markdown(fullname),
+            username=username,
+            mention=mention,
+            count=count,
+            chatname=escape_markdown(chat.title),
+            id=new_mem.id,
+        )
+
+    else:
+        res = random.choice(sql.DEFAULT_WELCOME_MESSAGES).format(
+            first=escape_markdown(first_name)
+        )
+        keyb = []
+
+    backup_message = random.choice(sql.DEFAULT_WELCOME_MESSAGES).format(
+        first=escape_markdown(first_name)
+    )
+    return res, InlineKeyboardMarkup(keyb), backup_message
+
+
+class JoinBurst:
+    __slots__ = ("joins", "raid_until", "pending", "summary_id")
+
+    def __init__(self):
+        self.joins = deque()
+        self.raid_until = 0
+        # (user_id, first_name, join message id) waiting for the next flush
+        self.pending = []
+        self.summary_id = None
+
+
+def track_joins(chat_id, new_members, message_id):
+    """
+    Record joins and tell whether the chat is in raid mode. Joins made while
+    it is are queued for flush_raids() instead of being welcomed one by one.
+    """
+    if not RAID_JOIN_LIMIT:
+        return False
+
+    now = time.monotonic()
+    with RAID_LOCK:
+        burst = RAID_CHATS.get(chat_id)
+        if burst is None:
+            burst = RAID_CHATS[chat_id] = JoinBurst()
+
+        for new_mem in new_members:
+            burst.joins.append(now)
+        while burst.joins and now - burst.joins[0] > RAID_WINDOW:
+            burst.joins.popleft()
+
+        if burst.raid_until < now and len(burst.joins) <= RAID_JOIN_LIMIT:
+            return False
+
+        burst.raid_until = now + RAID_COOLDOWN
+        for new_mem in new_members:
+            if not new_mem.is_bot:
+                burst.pending.append(
+                    (new_mem.id, new_mem.first_name or "PersonWithNoName", message_id)
+                )
+        return True
+
+
+def raid_mute(bot, chat_id, new_mem, welc_mutes):
+    """Apply the chat's welcome mute to a member who joined during a raid."""
+    if (
+        welc_mutes not in ("soft", "strong")
+        or new_mem.is_bot
+        or new_mem.id in DRAGONS
+        or new_mem.id in DEV_USERS
+        or new_mem.id in WOLVES
+        or new_mem.id in TIGERS
+        or sql.get_human_checks(new_mem.id, chat_id)
+    ):
+        return
+
+    try:
+        if welc_mutes == "soft":
+            bot.restrict_chat_member(
+                chat_id,
+                new_mem.id,
+                permissions=SOFT_MUTE_PERMISSIONS,
+                until_date=(int(time.time() + 24 * 60 * 60)),
+            )
+        else:
+            bot.restrict_chat_member(chat_id, new_mem.id, permissions=MUTE_PERMISSIONS)
+            # message id 0: verified through the shared summary button, which
+            # only shows up at the next flush
+            sql.add_captcha(
+                chat_id,
+                new_mem.id,
+                0,
+                int(time.time()) + RAID_FLUSH_INTERVAL + CAPTCHA_TIMEOUT,
+            )
+    except BadRequest:
+        pass
+
+
+def flush_raids(context: CallbackContext):
+    bot = context.bot
+    now = time.monotonic()
+    with RAID_LOCK:
+        batches = []
+        for chat_id, burst in list(RAID_CHATS.items()):
+            ended = burst.raid_until < now
+            if burst.pending or (ended and burst.summary_id):
+                batches.append((chat_id, burst, burst.pending, ended))
+                burst.pending = []
+            elif ended and (not burst.joins or now - burst.joins[-1] > RAID_WINDOW):
+                del RAID_CHATS[chat_id]
+
+    for chat_id, burst, pending, ended in batches:
+        try:
+            flush_raid(bot, chat_id, burst, pending, ended)
+        except Exception:
+            LOGGER.exception("Could not flush raid joins in %s", chat_id)
+
+
+def flush_raid(bot, chat_id, burst, pending, ended):
+    """Welcome the queued members of a raid by replacing its summary message."""
+    welc_mutes = sql.welcome_mutes(chat_id)
+    if sql.clean_service(chat_id):
+        for _, _, message_id in pending:
+            with suppress(BadRequest):
+                bot.delete_message(chat_id, message_id)
+
+    text = ""
+    if pending:
+        names = ", ".join(
+            mention_html(user_id, html.escape(name))
+            for user_id, name, _ in pending[:20]
+        )
+        if len(pending) > 20:
+            names += f" and {len(pending) - 20} more"
+        text = (
+            f"{len(pending)} members joined in the last {RAID_FLUSH_INTERVAL} "
+            f"seconds, welcome {names}!\n"
+        )
+    if ended:
+        text += "The join burst is over, welcomes are back to normal."
+    else:
+        text += "Lots of people are joining, so I'm not welcoming everyone one by one."
+
+    keyboard = None
+    if welc_mutes == "strong":
+        # earlier batches may still be waiting for the button too
+        text += (
+            f"\n\nNew members are muted, press the button within "
+            f"{CAPTCHA_TIMEOUT} seconds to prove you're human."
+        )
+        keyboard = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        text="Yes, I'm human.", callback_data="user_join_(raid)"
+                    )
+                ]
+            ]
+        )
+    elif welc_mutes == "soft" and pending:
+        text += "\n\nNew members can't send media for 24 hours."
+
+    with suppress(BadRequest):
+        sent = bot.send_message(
+            chat_id, text, parse_mode=ParseMode.HTML, reply_markup=keyboard
+        )
+        if burst.summary_id:
+            with suppress(BadRequest):
+                bot.delete_message(chat_id, burst.summary_id)
+        burst.summary_id = None if ended else sent.message_id
+
+
 @loggable
 def new_member(update: Update, context: CallbackContext):
-    bot, job_queue = context.bot, context.job_queue
+    bot = context.bot
     chat = update.effective_chat
     user = update.effective_user
     msg = update.effective_message
 
+    joined = [m for m in msg.new_chat_members if m.id != bot.id]
+    if track_joins(chat.id, joined, msg.message_id):
+        # only the welcome waits for the next flush, raiders get muted now
+        welc_mutes = sql.welcome_mutes(chat.id)
+        for new_mem in joined:
+            raid_mute(bot, chat.id, new_mem, welc_mutes)
+        return ""
+
     should_welc, cust_welcome, cust_content, welc_type = sql.get_welc_pref(chat.id)
     welc_mutes = sql.welcome_mutes(chat.id)
     human_checks = sql.get_human_checks(user.id, chat.id)
@@ -278,57 +524,12 @@ def new_member(update: Update, context: CallbackContext):
                 continue
 
             else:
-                buttons = sql.get_welc_buttons(chat.id)
-                keyb = build_keyboard(buttons)
-
                 if welc_type not in (sql.Types.TEXT, sql.Types.BUTTON_TEXT):
                     media_wel = True
 
-                first_name = (
-                    new_mem.first_name or "PersonWithNoName"
-                )  # edge case of empty name - occurs for some bugs.
-
-                if cust_welcome:
-                    if cust_welcome == sql.DEFAULT_WELCOME:
-                        cust_welcome = random.choice(
-                            sql.DEFAULT_WELCOME_MESSAGES
-                        ).format(first=escape_markdown(first_name))
-
-                    if new_mem.last_name:
-                        fullname = escape_markdown(f"{first_name} {new_mem.last_name}")
-                    else:
-                        fullname = escape_markdown(first_name)
-                    count = chat.get_member_count()
-                    mention = mention_markdown(new_mem.id, escape_markdown(first_name))
-                    if new_mem.username:
-                        username = "@" + escape_markdown(new_mem.username)
-                    else:
-                        username = mention
-
-                    valid_format = escape_invalid_curly_brackets(
-                        cust_welcome, VALID_WELCOME_FORMATTERS
-                    )
-                    res = valid_format.format(
-                        first=escape_markdown(first_name),
-                        last=escape_markdown(new_mem.last_name or first_name),
-                        fullname=escape_markdown(fullname),
-                        username=username,
-                        mention=mention,
-                        count=count,
-                        chatname=escape_markdown(chat.title),
-                        id=new_mem.id,
-                    )
-
-                else:
-                    res = random.choice(sql.DEFAULT_WELCOME_MESSAGES).format(
-                        first=escape_markdown(first_name)
-                    )
-                    keyb = []
-
-                backup_message = random.choice(sql.DEFAULT_WELCOME_MESSAGES).format(
-                    first=escape_markdown(first_name)
+                res, keyboard, backup_message = build_welcome(
+                    chat, new_mem, cust_welcome
                 )
-                keyboard = InlineKeyboardMarkup(keyb)
 
         else:
             welcome_bool = False
@@ -353,52 +554,14 @@ def new_member(update: Update, context: CallbackContext):
                     bot.restrict_chat_member(
                         chat.id,
                         new_mem.id,
-                        permissions=ChatPermissions(
-                            can_send_messages=True,
-                            can_send_media_messages=False,
-                            can_send_other_messages=False,
-                            can_invite_users=False,
-                            can_pin_messages=False,
-                            can_send_polls=False,
-                            can_change_info=False,
-                            can_add_web_page_previews=False,
-                        ),
+                        permissions=SOFT_MUTE_PERMISSIONS,
                         until_date=(int(time.time() + 24 * 60 * 60)),
                     )
                 if welc_mutes == "strong":
                     welcome_bool = False
-                    if not media_wel:
-                        VERIFIED_USER_WAITLIST.update(
-                            {
-                                new_mem.id: {
-                                    "should_welc": should_welc,
-                                    "media_wel": False,
-                                    "status": False,
-                                    "update": update,
-                                    "res": res,
-                                    "keyboard": keyboard,
-                                    "backup_message": backup_message,
-                                }
-                            }
-                        )
-                    else:
-                        VERIFIED_USER_WAITLIST.update(
-                            {
-                                new_mem.id: {
-                                    "should_welc": should_welc,
-                                    "chat_id": chat.id,
-                                    "status": False,
-                                    "media_wel": True,
-                                    "cust_content": cust_content,
-                                    "welc_type": welc_type,
-                                    "res": res,
-                                    "keyboard": keyboard,
-                                }
-                            }
-                        )
                     new_join_mem = f'<a href="tg://user?id={user.id}">{html.escape(new_mem.first_name)}</a>'
                     message = msg.reply_text(
-                        f"{new_join_mem}, click the button below to prove you're human.\nYou have 120 seconds.",
+                        f"{new_join_mem}, click the button below to prove you're human.\nYou have {CAPTCHA_TIMEOUT} seconds.",
                         reply_markup=InlineKeyboardMarkup(
                             [
                                 {
@@ -415,21 +578,13 @@ def new_member(update: Update, context: CallbackContext):
                     bot.restrict_chat_member(
                         chat.id,
                         new_mem.id,
-                        permissions=ChatPermissions(
-                            can_send_messages=False,
-                            can_invite_users=False,
-                            can_pin_messages=False,
-                            can_send_polls=False,
-                            can_change_info=False,
-                            can_send_media_messages=False,
-                            can_send_other_messages=False,
-                            can_add_web_page_previews=False,
-                        ),
+                        permissions=MUTE_PERMISSIONS,
                     )
-                    job_queue.run_once(
-                        partial(check_not_bot, new_mem, chat.id, message.message_id),
-                        120,
-                        name="welcomemute",
+                    sql.add_captcha(
+                        chat.id,
+                        new_mem.id,
+                        message.message_id,
+                        int(time.time()) + CAPTCHA_TIMEOUT,
                     )
 
         if welcome_bool:
@@ -467,16 +622,20 @@ def new_member(update: Update, context: CallbackContext):
     return ""
 
 
-def check_not_bot(member, chat_id, message_id, context):
+def expire_captchas(context: CallbackContext):
     bot = context.bot
-    member_dict = VERIFIED_USER_WAITLIST.pop(member.id)
-    member_status = member_dict.get("status")
-    if not member_status:
+    for chat_id, user_id in sql.get_expired_captchas(int(time.time())):
+        message_id = sql.pop_captcha(chat_id, user_id)
+        if message_id is None:  # solved in the meantime
+            continue
+
         try:
-            bot.unban_chat_member(chat_id, member.id)
+            bot.unban_chat_member(chat_id, user_id)
         except:
             pass
 
+        if not message_id:  # muted from a raid summary
+            continue
         try:
             bot.edit_message_text(
                 "*kicks user*\nThey can always rejoin and try.",
@@ -909,13 +1068,18 @@ def user_button(update: Update, context: CallbackContext):
     bot = context.bot
     match = re.match(r"user_join_\((.+?)\)", query.data)
     message = update.effective_message
-    join_user = int(match.group(1))
+    # the raid summary button is shared by everyone it muted
+    raid = match.group(1) == "raid"
+    join_user = user.id if raid else int(match.group(1))
 
     if join_user == user.id:
+        if sql.pop_captcha(chat.id, user.id) is None:
+            if raid:
+                query.answer(text="This button isn't for you.")
+                return
+            query.answer(text="This check has expired, rejoin to try again.")
+            return
         sql.set_human_checks(user.id, chat.id)
-        member_dict = VERIFIED_USER_WAITLIST.pop(user.id)
-        member_dict["status"] = True
-        VERIFIED_USER_WAITLIST.update({user.id: member_dict})
         query.answer(text="Yeet! You're a human, unmuted!")
         bot.restrict_chat_member(
             chat.id,
@@ -931,26 +1095,42 @@ def user_button(update: Update, context: CallbackContext):
                 can_add_web_page_previews=True,
             ),
         )
+        if raid:
+            # already welcomed in the summary
+            return
         try:
             bot.deleteMessage(chat.id, message.message_id)
         except:
             pass
-        if member_dict["should_welc"]:
-            if member_dict["media_wel"]:
-                sent = ENUM_FUNC_MAP[member_dict["welc_type"]](
-                    member_dict["chat_id"],
-                    member_dict["cust_content"],
-                    caption=member_dict["res"],
-                    reply_markup=member_dict["keyboard"],
+
+        should_welc, cust_welcome, cust_content, welc_type = sql.get_welc_pref(chat.id)
+        if should_welc:
+            res, keyboard, backup_message = build_welcome(chat, user, cust_welcome)
+            if welc_type not in (sql.Types.TEXT, sql.Types.BUTTON_TEXT):
+                sent = ENUM_FUNC_MAP[welc_type](
+                    chat.id,
+                    cust_content,
+                    caption=res,
+                    reply_markup=keyboard,
                     parse_mode="markdown",
                 )
             else:
-                sent = send(
-                    member_dict["update"],
-                    member_dict["res"],
-                    member_dict["keyboard"],
-                    member_dict["backup_message"],
-                )
+                try:
+                    sent = bot.send_message(
+                        chat.id,
+                        res,
+                        parse_mode=ParseMode.MARKDOWN,
+                        reply_markup=keyboard,
+                    )
+                except BadRequest:
+                    sent = bot.send_message(
+                        chat.id,
+                        markdown_parser(
+                            backup_message + "\nNote: An error occured when sending "
+                            "the custom message. Please update."
+                        ),
+                        parse_mode=ParseMode.MARKDOWN,
+                    )
 
             prev_welc = sql.get_clean_pref(chat.id)
             if prev_welc:
@@ -1112,6 +1292,11 @@ dispatcher.add_handler(WELCOMEMUTE_HANDLER)
 dispatcher.add_handler(CLEAN_SERVICE_HANDLER)
 dispatcher.add_handler(BUTTON_VERIFY_HANDLER)
 dispatcher.add_handler(WELCOME_MUTE_HELP)
+dispatcher.job_queue.run_repeating(expire_captchas, interval=10, first=10)
+if RAID_JOIN_LIMIT:
+    dispatcher.job_queue.run_repeating(
+        flush_raids, interval=RAID_FLUSH_INTERVAL, first=RAID_FLUSH_INTERVAL
+    )
 
 __mod_name__ = "Wᴇʟᴄᴏᴍᴇ"
 __command_list__ = []